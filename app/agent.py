@@ -3,7 +3,7 @@ Agent-specific endpoints for Custom GPT / Actions integration.
 These endpoints have stable schemas and optional API key authentication.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from typing import List, Optional
 from app.models import Track, TrackSearchResult, SearchRequest, ResolveResponse
 from app.config import get_settings
@@ -72,12 +72,10 @@ async def search_music(
     
     Stable endpoint for Custom GPT Actions.
     """
-    from app.search import SearchRanker
-    
     if not catalog:
         raise HTTPException(status_code=503, detail="Catalog not loaded")
     
-    results = SearchRanker.search_tracks(catalog.get_all_tracks(), request)
+    results = catalog.search(request)
     
     logger.info(f"Agent search: query='{request.query}', results={len(results)}")
     
@@ -110,18 +108,23 @@ async def get_track(
 @router.post("/resolve", response_model=ResolveResponse)
 async def resolve_query(
     query: str,
+    budget_ms: Optional[int] = Query(default=None, ge=1, le=60000),
     api_key: Optional[str] = Depends(verify_api_key)
 ):
     """
     Resolve a free-text query to a track.
     
     Tries internal catalog first, then MusicBrainz if needed.
+    With `budget_ms`, answers within that many milliseconds (see ResolveResponse.upgrade_pending).
     Stable endpoint for Custom GPT Actions.
     """
     if not resolver_service:
         raise HTTPException(status_code=503, detail="Resolver service not available")
     
-    result = resolver_service.resolve(query)
+    if budget_ms is not None:
+        result = await resolver_service.aresolve_within(query, budget_ms / 1000.0)
+    else:
+        result = await resolver_service.aresolve(query)
     
     logger.info(f"Agent resolve: query='{query}', source={result.source}, confidence={result.confidence:.2f}")
     
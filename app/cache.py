@@ -1,38 +1,307 @@
 """
 Cache layer for MusicBrainz API results.
-Implements both in-memory LRU cache and optional disk-based JSON cache.
+Implements both in-memory LRU cache and optional disk cache (JSON files or SQLite).
 """
 
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, Hashable, Iterable, List, Tuple, Callable, Awaitable
 from functools import lru_cache
+from collections import OrderedDict
 from pathlib import Path
+import asyncio
 import json
 import hashlib
 import logging
+import threading
+import time
+
+from app.cache_store import CacheStore, StoreEntry, STORE_ERRORS, open_cache_store
 
 logger = logging.getLogger(__name__)
 
 
+# Marker key in a cached value meaning "looked up, no result"
+NEGATIVE = "negative"
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with an optional time-to-live per entry."""
+    
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, maxbytes: Optional[int] = None):
+        """
+        Args:
+            maxsize: Maximum number of entries (0 disables the cache)
+            ttl: Default seconds before an entry expires (None = never)
+            maxbytes: Maximum total of the sizes passed to set() (None = no limit)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, size = entry
+                if expires_at is None or time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._bytes -= size
+            self.misses += 1
+            return None
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, size: int = 0) -> None:
+        """
+        Store a value, evicting the least recently used entries if full.
+        
+        `size` is the value's weight against `maxbytes`; a value larger than
+        the whole budget is not stored.
+        """
+        if self.maxsize <= 0 or (self.maxbytes is not None and size > self.maxbytes):
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+    
+    def delete(self, key: Hashable) -> bool:
+        """Drop one entry. Returns True if it was cached."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self._bytes -= entry[2]
+            return True
+    
+    def clear(self) -> int:
+        """Drop all entries (counters are kept). Returns the number dropped."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            return count
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_cache_status(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        status = {
+            "enabled": self.maxsize > 0,
+            "entries": len(self._entries),
+            "max_entries": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.maxbytes is not None:
+            status["bytes"] = self._bytes
+            status["max_bytes"] = self.maxbytes
+        return status
+
+
+class _Flight:
+    """One in-progress call shared by SingleFlight waiters."""
+    
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one (for threads).
+    
+    The first caller for a key runs the function. Callers that arrive while it
+    runs wait for it and get the same result or exception.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.shared += 1
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    Collapse concurrent awaits with the same key into one (for asyncio tasks).
+    
+    The call runs as its own task, so a cancelled caller doesn't cancel it for
+    the others.
+    """
+    
+    def __init__(self):
+        self._tasks: Dict[Hashable, "asyncio.Task"] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+    
+    def _finish(self, key: Hashable, task: "asyncio.Task") -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
 class MusicBrainzCache:
-    """Cache for MusicBrainz API results with LRU memory and disk persistence."""
+    """
+    Cache for MusicBrainz API results: a bounded in-memory LRU in front of a
+    disk store (JSON files or SQLite, see app.cache_store).
+    
+    Memory hits never touch the disk. Disk hits are promoted into memory.
+    Cached values are shared between callers and must not be modified.
     
-    def __init__(self, cache_dir: str = "data/cache", enable_disk_cache: bool = True):
+    Entries expire per cache type; negative entries ("no result", marked
+    with NEGATIVE) have their own, usually shorter, TTL. An expired entry
+    is still returned by get_entries() as stale for `stale_grace` seconds,
+    so callers can serve it while they refresh it. The disk tier is capped
+    in bytes, with the least recently used entries evicted first. Status is
+    O(1). compact() drops expired entries, picks up other workers' writes
+    and enforces the cap; run_compaction() calls it periodically. Between
+    compactions a write only evicts once this process's running estimate
+    of the disk size passes the cap. Async callers write with aset() and
+    aset_many(), which do the disk work in a worker thread.
+    """
+    
+    def __init__(
+        self,
+        cache_dir: str = "data/cache",
+        enable_disk_cache: bool = True,
+        memory_max_entries: int = 2048,
+        memory_max_bytes: Optional[int] = 32 * 1024 * 1024,
+        ttl_by_type: Optional[Dict[str, Optional[float]]] = None,
+        disk_max_bytes: Optional[int] = None,
+        backend: str = "files",
+        sqlite_path: Optional[str] = None,
+        negative_ttl: Optional[float] = None,
+        stale_grace: Optional[float] = None
+    ):
+        """
+        Args:
+            cache_dir: Directory for cache files
+            enable_disk_cache: Persist entries on disk
+            memory_max_entries: Entries kept in memory (0 disables the memory tier)
+            memory_max_bytes: Serialized size of the entries kept in memory (None = no limit)
+            ttl_by_type: Seconds before an entry of each cache type expires
+                (missing type or None = never)
+            disk_max_bytes: Total size of the disk tier (None = no limit)
+            backend: Disk store, 'files' (one JSON file per key) or 'sqlite'
+            sqlite_path: SQLite database (default: <cache_dir>/musicbrainz.sqlite3)
+            negative_ttl: Seconds before a negative entry expires (None = the cache type's TTL)
+            stale_grace: Seconds an expired entry can still be served as stale (None = not at all)
+        
+        Raises:
+            ValueError: If the backend is unknown
+        """
         self.cache_dir = Path(cache_dir)
         self.enable_disk_cache = enable_disk_cache
+        self.ttl_by_type = dict(ttl_by_type or {})
+        self.disk_max_bytes = disk_max_bytes
+        self.negative_ttl = negative_ttl
+        self.stale_grace = stale_grace
+        # Values are (data, fresh_until); entries stay in memory through the stale grace
+        self.memory = LRUCache(maxsize=memory_max_entries, maxbytes=memory_max_bytes)
+        self.store: Optional[CacheStore] = None
+        
+        # Disk tier counters
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_errors = 0
+        self.disk_writes = 0
+        self.disk_expirations = 0
+        self.disk_evictions = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.compactions = 0
+        self.last_compaction: Optional[Dict[str, Any]] = None
+        # Disk size as of the last compaction or eviction, plus this process's writes since
+        self._disk_bytes = 0
         
         if self.enable_disk_cache:
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
-            logger.info(f"MusicBrainz cache initialized at {self.cache_dir}")
+            self.store = open_cache_store(backend, cache_dir, sqlite_path)
+            self.compact()
+            logger.info(
+                f"MusicBrainz cache initialized at {self.cache_dir} ({self.store.name} store, "
+                f"{self.store.count()} entries, {self.store.size_bytes()} bytes)"
+            )
     
     def _get_cache_key(self, query: str, cache_type: str = "query") -> str:
         """Generate cache key from query string."""
         # Use hash to create filesystem-safe key
         hash_obj = hashlib.md5(query.encode('utf-8'))
-        return f"{cache_type}_{hash_obj.hexdigest()}.json"
+        return f"{cache_type}_{hash_obj.hexdigest()}"
+    
+    def _ttl(self, cache_type: str, data: Dict[str, Any]) -> Optional[float]:
+        if data.get(NEGATIVE) and self.negative_ttl is not None:
+            return self.negative_ttl
+        return self.ttl_by_type.get(cache_type)
     
-    def _get_cache_path(self, cache_key: str) -> Path:
-        """Get full path to cache file."""
-        return self.cache_dir / cache_key
+    def _memory_ttl(self, fresh_until: Optional[float], now: float) -> Optional[float]:
+        """Seconds to keep an entry in memory: until it's fresh, plus the stale grace."""
+        if fresh_until is None:
+            return None
+        return fresh_until + (self.stale_grace or 0.0) - now
     
     def get(self, query: str, cache_type: str = "query") -> Optional[Dict[str, Any]]:
         """
@@ -43,28 +312,92 @@ class MusicBrainzCache:
             cache_type: Type of cache ('query' or 'mbid')
         
         Returns:
-            Cached data dict or None if not found
+            Cached data dict or None if not found or expired
         """
-        if not self.enable_disk_cache:
-            return None
+        return self.get_many([query], cache_type).get(query)
+    
+    def get_entry(self, query: str, cache_type: str = "query") -> Optional[Tuple[Dict[str, Any], bool]]:
+        """Return (data, stale) for a cached query, including entries within the stale grace."""
+        return self.get_entries([query], cache_type).get(query)
+    
+    def get_many(self, queries: Iterable[str], cache_type: str = "query") -> Dict[str, Dict[str, Any]]:
+        """
+        Retrieve cached results for several queries with one disk round trip.
         
-        cache_key = self._get_cache_key(query, cache_type)
-        cache_path = self._get_cache_path(cache_key)
+        Returns:
+            {query: data} for the queries that are cached and not expired
+        """
+        return {
+            query: data
+            for query, (data, stale) in self.get_entries(queries, cache_type).items()
+            if not stale
+        }
+    
+    def get_entries(self, queries: Iterable[str], cache_type: str = "query") -> Dict[str, Tuple[Dict[str, Any], bool]]:
+        """
+        Like get_many, but also return entries that expired within the stale grace.
         
-        if cache_path.exists():
+        Returns:
+            {query: (data, stale)}
+        """
+        now = time.time()
+        found: Dict[str, Tuple[Dict[str, Any], bool]] = {}
+        missing: Dict[str, str] = {}
+        for query in queries:
+            cache_key = self._get_cache_key(query, cache_type)
+            entry = self.memory.get(cache_key)
+            if entry is not None:
+                if self.store is not None:
+                    # Keep the disk tier's LRU order in step (no disk access for the file store)
+                    self.store.touch(cache_key)
+                data, fresh_until = entry
+                found[query] = (data, fresh_until is not None and now >= fresh_until)
+            else:
+                missing[cache_key] = query
+        
+        if missing and self.store is not None:
             try:
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    logger.debug(f"Cache HIT for {cache_type}: {query}")
-                    return data
-            except (json.JSONDecodeError, IOError) as e:
-                logger.warning(f"Failed to read cache file {cache_path}: {e}")
-                return None
+                entries = self.store.read_many(missing)
+            except STORE_ERRORS as e:
+                self.disk_errors += 1
+                logger.warning(f"Failed to read {cache_type} cache entries: {e}")
+                entries = {}
+            
+            expired = []
+            for cache_key, query in missing.items():
+                entry = entries.get(cache_key)
+                if entry is None:
+                    self.disk_misses += 1
+                    continue
+                raw, written_at = entry
+                try:
+                    data = json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    self.disk_errors += 1
+                    logger.warning(f"Failed to decode cache entry {cache_key}: {e}")
+                    continue
+                ttl = self._ttl(cache_type, data)
+                fresh_until = written_at + ttl if ttl is not None else None
+                keep_for = self._memory_ttl(fresh_until, now)
+                if keep_for is not None and keep_for <= 0:
+                    self.disk_misses += 1
+                    expired.append(cache_key)
+                    continue
+                self.disk_hits += 1
+                self.memory.set(cache_key, (data, fresh_until), ttl=keep_for, size=len(raw))
+                found[query] = (data, fresh_until is not None and now >= fresh_until)
+            
+            if expired:
+                self.disk_expirations += len(expired)
+                self._delete(expired)
+            logger.debug(f"Cache lookup for {len(missing)} {cache_type} keys: {len(missing) - len(expired)} on disk")
         
-        logger.debug(f"Cache MISS for {cache_type}: {query}")
-        return None
+        for data, stale in found.values():
+            self.stale_hits += stale
+            self.negative_hits += bool(data.get(NEGATIVE))
+        return found
     
-    def set(self, query: str, data: Dict[str, Any], cache_type: str = "query") -> None:
+    def set(self, query: str, data: Dict[str, Any], cache_type: str = "query", negative: bool = False) -> None:
         """
         Store result in cache.
         
@@ -72,56 +405,176 @@ class MusicBrainzCache:
             query: The query string (or MBID)
             data: Data to cache
             cache_type: Type of cache ('query' or 'mbid')
+            negative: Mark the entry as "no result" (expires after negative_ttl)
         """
-        if not self.enable_disk_cache:
+        self.set_many({query: data}, cache_type, negative=negative)
+    
+    def set_many(self, items: Dict[str, Dict[str, Any]], cache_type: str = "query", negative: bool = False) -> None:
+        """Store several results with one disk write (a single transaction for SQLite)."""
+        self._write(self._remember(items, cache_type, negative), cache_type)
+    
+    async def aset(self, query: str, data: Dict[str, Any], cache_type: str = "query", negative: bool = False) -> None:
+        """Async version of set (the disk write doesn't block the event loop)."""
+        await self.aset_many({query: data}, cache_type, negative=negative)
+    
+    async def aset_many(self, items: Dict[str, Dict[str, Any]], cache_type: str = "query", negative: bool = False) -> None:
+        """Async version of set_many: the memory tier is updated at once, the disk write runs in a thread."""
+        entries = self._remember(items, cache_type, negative)
+        if self.store is not None and entries:
+            await asyncio.to_thread(self._write, entries, cache_type)
+    
+    def _remember(self, items: Dict[str, Dict[str, Any]], cache_type: str, negative: bool) -> List[StoreEntry]:
+        """Put items in the memory tier and return their serialized store entries."""
+        now = time.time()
+        entries = []
+        for query, data in items.items():
+            if negative:
+                data = {**data, NEGATIVE: True}
+            cache_key = self._get_cache_key(query, cache_type)
+            payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+            ttl = self._ttl(cache_type, data)
+            fresh_until = now + ttl if ttl is not None else None
+            self.memory.set(cache_key, (data, fresh_until), ttl=self._memory_ttl(fresh_until, now), size=len(payload))
+            entries.append((cache_key, payload, now))
+        return entries
+    
+    def _write(self, entries: List[StoreEntry], cache_type: str) -> None:
+        if self.store is None or not entries:
             return
         
-        cache_key = self._get_cache_key(query, cache_type)
-        cache_path = self._get_cache_path(cache_key)
+        try:
+            self.store.write_many(entries)
+        except STORE_ERRORS as e:
+            self.disk_errors += 1
+            logger.warning(f"Failed to write {cache_type} cache entries: {e}")
+            return
+        self.disk_writes += len(entries)
+        logger.debug(f"Cached {len(entries)} {cache_type} entries")
         
+        # Overwrites are counted in full, so the estimate errs towards evicting early
+        self._disk_bytes += sum(len(payload) for _, payload, _ in entries)
+        if self.disk_max_bytes is not None and self._disk_bytes > self.disk_max_bytes:
+            self._evict()
+    
+    def _delete(self, cache_keys: List[str]) -> None:
+        for cache_key in cache_keys:
+            self.memory.delete(cache_key)
         try:
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-                logger.debug(f"Cached {cache_type}: {query}")
-        except IOError as e:
-            logger.warning(f"Failed to write cache file {cache_path}: {e}")
+            self.store.delete(cache_keys)
+        except STORE_ERRORS as e:
+            self.disk_errors += 1
+            logger.warning(f"Failed to delete cache entries: {e}")
     
-    def clear(self) -> int:
+    def _evict(self) -> None:
+        """Evict least recently used disk entries until the disk tier fits its cap."""
+        try:
+            self.disk_evictions += self.store.evict(self.disk_max_bytes)
+            self._disk_bytes = self.store.size_bytes()
+        except STORE_ERRORS as e:
+            self.disk_errors += 1
+            logger.warning(f"Failed to evict cache entries: {e}")
+    
+    def compact(self) -> Dict[str, Any]:
         """
-        Clear all cache files.
+        Delete expired disk entries, reconcile with other workers' writes and
+        enforce the size cap.
         
         Returns:
-            Number of files deleted
+            Summary of the pass (entries scanned, expired, evicted, duration)
         """
-        if not self.enable_disk_cache or not self.cache_dir.exists():
-            return 0
+        if self.store is None:
+            return {}
+        started = time.perf_counter()
+        # Keep entries that may still be served as stale
+        grace = self.stale_grace or 0.0
+        ttl_by_type = {
+            cache_type: ttl + grace if ttl is not None else None
+            for cache_type, ttl in self.ttl_by_type.items()
+        }
+        summary = self.store.compact(ttl_by_type, self.disk_max_bytes)
+        self._disk_bytes = self.store.size_bytes()
+        self.disk_expirations += summary["expired"]
+        self.disk_evictions += summary["evicted"]
         
-        count = 0
-        for cache_file in self.cache_dir.glob("*.json"):
+        self.compactions += 1
+        self.last_compaction = {
+            **summary,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "finished_at": time.time(),
+        }
+        if summary["expired"] or summary["evicted"]:
+            logger.info(
+                f"MusicBrainz cache compaction removed {summary['expired']} expired "
+                f"and {summary['evicted']} evicted entries"
+            )
+        return self.last_compaction
+    
+    async def run_compaction(self, interval: float) -> None:
+        """Compact the disk tier every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
             try:
-                cache_file.unlink()
-                count += 1
-            except IOError as e:
-                logger.warning(f"Failed to delete cache file {cache_file}: {e}")
+                await asyncio.to_thread(self.compact)
+            except Exception as e:
+                logger.error(f"MusicBrainz cache compaction failed: {e}")
+    
+    def clear(self) -> int:
+        """
+        Clear all cache entries (both tiers).
         
-        logger.info(f"Cleared {count} cache files")
+        Returns:
+            Number of disk entries deleted
+        """
+        self.memory.clear()
+        if self.store is None:
+            return 0
+        
+        count = self.store.clear()
+        self._disk_bytes = 0
+        logger.info(f"Cleared {count} cache entries")
         return count
     
+    def close(self) -> None:
+        """Release the disk store (database connections)."""
+        if self.store is not None:
+            self.store.close()
+    
     def get_cache_status(self) -> Dict[str, Any]:
-        """Get cache statistics."""
-        if not self.enable_disk_cache or not self.cache_dir.exists():
+        """Get cache statistics, with hit/miss/eviction counters per tier (O(1))."""
+        memory = self.memory.get_cache_status()
+        disk = {
+            "hits": self.disk_hits,
+            "misses": self.disk_misses,
+            "errors": self.disk_errors,
+            "writes": self.disk_writes,
+            "expirations": self.disk_expirations,
+            "evictions": self.disk_evictions,
+            "max_bytes": self.disk_max_bytes,
+            "ttl_seconds": self.ttl_by_type,
+            "negative_ttl_seconds": self.negative_ttl,
+            "stale_grace_seconds": self.stale_grace,
+            "compactions": self.compactions,
+            "last_compaction": self.last_compaction,
+        }
+        if self.store is None:
             return {
                 "enabled": False,
                 "file_count": 0,
-                "size_bytes": 0
+                "size_bytes": 0,
+                "stale_hits": self.stale_hits,
+                "negative_hits": self.negative_hits,
+                "memory": memory,
+                "disk": disk
             }
         
-        cache_files = list(self.cache_dir.glob("*.json"))
-        total_size = sum(f.stat().st_size for f in cache_files)
-        
         return {
             "enabled": True,
-            "file_count": len(cache_files),
-            "size_bytes": total_size,
-            "cache_dir": str(self.cache_dir)
+            "backend": self.store.name,
+            "file_count": self.store.count(),
+            "size_bytes": self.store.size_bytes(),
+            **self.store.get_status(),
+            "stale_hits": self.stale_hits,
+            "negative_hits": self.negative_hits,
+            "memory": memory,
+            "disk": disk
         }
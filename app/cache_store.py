@@ -0,0 +1,590 @@
+"""
+Storage backends for the MusicBrainz disk cache.
+
+MusicBrainzCache keeps its memory tier, TTLs and counters itself and
+hands serialized entries to a CacheStore:
+
+- JSONFileStore ("files"): one JSON file per key, the original layout.
+  Writes go to a temporary file that is renamed into place, so readers
+  never see a torn file.
+- SQLiteStore ("sqlite"): a single SQLite database in WAL mode. Readers
+  don't block the writer, every write is a transaction, and entry count
+  and total size are kept by triggers, so status stays O(1) across
+  workers.
+
+Keys look like "query_<md5>" (the prefix is the cache type). Every store
+records when an entry was written (for TTLs) and when it was last used
+(for LRU eviction).
+
+Import an existing file cache into SQLite, or compare the two layouts:
+
+    python -m app.cache_store migrate [--from data/cache] [--to data/cache/musicbrainz.sqlite3]
+    python -m app.cache_store bench [--entries 5000]
+"""
+
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Errors a store may raise on a read or write
+STORE_ERRORS = (OSError, sqlite3.Error)
+
+# (key, serialized value, written_at)
+StoreEntry = Tuple[str, bytes, float]
+
+
+def cache_type_of(key: str) -> str:
+    """Cache type of a store key ("query_<md5>" -> "query")."""
+    return key.split('_', 1)[0]
+
+
+class CacheStore(ABC):
+    """Interface for the MusicBrainz disk cache storage."""
+    
+    name = "base"
+    
+    @abstractmethod
+    def read_many(self, keys: Iterable[str]) -> Dict[str, Tuple[bytes, float]]:
+        """Return {key: (serialized value, written_at)} for the keys present, marking them used."""
+    
+    def read(self, key: str) -> Optional[Tuple[bytes, float]]:
+        return self.read_many([key]).get(key)
+    
+    @abstractmethod
+    def write_many(self, entries: List[StoreEntry]) -> None:
+        """Store entries, replacing existing ones."""
+    
+    @abstractmethod
+    def delete(self, keys: Iterable[str]) -> None:
+        """Delete entries (missing keys are ignored)."""
+    
+    def touch(self, key: str) -> None:
+        """Mark a key used without reading it (a memory-tier hit). Optional."""
+    
+    @abstractmethod
+    def evict(self, max_bytes: int) -> int:
+        """Delete least recently used entries until the total fits. Returns the number evicted."""
+    
+    @abstractmethod
+    def compact(self, ttl_by_type: Dict[str, Optional[float]], max_bytes: Optional[int]) -> Dict[str, int]:
+        """Delete expired entries and enforce the size cap. Returns scanned/expired/evicted counts."""
+    
+    @abstractmethod
+    def clear(self) -> int:
+        """Delete every entry. Returns the number deleted."""
+    
+    @abstractmethod
+    def count(self) -> int:
+        """Number of entries."""
+    
+    @abstractmethod
+    def size_bytes(self) -> int:
+        """Total size of the serialized entries."""
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Backend-specific status fields."""
+        return {}
+    
+    def close(self) -> None:
+        pass
+
+
+class JSONFileStore(CacheStore):
+    """
+    One JSON file per key. A file's mtime is its write time.
+    
+    File sizes and use order are kept in an in-process index (least
+    recently used first) that compact() reconciles with the directory.
+    """
+    
+    name = "files"
+    
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._bytes = 0
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+    
+    def _record(self, key: str, size: int, written_at: float) -> None:
+        """Record a file as most recently used."""
+        with self._lock:
+            previous = self._files.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._files[key] = (size, written_at)
+            self._bytes += size
+    
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            previous = self._files.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+    
+    def read_many(self, keys: Iterable[str]) -> Dict[str, Tuple[bytes, float]]:
+        found = {}
+        for key in keys:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    written_at = os.fstat(f.fileno()).st_mtime
+                    raw = f.read()
+            except FileNotFoundError:
+                self._forget(key)
+                continue
+            self._record(key, len(raw), written_at)
+            found[key] = (raw, written_at)
+        return found
+    
+    def write_many(self, entries: List[StoreEntry]) -> None:
+        for key, raw, written_at in entries:
+            path = self._path(key)
+            # Write aside and rename, so concurrent readers and writers never see a partial file
+            temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(raw)
+                if abs(time.time() - written_at) > 1.0:
+                    os.utime(temp_path, (written_at, written_at))
+                os.replace(temp_path, path)
+            except OSError:
+                temp_path.unlink(missing_ok=True)
+                raise
+            self._record(key, len(raw), written_at)
+    
+    def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._forget(key)
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+    
+    def touch(self, key: str) -> None:
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+    
+    def evict(self, max_bytes: int) -> int:
+        victims = []
+        with self._lock:
+            while self._files and self._bytes > max_bytes:
+                key, (size, _) = self._files.popitem(last=False)
+                self._bytes -= size
+                victims.append(key)
+        self.delete(victims)
+        return len(victims)
+    
+    def compact(self, ttl_by_type: Dict[str, Optional[float]], max_bytes: Optional[int]) -> Dict[str, int]:
+        scan_started = time.time()
+        
+        # Scan without holding the lock; reads and writes continue meanwhile
+        found: Dict[str, Tuple[int, float]] = {}
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json') or entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found[entry.name[:-len('.json')]] = (stat.st_size, stat.st_mtime)
+        
+        now = time.time()
+        expired = []
+        with self._lock:
+            # Files deleted elsewhere (and not rewritten since the scan began)
+            for key in [key for key, (_, written_at) in self._files.items()
+                        if key not in found and written_at < scan_started]:
+                self._bytes -= self._files.pop(key)[0]
+            # Files written elsewhere; their mtime approximates their last use.
+            # Known files keep their place but take the size and mtime on disk.
+            for key, (size, written_at) in sorted(found.items(), key=lambda item: item[1][1]):
+                previous = self._files.get(key)
+                self._files[key] = (size, written_at)
+                if previous is None:
+                    self._files.move_to_end(key, last=False)
+                    self._bytes += size
+                else:
+                    self._bytes += size - previous[0]
+            for key, (_, written_at) in self._files.items():
+                ttl = ttl_by_type.get(cache_type_of(key))
+                if ttl is not None and now - written_at >= ttl:
+                    expired.append(key)
+        
+        self.delete(expired)
+        evicted = self.evict(max_bytes) if max_bytes is not None else 0
+        return {"scanned": len(found), "expired": len(expired), "evicted": evicted}
+    
+    def clear(self) -> int:
+        count = 0
+        for cache_file in self.cache_dir.glob("*.json"):
+            try:
+                cache_file.unlink()
+                count += 1
+            except OSError as e:
+                logger.warning(f"Failed to delete cache file {cache_file}: {e}")
+        with self._lock:
+            self._files.clear()
+            self._bytes = 0
+        return count
+    
+    def count(self) -> int:
+        return len(self._files)
+    
+    def size_bytes(self) -> int:
+        return self._bytes
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {"cache_dir": str(self.cache_dir)}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    written_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, entries, bytes) VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0;
+END;
+"""
+
+_UPSERT = """
+INSERT INTO entries (key, value, size, written_at, used_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, size = excluded.size, written_at = excluded.written_at, used_at = excluded.used_at
+"""
+
+
+class SQLiteStore(CacheStore):
+    """
+    Single-file SQLite store in WAL mode, shared safely by threads and worker processes.
+    
+    Each thread has its own connection. Memory-tier hits don't update the
+    use time (that would be a write per hit), so LRU order reflects disk reads
+    and writes, to within USE_RESOLUTION seconds.
+    """
+    
+    name = "sqlite"
+    
+    # Seconds of LRU precision; a read only records a use older than this
+    USE_RESOLUTION = 60.0
+    
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: Database file (created if missing)
+            busy_timeout: Seconds to wait for another writer's lock
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+    
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; batches open their own transactions
+            conn = sqlite3.connect(
+                str(self.path), timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def read_many(self, keys: Iterable[str]) -> Dict[str, Tuple[bytes, float]]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        conn = self._conn()
+        found = {}
+        # Refresh use times at most once a minute per entry, so most reads don't write
+        now = time.time()
+        stale_before = now - self.USE_RESOLUTION
+        used = []
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, value, written_at, used_at in conn.execute(
+                f"SELECT key, value, written_at, used_at FROM entries WHERE key IN ({placeholders})", chunk
+            ):
+                found[key] = (bytes(value), written_at)
+                if used_at < stale_before:
+                    used.append(key)
+        if used:
+            placeholders = ",".join("?" * len(used))
+            # Reads are reached from the event loop; never wait on another
+            # writer's lock just to record a use
+            conn.execute("PRAGMA busy_timeout = 0")
+            try:
+                conn.execute(f"UPDATE entries SET used_at = ? WHERE key IN ({placeholders})", [now, *used])
+            except sqlite3.OperationalError as e:
+                # Another writer holds the lock; the read still counts
+                logger.debug(f"Skipped cache use-time update: {e}")
+            finally:
+                conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        return found
+    
+    def write_many(self, entries: List[StoreEntry]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_UPSERT, [(key, raw, len(raw), written_at, now) for key, raw, written_at in entries])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if keys:
+            self._conn().executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+    
+    def _totals(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        return conn.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+    
+    def evict(self, max_bytes: int) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            excess = self._totals(conn)[1] - max_bytes
+            victims = []
+            if excess > 0:
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY used_at"):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(victims)
+    
+    def compact(self, ttl_by_type: Dict[str, Optional[float]], max_bytes: Optional[int]) -> Dict[str, int]:
+        conn = self._conn()
+        scanned = self.count()
+        now = time.time()
+        expired = 0
+        for cache_type, ttl in ttl_by_type.items():
+            if ttl is None:
+                continue
+            # Key range for the type's prefix (uses the primary key index)
+            prefix = f"{cache_type}_"
+            cursor = conn.execute(
+                "DELETE FROM entries WHERE key >= ? AND key < ? AND written_at <= ?",
+                (prefix, prefix[:-1] + chr(ord('_') + 1), now - ttl)
+            )
+            expired += cursor.rowcount
+        evicted = self.evict(max_bytes) if max_bytes is not None else 0
+        # Fold the WAL back into the database so it doesn't grow between checkpoints
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return {"scanned": scanned, "expired": expired, "evicted": evicted}
+    
+    def clear(self) -> int:
+        return self._conn().execute("DELETE FROM entries").rowcount
+    
+    def count(self) -> int:
+        return self._totals(self._conn())[0]
+    
+    def size_bytes(self) -> int:
+        return self._totals(self._conn())[1]
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {"path": str(self.path)}
+    
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def open_cache_store(backend: str, cache_dir: str, sqlite_path: Optional[str] = None) -> CacheStore:
+    """
+    Create the store for a backend name.
+    
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if backend == JSONFileStore.name:
+        return JSONFileStore(cache_dir)
+    if backend == SQLiteStore.name:
+        return SQLiteStore(sqlite_path or str(Path(cache_dir) / "musicbrainz.sqlite3"))
+    raise ValueError(f"Unknown cache backend {backend!r} (expected 'files' or 'sqlite')")
+
+
+def migrate_files(cache_dir: str, target: CacheStore, batch_size: int = 500, remove: bool = False) -> Dict[str, int]:
+    """
+    Import a file-per-key cache directory into another store, keeping write times.
+    
+    Args:
+        cache_dir: Directory of <key>.json files
+        target: Store to import into
+        batch_size: Entries written per transaction
+        remove: Delete each file once imported
+    
+    Returns:
+        Counts of imported and skipped (unreadable or invalid JSON) files
+    """
+    imported = skipped = 0
+    batch: List[StoreEntry] = []
+    paths: List[Path] = []
+    
+    def flush():
+        nonlocal imported
+        target.write_many(batch)
+        imported += len(batch)
+        if remove:
+            for path in paths:
+                path.unlink(missing_ok=True)
+        batch.clear()
+        paths.clear()
+    
+    for path in sorted(Path(cache_dir).glob("*.json")):
+        try:
+            raw = path.read_bytes()
+            json.loads(raw)
+            written_at = path.stat().st_mtime
+        except (OSError, ValueError) as e:
+            skipped += 1
+            logger.warning(f"Skipping cache file {path}: {e}")
+            continue
+        batch.append((path.name[:-len('.json')], raw, written_at))
+        paths.append(path)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    
+    logger.info(f"Imported {imported} cache files from {cache_dir} ({skipped} skipped)")
+    return {"imported": imported, "skipped": skipped}
+
+
+def benchmark(entries: int = 5000, batch_size: int = 100) -> Dict[str, Dict[str, float]]:
+    """
+    Time the cache (memory tier off) on each backend in a temporary directory.
+    
+    Returns:
+        {backend: {"set_per_second": ..., "get_per_second": ..., "get_many_per_second": ..., "compact_seconds": ...}}
+    """
+    from app.cache import MusicBrainzCache
+    
+    payload = {'recordings': [{'id': f'mbid-{i}', 'title': f'Recording {i}', 'ext:score': '90'} for i in range(5)]}
+    queries = [f"query {i}::5" for i in range(entries)]
+    results: Dict[str, Dict[str, float]] = {}
+    
+    for backend in (JSONFileStore.name, SQLiteStore.name):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = MusicBrainzCache(cache_dir=cache_dir, memory_max_entries=0, backend=backend)
+            timings = {}
+            
+            started = time.perf_counter()
+            for query in queries:
+                cache.set(query, payload)
+            timings["set"] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            for query in queries:
+                cache.get(query)
+            timings["get"] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            for start in range(0, entries, batch_size):
+                cache.get_many(queries[start:start + batch_size])
+            timings["get_many"] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            cache.compact()
+            timings["compact"] = time.perf_counter() - started
+            
+            results[backend] = {
+                f"{operation}_per_second": round(entries / seconds, 1)
+                for operation, seconds in timings.items() if operation != "compact"
+            }
+            results[backend]["compact_seconds"] = round(timings["compact"], 4)
+            cache.close()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Migrate a file cache into SQLite, or benchmark the backends."""
+    from app.config import get_settings
+    
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="MusicBrainz cache storage tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    migrate = commands.add_parser("migrate", help="Import JSON cache files into the SQLite store")
+    migrate.add_argument("--from", dest="source", default=settings.cache_dir, help="Directory of JSON cache files")
+    migrate.add_argument("--to", dest="target", default=settings.cache_sqlite_path or None,
+                         help="SQLite database (default: <cache dir>/musicbrainz.sqlite3)")
+    migrate.add_argument("--remove", action="store_true", help="Delete the JSON files once imported")
+    
+    bench = commands.add_parser("bench", help="Compare the file-per-key and SQLite layouts")
+    bench.add_argument("--entries", type=int, default=5000, help="Entries written and read")
+    bench.add_argument("--batch-size", type=int, default=100, help="Keys per get_many call")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format=settings.log_format)
+    if args.command == "migrate":
+        store = open_cache_store(SQLiteStore.name, args.source, args.target)
+        try:
+            summary = migrate_files(args.source, store, remove=args.remove)
+            summary["entries"] = store.count()
+            summary["size_bytes"] = store.size_bytes()
+        finally:
+            store.close()
+        print(json.dumps(summary, indent=2))
+        return 1 if summary["skipped"] else 0
+    
+    print(json.dumps(benchmark(args.entries, args.batch_size), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,100 +1,231 @@
-import csv
 from pathlib import Path
-from typing import List, Optional, Dict
-from app.models import Track, ClearanceStatus
+from typing import Optional, Sequence, Mapping, List
+import os
+import threading
+import time
+from app.models import Track, IngestReport, CatalogDiff, SearchRequest, TrackSearchResult
+from app.ingest import CatalogIngest
+from app.index import CatalogIndex
+from app.search import SearchRanker, SearchResultCache
+from app.snapshot import read_snapshot
+from app.mmap_store import open_store, MappedTrackList, MappedTrackIndex
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class CatalogGeneration:
+    """
+    One build of the catalog: tracks, id lookup and search index (read-only once published).
+    
+    A reload builds a new generation next to the current one and swaps it in
+    with a single assignment, so a reader that takes `catalog.current` once
+    sees a consistent catalog for the whole request.
+    """
+    
+    __slots__ = (
+        'number', 'tracks', 'tracks_by_id', 'index', 'ingest_report', 'diff', 'loaded_at',
+        'source_size', 'source_mtime_ns', 'source_checksum'
+    )
+    
+    def __init__(
+        self,
+        number: int,
+        tracks: Sequence[Track],
+        tracks_by_id: Mapping[str, Track],
+        index: CatalogIndex,
+        ingest_report: Optional[IngestReport] = None,
+        diff: Optional[CatalogDiff] = None
+    ):
+        self.number = number
+        self.tracks = tracks
+        self.tracks_by_id = tracks_by_id
+        self.index = index
+        # Report for the CSV ingest (None when loaded from a snapshot or an existing store)
+        self.ingest_report = ingest_report
+        # Changes from the previous generation (None for the first load)
+        self.diff = diff
+        self.loaded_at = time.time()
+        # Identity of the source CSV; the checksum is the same in every worker that
+        # loaded the same contents (set by the MusicCatalog loaders)
+        self.source_size = 0
+        self.source_mtime_ns = 0
+        self.source_checksum = ""
+
+
+def diff_catalogs(old: Mapping[str, Track], new: Mapping[str, Track]) -> CatalogDiff:
+    """Compare two catalogs by buffet_track_id."""
+    added = changed = unchanged = 0
+    for track_id, track in new.items():
+        previous = old.get(track_id)
+        if previous is None:
+            added += 1
+        elif previous == track:
+            unchanged += 1
+        else:
+            changed += 1
+    removed = sum(1 for track_id in old if track_id not in new)
+    return CatalogDiff(added=added, removed=removed, changed=changed, unchanged=unchanged)
+
+
 class MusicCatalog:
     """Manager for the internal music catalog."""
     
-    def __init__(self, csv_path: str):
+    def __init__(
+        self,
+        csv_path: str,
+        search_backend: str = "python",
+        search_cache_size: int = 1024,
+        search_cache_ttl: float = 300.0,
+        snapshot_path: Optional[str] = None,
+        mmap_path: Optional[str] = None,
+        ingest_batch_size: int = 5000
+    ):
         self.csv_path = csv_path
-        self.tracks: List[Track] = []
-        self.tracks_by_id: Dict[str, Track] = {}  # Now keyed by buffet_track_id (string)
+        # Optional binary snapshot (see app.snapshot) tried before parsing the CSV
+        self.snapshot_path = snapshot_path
+        # Optional shared memory-mapped store (see app.mmap_store); takes precedence over the snapshot
+        self.mmap_path = mmap_path
+        self.search_backend = search_backend
+        # Rows converted and validated together when streaming the CSV (see app.ingest)
+        self.ingest_batch_size = ingest_batch_size
+        # Ranked search results, keyed by index generation (see SearchResultCache)
+        self.search_cache = SearchResultCache(maxsize=search_cache_size, ttl=search_cache_ttl)
+        # Serializes reloads; readers never take it
+        self._reload_lock = threading.Lock()
+        self.current = CatalogGeneration(0, [], {}, CatalogIndex([]))
         self.load_catalog()
     
-    def load_catalog(self):
-        """Load tracks from CSV file with support for both old and new schema."""
+    # Views of the current generation (take `current` once to read several consistently)
+    
+    @property
+    def tracks(self) -> Sequence[Track]:
+        return self.current.tracks
+    
+    @property
+    def tracks_by_id(self) -> Mapping[str, Track]:
+        return self.current.tracks_by_id  # Keyed by buffet_track_id (string)
+    
+    @property
+    def index(self) -> CatalogIndex:
+        return self.current.index
+    
+    @property
+    def ingest_report(self) -> Optional[IngestReport]:
+        return self.current.ingest_report
+    
+    def load_catalog(self) -> CatalogGeneration:
+        """
+        Load tracks from CSV file with support for both old and new schema.
+        
+        The new generation is built while the current one keeps serving, then
+        swapped in atomically. Tracks that are unchanged since the current
+        generation reuse their index features. Rows that fail validation are
+        skipped and listed in `ingest_report`.
+        
+        Safe to call from a worker thread (e.g. asyncio.to_thread).
+        """
         catalog_file = Path(self.csv_path)
         
         if not catalog_file.exists():
             raise FileNotFoundError(f"Catalog file not found: {self.csv_path}")
         
-        self.tracks = []
-        self.tracks_by_id = {}
+        with self._reload_lock:
+            previous = self.current
+            # Taken before reading: if the file changes mid-load, the next check sees a new stat
+            source = os.stat(self.csv_path)
+            
+            generation = None
+            if self.mmap_path:
+                generation = self._load_mapped(previous)
+            elif self.snapshot_path:
+                generation = self._load_snapshot(previous)
+            if generation is None:
+                generation = self._load_csv(previous)
+            
+            generation.source_size = source.st_size
+            generation.source_mtime_ns = source.st_mtime_ns
+            
+            if previous.number:
+                generation.diff = diff_catalogs(previous.tracks_by_id, generation.tracks_by_id)
+                diff = generation.diff
+                logger.info(
+                    f"Catalog generation {generation.number}: {diff.added} added, {diff.removed} removed, "
+                    f"{diff.changed} changed, {diff.unchanged} unchanged ({generation.index.reused} tracks reused index features)"
+                )
+            
+            # Atomic swap: readers see either the old or the new generation, never a mix
+            self.current = generation
+            # Results for the previous catalog can no longer be served; free them
+            self.search_cache.clear()
+        
+        return generation
+    
+    def _load_csv(self, previous: CatalogGeneration) -> CatalogGeneration:
+        """Stream the CSV in batches, indexing each batch as it is validated."""
+        ingest = CatalogIngest(self.csv_path, batch_size=self.ingest_batch_size)
+        index = CatalogIndex(backend=self.search_backend, finish=False, previous=previous.index)
+        for batch in ingest.batches():
+            index.extend(batch)
+        index.finish()
+        
+        tracks_by_id = {track.buffet_track_id: track for track in index.tracks}
+        logger.info(f"Loaded {len(index.tracks)} tracks from {self.csv_path}")
+        generation = CatalogGeneration(previous.number + 1, index.tracks, tracks_by_id, index, ingest.report)
+        generation.source_checksum = ingest.checksum.hex()
+        return generation
+    
+    def _load_mapped(self, previous: CatalogGeneration) -> CatalogGeneration:
+        """Serve tracks from the shared memory-mapped store, rebuilding it if stale."""
+        ingest = CatalogIngest(self.csv_path, batch_size=self.ingest_batch_size)
+        store = open_store(self.mmap_path, self.csv_path, ingest.tracks, lambda: ingest.checksum)
+        tracks = MappedTrackList(store)
+        # The search index is mapped from the store too; nothing per track is built here
+        index = store.catalog_index(tracks, backend=self.search_backend)
         
-        with open(catalog_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Normalize ID: prefer buffet_track_id, fall back to id
-                if 'buffet_track_id' in row and row['buffet_track_id']:
-                    buffet_track_id = row['buffet_track_id']
-                    legacy_id = int(row['id']) if 'id' in row and row['id'] else None
-                elif 'id' in row and row['id']:
-                    # Convert legacy numeric ID to string buffet_track_id
-                    legacy_id = int(row['id'])
-                    buffet_track_id = f"track_{legacy_id:04d}"
-                else:
-                    logger.warning(f"Skipping row with no ID: {row}")
-                    continue
-                
-                # Build track with required fields
-                track_data = {
-                    'buffet_track_id': buffet_track_id,
-                    'id': legacy_id,
-                    'title': row['title'],
-                    'artist': row['artist'],
-                    'album': row['album'],
-                    'duration': int(row['duration']),
-                    'genre': row['genre'],
-                    'mood': row['mood'],
-                    'tags': row['tags'],
-                    'year': int(row['year']),
-                }
-                
-                # Add optional fields if present
-                if 'mbid' in row and row['mbid']:
-                    track_data['mbid'] = row['mbid']
-                if 'isrc' in row and row['isrc']:
-                    track_data['isrc'] = row['isrc']
-                if 'spotify_id' in row and row['spotify_id']:
-                    track_data['spotify_id'] = row['spotify_id']
-                if 'stems_available' in row and row['stems_available']:
-                    track_data['stems_available'] = row['stems_available'].lower() in ('true', '1', 'yes')
-                if 'clearance_status' in row and row['clearance_status']:
-                    try:
-                        track_data['clearance_status'] = ClearanceStatus(row['clearance_status'].lower())
-                    except ValueError:
-                        track_data['clearance_status'] = ClearanceStatus.unknown
-                if 'energy' in row and row['energy']:
-                    try:
-                        track_data['energy'] = float(row['energy'])
-                    except ValueError:
-                        pass
-                if 'valence' in row and row['valence']:
-                    try:
-                        track_data['valence'] = float(row['valence'])
-                    except ValueError:
-                        pass
-                
-                track = Track(**track_data)
-                self.tracks.append(track)
-                self.tracks_by_id[track.buffet_track_id] = track
+        logger.info(f"Mapped {len(tracks)} tracks from catalog store {self.mmap_path}")
+        # Only the worker that rebuilt the store has read (and reported on) the CSV
+        report = ingest.report if ingest.report.rows_read else None
+        generation = CatalogGeneration(previous.number + 1, tracks, MappedTrackIndex(tracks), index, report)
+        # Checked against (or computed from) the CSV when the store was opened
+        generation.source_checksum = store.source_checksum.hex()
+        return generation
+    
+    def _load_snapshot(self, previous: CatalogGeneration) -> Optional[CatalogGeneration]:
+        """Load tracks and indexes from the snapshot if it is current."""
+        snapshot = read_snapshot(self.snapshot_path, self.csv_path)
+        if snapshot is None:
+            logger.info("Falling back to CSV catalog (compile a snapshot with: python -m app.snapshot)")
+            return None
         
-        logger.info(f"Loaded {len(self.tracks)} tracks from {self.csv_path}")
+        index, backend, checksum = snapshot
+        if backend != self.search_backend:
+            # Tracks are still valid; only the backend-specific index needs rebuilding
+            logger.info(f"Catalog snapshot was built for the '{backend}' backend; rebuilding index")
+            index = CatalogIndex(index.tracks, backend=self.search_backend, previous=previous.index)
+        
+        tracks_by_id = {track.buffet_track_id: track for track in index.tracks}
+        logger.info(f"Loaded {len(index.tracks)} tracks from snapshot {self.snapshot_path}")
+        generation = CatalogGeneration(previous.number + 1, index.tracks, tracks_by_id, index)
+        generation.source_checksum = checksum.hex()
+        return generation
+    
+    def search(self, request: SearchRequest) -> List[TrackSearchResult]:
+        """Search the current generation (tracks and index always from the same build)."""
+        generation = self.current
+        return SearchRanker.search_tracks(
+            generation.tracks, request, index=generation.index, cache=self.search_cache
+        )
     
     def get_track_by_id(self, track_id: str) -> Optional[Track]:
         """Retrieve a track by its buffet_track_id."""
-        return self.tracks_by_id.get(track_id)
+        return self.current.tracks_by_id.get(track_id)
     
     def get_track_by_legacy_id(self, legacy_id: int) -> Optional[Track]:
         """Retrieve a track by legacy numeric ID (for backwards compatibility)."""
         buffet_id = f"track_{legacy_id:04d}"
-        return self.tracks_by_id.get(buffet_id)
+        return self.current.tracks_by_id.get(buffet_id)
     
-    def get_all_tracks(self) -> List[Track]:
-        """Get all tracks in the catalog."""
-        return self.tracks
+    def get_all_tracks(self) -> Sequence[Track]:
+        """Get all tracks in the catalog (a lazy read-only sequence when memory-mapped)."""
+        return self.current.tracks
@@ -0,0 +1,186 @@
+"""
+Vectorized (NumPy) scoring backend for SearchRanker.
+
+The catalog index is laid out as columns: token-id matrices per field,
+value-id arrays for phrase matching, and boolean arrays for stems and
+clearance (energy/valence ranges are already answered by the sorted range
+columns in CatalogIndex). Scores are computed for all candidates at once
+with the same weights, in the same order, as SearchRanker.score_features,
+so both backends return identical floats.
+
+NumPy is optional; select this backend with SEARCH_BACKEND=numpy.
+"""
+
+from typing import List, Tuple, Dict, Iterable, Sequence
+from app.models import SearchRequest, ClearanceStatus
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def numpy_available() -> bool:
+    """Whether the NumPy backend can be used."""
+    return np is not None
+
+
+def _token_matrix(rows: Sequence[Iterable[str]], vocabulary: Dict[str, int]):
+    """Pack per-track token sets into an int32 matrix padded with -1."""
+    id_rows = [[vocabulary.setdefault(token, len(vocabulary)) for token in row] for row in rows]
+    width = max((len(row) for row in id_rows), default=0)
+    matrix = np.full((len(id_rows), max(width, 1)), -1, dtype=np.int32)
+    for i, row in enumerate(id_rows):
+        matrix[i, :len(row)] = row
+    return matrix
+
+
+class ColumnarIndex:
+    """Columnar copy of a CatalogIndex for batched scoring."""
+
+    def __init__(self, index):
+        if np is None:
+            raise ImportError("The numpy search backend requires numpy to be installed")
+
+        # Materialized once: a mapped index derives features on demand, and each is read per field
+        features = list(index.features)
+
+        # Token id matrices per field (rows are token sets, so no duplicates)
+        self.token_ids: Dict[str, int] = {}
+        self.title_tokens = _token_matrix([f.title_tokens for f in features], self.token_ids)
+        self.artist_tokens = _token_matrix([f.artist_tokens for f in features], self.token_ids)
+        self.album_tokens = _token_matrix([f.album_tokens for f in features], self.token_ids)
+        self.tag_tokens = _token_matrix([f.tag_tokens for f in features], self.token_ids)
+        self.mood_tokens = _token_matrix([f.mood_tokens for f in features], self.token_ids)
+        self.genre_tokens = _token_matrix([f.genre_tokens for f in features], self.token_ids)
+
+        # Normalized tag id matrix for the tag filter boost
+        self.tag_value_ids: Dict[str, int] = {}
+        self.tags = _token_matrix([f.tags for f in features], self.tag_value_ids)
+
+        # Value ids per field, numbered like the distinct values of the substring indexes
+        self.substrings = index.substrings
+        self.value_ids: Dict[str, Dict[str, int]] = {}
+        self.values = {}
+        for field, substrings in index.substrings.items():
+            ids = {value: value_id for value_id, value in enumerate(substrings.values)}
+            self.value_ids[field] = ids
+            self.values[field] = np.fromiter(
+                (ids[getattr(f, field)] for f in features), dtype=np.int32, count=len(features)
+            )
+
+        self.year_ids = {year: year_id for year_id, year in enumerate(index.ids_by_year)}
+        self.years = np.fromiter((self.year_ids[f.year] for f in features), dtype=np.int32, count=len(features))
+
+        # Production columns
+        cleared = ClearanceStatus.cleared.value
+        self.stems = np.fromiter((bool(t.stems_available) for t in index.tracks), dtype=bool, count=len(index))
+        self.cleared = np.fromiter(
+            (ClearanceStatus(t.clearance_status).value == cleared for t in index.tracks), dtype=bool, count=len(index)
+        )
+
+        logger.debug(f"Built columnar index for {len(index)} tracks ({len(self.token_ids)} tokens)")
+
+    def _overlap(self, matrix, rows, token_ids):
+        """Per-row count of matrix tokens in `token_ids`."""
+        if len(token_ids) == 0:
+            return np.zeros(len(rows), dtype=np.float64)
+        return np.isin(matrix[rows], token_ids).sum(axis=1).astype(np.float64)
+
+    def _value_equals(self, field: str, rows, text: str):
+        value_id = self.value_ids[field].get(text, -1)
+        return self.values[field][rows] == value_id
+
+    def _value_contains(self, field: str, rows, text: str):
+        value_ids = self.value_ids[field]
+        matching = [value_ids[value] for value in self.substrings[field].find_values(text)]
+        return np.isin(self.values[field][rows], matching)
+
+    def score(self, rows, query, request: SearchRequest):
+        """Scores for `rows` (track ids), mirroring SearchRanker.score_features."""
+        text = query.text
+        query_tokens = np.array(
+            [self.token_ids[token] for token in query.tokens if token in self.token_ids], dtype=np.int32
+        )
+        score = np.zeros(len(rows), dtype=np.float64)
+
+        # Exact phrase match bonuses (highest priority)
+        score += np.where(self._value_equals('title', rows, text), 10.0, 0.0)
+        score += np.where(self._value_equals('artist', rows, text), 8.0, 0.0)
+
+        # Partial phrase matches
+        score += np.where(self._value_contains('title', rows, text), 3.0, 0.0)
+        score += np.where(self._value_contains('artist', rows, text), 2.5, 0.0)
+
+        # Token-based matches
+        score += self._overlap(self.title_tokens, rows, query_tokens) * 1.5
+        score += self._overlap(self.artist_tokens, rows, query_tokens) * 1.2
+        score += self._overlap(self.album_tokens, rows, query_tokens) * 0.5
+
+        # Tag matches
+        score += self._overlap(self.tag_tokens, rows, query_tokens) * 2.0
+
+        # Mood match
+        score += np.where(self._value_contains('mood', rows, text), 1.5, 0.0)
+        score += self._overlap(self.mood_tokens, rows, query_tokens) * 1.0
+
+        # Genre match
+        score += np.where(self._value_contains('genre', rows, text), 1.5, 0.0)
+        score += self._overlap(self.genre_tokens, rows, query_tokens) * 1.0
+
+        # Year match
+        matching_years = [year_id for year, year_id in self.year_ids.items() if query.raw in year]
+        score += np.where(np.isin(self.years[rows], matching_years), 1.0, 0.0)
+
+        # Filter overlap boosts
+        if query.moods is not None:
+            mood_ids = [self.value_ids['mood'][m] for m in query.moods if m in self.value_ids['mood']]
+            score += np.where(np.isin(self.values['mood'][rows], mood_ids), 2.0, 0.0)
+
+        if query.genres is not None:
+            genre_ids = [self.value_ids['genre'][g] for g in query.genres if g in self.value_ids['genre']]
+            score += np.where(np.isin(self.values['genre'][rows], genre_ids), 2.0, 0.0)
+
+        if query.tags is not None:
+            tag_ids = np.array(
+                [self.tag_value_ids[t] for t in query.tags if t in self.tag_value_ids], dtype=np.int32
+            )
+            score += self._overlap(self.tags, rows, tag_ids) * 1.5
+
+        # Penalties
+        if request.stems_required:
+            score -= np.where(self.stems[rows], 0.0, 5.0)
+
+        if request.clearance_required:
+            score -= np.where(self.cleared[rows], 0.0, 5.0)
+
+        return score
+
+    def rank(self, track_ids: Iterable[int], query, request: SearchRequest, limit: int) -> List[Tuple[int, float]]:
+        """
+        Top `limit` (track id, score) pairs with a positive score.
+
+        Ordered by score descending, ties by track id (catalog order).
+        """
+        if isinstance(track_ids, range):
+            rows = np.arange(track_ids.start, track_ids.stop, dtype=np.intp)
+        else:
+            rows = np.fromiter(track_ids, dtype=np.intp)
+        if len(rows) == 0:
+            return []
+
+        scores = self.score(rows, query, request)
+        positive = scores > 0
+        rows, scores = rows[positive], scores[positive]
+
+        if len(rows) > limit:
+            # Keep everything tied with the k-th score so tie-breaking stays deterministic
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            keep = scores >= scores[top].min()
+            rows, scores = rows[keep], scores[keep]
+
+        order = np.lexsort((rows, -scores))[:limit]
+        return [(int(rows[i]), float(scores[i])) for i in order]
@@ -13,14 +13,48 @@ class Settings(BaseSettings):
     
     # Catalog settings
     catalog_path: str = "data/music_catalog.csv"
+    catalog_snapshot_path: str = "data/music_catalog.snapshot"  # empty to always parse the CSV
+    catalog_mmap_path: str = ""  # e.g. "data/music_catalog.store" to share track data across workers
+    catalog_ingest_batch_size: int = 5000  # CSV rows validated and indexed per batch
+    catalog_watch_enabled: bool = False  # hot-reload the catalog when the CSV changes
+    catalog_watch_interval: float = 2.0  # seconds between checks
+    catalog_watch_debounce: float = 1.0  # seconds the CSV must stay unchanged before reloading
     cache_dir: str = "data/cache"
+    cache_memory_entries: int = 2048  # MusicBrainz results kept in memory in front of the disk cache
+    cache_memory_bytes: int = 33554432  # 32 MB of serialized results
+    cache_query_ttl: float = 86400.0  # seconds a cached search is kept (0 = forever)
+    cache_mbid_ttl: float = 2592000.0  # seconds a cached recording is kept (0 = forever)
+    cache_negative_ttl: float = 3600.0  # seconds a "no match" result is kept (0 = same as a match)
+    cache_stale_grace: float = 604800.0  # seconds an expired result is served while refreshing (0 = never)
+    cache_max_bytes: int = 536870912  # 512 MB of cache files, least recently used evicted first (0 = no limit)
+    cache_compaction_interval: float = 600.0  # seconds between disk cache compactions (0 = never)
+    cache_backend: str = "files"  # disk cache store: "files" (JSON per key) or "sqlite" (single WAL database)
+    cache_sqlite_path: str = ""  # SQLite cache database (default: <cache_dir>/musicbrainz.sqlite3)
+    
+    # Search settings
+    search_backend: str = "python"  # "python" or "numpy" (vectorized scoring, requires numpy)
+    search_cache_size: int = 1024  # ranked result lists kept in memory (0 disables)
+    search_cache_ttl: float = 300.0  # seconds
+    
+    # Resolver settings
+    resolve_batch_max_queries: int = 1000  # queries accepted by one batch resolve request
+    resolve_batch_concurrency: int = 4  # MusicBrainz fallbacks of one batch in flight at once
+    resolve_cache_size: int = 1024  # resolved answers kept in memory (0 disables)
+    resolve_cache_internal_ttl: float = 300.0  # seconds an internal answer is kept (0 = until the catalog changes)
+    resolve_cache_musicbrainz_ttl: float = 3600.0  # seconds a MusicBrainz-sourced answer is kept (0 = until the catalog changes)
     
     # MusicBrainz settings
     musicbrainz_app_name: str = "MusicSupervisor"
     musicbrainz_version: str = "1.0"
     musicbrainz_contact: str = ""
-    musicbrainz_rate_limit: float = 1.0  # seconds between requests
+    musicbrainz_rate_limit: float = 1.0  # seconds between requests (shared by all workers)
+    musicbrainz_rate_burst: int = 1  # requests allowed back to back after an idle period
+    musicbrainz_rate_state_path: str = ""  # shared limiter state (default: <cache_dir>/musicbrainz.ratelimit)
+    musicbrainz_rate_wait_timeout: float = 30.0  # longest a lookup queues for a slot
     musicbrainz_enabled: bool = True
+    musicbrainz_base_url: str = "https://musicbrainz.org"  # JSON web service used by the async client
+    musicbrainz_timeout: float = 10.0  # seconds per async request
+    musicbrainz_failure_ttl: float = 30.0  # seconds a failed lookup isn't retried
     
     # API settings
     api_prefix: str = "/api/v1"
@@ -72,12 +72,8 @@ class ElevenLabsHandler:
         """Handle music search requests."""
         limit = payload.get("limit", 5)
         
-        from app.search import SearchRanker
-        results = SearchRanker.search_tracks(
-            tracks=self.catalog.get_all_tracks(),
-            query=query,
-            limit=limit
-        )
+        from app.models import SearchRequest
+        results = self.catalog.search(SearchRequest(query=query, limit=limit))
         
         if not results:
             return {
@@ -113,12 +109,8 @@ class ElevenLabsHandler:
             track = self.catalog.get_track_by_id(int(track_id))
         elif track_title:
             # Search by exact title
-            from app.search import SearchRanker
-            results = SearchRanker.search_tracks(
-                tracks=self.catalog.get_all_tracks(),
-                query=track_title,
-                limit=1
-            )
+            from app.models import SearchRequest
+            results = self.catalog.search(SearchRequest(query=track_title, limit=1))
             if results:
                 track = results[0].track
         
@@ -150,7 +142,7 @@ class ElevenLabsHandler:
     
     async def _handle_resolve(self, query: str) -> Dict[str, Any]:
         """Handle song name resolution using MusicBrainz."""
-        mb_match = self.musicbrainz.get_best_match(query)
+        mb_match = await self.musicbrainz.aget_best_match(query)
         
         if not mb_match:
             return {
@@ -161,10 +153,11 @@ class ElevenLabsHandler:
         mb_id, mb_title, mb_artist, mb_confidence = mb_match
         
         # Try to match to catalog
-        catalog_match = self.musicbrainz.match_to_catalog(query, self.catalog.get_all_tracks())
+        generation = self.catalog.current
+        catalog_match = await self.musicbrainz.amatch_to_catalog(query, generation.tracks, index=generation.index)
         
         if catalog_match:
-            track, confidence = catalog_match
+            track, confidence, _ = catalog_match
             response_text = (
                 f"Found it! '{mb_title}' by {mb_artist}. "
                 f"It's in our catalog as track ID {track.id}."
@@ -193,12 +186,8 @@ class ElevenLabsHandler:
         mood = payload.get("mood", "").lower()
         limit = payload.get("limit", 5)
         
-        from app.search import SearchRanker
-        results = SearchRanker.search_tracks(
-            tracks=self.catalog.get_all_tracks(),
-            query=mood,
-            limit=limit
-        )
+        from app.models import SearchRequest
+        results = self.catalog.search(SearchRequest(query=mood, limit=limit))
         
         if not results:
             return {
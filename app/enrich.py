@@ -0,0 +1,278 @@
+"""
+Batch MusicBrainz enrichment of the catalog.
+
+Fills in missing `mbid`/`isrc` values and writes the result to a new
+catalog CSV (the source is never modified). Rows are looked up in
+batches through MusicBrainzService's combined searches, so one request
+covers many rows:
+
+- rows with an ISRC but no MBID are found by ISRC,
+- rows with an MBID but no ISRC are found by MBID,
+- rows with neither are matched by title and artist.
+
+Each finished batch is appended to a progress file (JSON lines). An
+interrupted run picks up where it stopped, and rows already attempted,
+resolved or not, aren't looked up again.
+
+    python -m app.enrich [--catalog data/music_catalog.csv] [--output data/music_catalog.enriched.csv]
+"""
+
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from pathlib import Path
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+import time
+
+from app.musicbrainz import MusicBrainzService
+
+logger = logging.getLogger(__name__)
+
+# (track_id, row) waiting for a lookup
+PendingRow = Tuple[str, Dict[str, str]]
+
+
+def _row_id(row: Dict[str, str]) -> Optional[str]:
+    return row.get('buffet_track_id') or row.get('id') or None
+
+
+def _first_isrc(recording: Dict[str, Any]) -> Optional[str]:
+    isrcs = recording.get('isrc-list') or []
+    return isrcs[0] if isrcs else None
+
+
+class CatalogEnrichment:
+    """Resumable job that resolves missing MBIDs/ISRCs for a catalog CSV."""
+    
+    def __init__(
+        self,
+        service: MusicBrainzService,
+        csv_path: str,
+        output_path: str,
+        progress_path: Optional[str] = None,
+        batch_size: int = 25,
+        match_batch_size: int = 10
+    ):
+        """
+        Args:
+            service: MusicBrainz client used for the batch lookups
+            csv_path: Catalog CSV to enrich
+            output_path: Enriched catalog CSV to write
+            progress_path: Progress file (default: <output_path>.progress.jsonl)
+            batch_size: MBIDs or ISRCs per request
+            match_batch_size: Title/artist pairs per request
+        """
+        self.service = service
+        self.csv_path = csv_path
+        self.output_path = output_path
+        self.progress_path = progress_path or f"{output_path}.progress.jsonl"
+        self.batch_size = max(1, batch_size)
+        self.match_batch_size = max(1, match_batch_size)
+        # track_id -> values found for its missing columns ({"mbid": None, "isrc": None} = nothing found)
+        self.resolved: Dict[str, Dict[str, Optional[str]]] = {}
+        self.stats = {"rows": 0, "complete": 0, "resumed": 0, "resolved": 0, "unresolved": 0, "batches": 0}
+    
+    def load_progress(self) -> int:
+        """Read the progress file of an earlier run. Returns the number of rows it covers."""
+        path = Path(self.progress_path)
+        if not path.exists():
+            return 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by an interrupted run; that batch is redone
+                    continue
+                self.resolved[entry['id']] = {'mbid': entry.get('mbid'), 'isrc': entry.get('isrc')}
+        return len(self.resolved)
+    
+    def _rows(self) -> Iterator[Dict[str, str]]:
+        with open(self.csv_path, 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    
+    def _save(self, results: List[Tuple[str, Dict[str, Optional[str]]]]) -> None:
+        """Record a finished batch (appended and flushed, so it survives an interruption)."""
+        with open(self.progress_path, 'a', encoding='utf-8') as f:
+            for track_id, values in results:
+                f.write(json.dumps({'id': track_id, **values}) + "\n")
+                self.resolved[track_id] = values
+                if values.get('mbid') or values.get('isrc'):
+                    self.stats["resolved"] += 1
+                else:
+                    self.stats["unresolved"] += 1
+        self.stats["batches"] += 1
+    
+    async def _by_isrc(self, rows: List[PendingRow]) -> None:
+        found = await self.service.abatch_recordings_by_isrc([row['isrc'] for _, row in rows], self.batch_size)
+        results = []
+        for track_id, row in rows:
+            recordings = found.get(row['isrc'].upper())
+            results.append((track_id, {'mbid': recordings[0]['id'] if recordings else None, 'isrc': None}))
+        self._save(results)
+    
+    async def _by_mbid(self, rows: List[PendingRow]) -> None:
+        found = await self.service.abatch_recordings_by_mbid([row['mbid'] for _, row in rows], self.batch_size)
+        results = []
+        for track_id, row in rows:
+            recording = found.get(row['mbid'])
+            results.append((track_id, {'mbid': None, 'isrc': _first_isrc(recording) if recording else None}))
+        self._save(results)
+    
+    async def _by_match(self, rows: List[PendingRow]) -> None:
+        matches = await self.service.abatch_match(
+            [(row['title'], row['artist']) for _, row in rows], self.match_batch_size
+        )
+        results = []
+        for (track_id, row), recording in zip(rows, matches):
+            if recording is None:
+                results.append((track_id, {'mbid': None, 'isrc': None}))
+            else:
+                results.append((track_id, {'mbid': recording['id'], 'isrc': _first_isrc(recording)}))
+        self._save(results)
+    
+    async def resolve(self, max_rows: Optional[int] = None) -> None:
+        """
+        Look up every row still missing an MBID or ISRC (up to `max_rows` this run).
+        
+        Lookup errors stop the run; progress so far is kept for the next one.
+        """
+        queues = {
+            'isrc': ([], self._by_isrc, self.batch_size),
+            'mbid': ([], self._by_mbid, self.batch_size),
+            'match': ([], self._by_match, self.match_batch_size),
+        }
+        queued = 0
+        for row in self._rows():
+            self.stats["rows"] += 1
+            track_id = _row_id(row)
+            if track_id is None:
+                continue
+            if row.get('mbid') and row.get('isrc'):
+                self.stats["complete"] += 1
+                continue
+            if track_id in self.resolved:
+                self.stats["resumed"] += 1
+                continue
+            if max_rows is not None and queued >= max_rows:
+                continue
+            
+            kind = 'isrc' if row.get('isrc') else 'mbid' if row.get('mbid') else 'match'
+            rows, lookup, size = queues[kind]
+            rows.append((track_id, row))
+            queued += 1
+            if len(rows) >= size:
+                await lookup(rows[:])
+                rows.clear()
+        
+        for rows, lookup, _ in queues.values():
+            if rows:
+                await lookup(rows)
+    
+    def write_output(self) -> int:
+        """
+        Write the enriched catalog: the source rows with resolved values
+        filled into empty mbid/isrc columns (added if missing).
+        
+        Returns:
+            Number of rows written
+        """
+        with open(self.csv_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            fieldnames = list(reader.fieldnames or [])
+            for column in ('mbid', 'isrc'):
+                if column not in fieldnames:
+                    fieldnames.append(column)
+            
+            temp_path = Path(f"{self.output_path}.tmp")
+            count = 0
+            with open(temp_path, 'w', encoding='utf-8', newline='') as out:
+                writer = csv.DictWriter(out, fieldnames=fieldnames)
+                writer.writeheader()
+                for row in reader:
+                    values = self.resolved.get(_row_id(row) or '', {})
+                    for column in ('mbid', 'isrc'):
+                        if not row.get(column) and values.get(column):
+                            row[column] = values[column]
+                    writer.writerow(row)
+                    count += 1
+        temp_path.replace(self.output_path)
+        return count
+    
+    async def run(self, max_rows: Optional[int] = None) -> Dict[str, Any]:
+        """Resume, resolve and write the enriched catalog. Returns the run's statistics."""
+        started = time.perf_counter()
+        self.stats["resumed_from"] = self.load_progress()
+        try:
+            await self.resolve(max_rows)
+        finally:
+            # Write what we have, even if a lookup error stopped the run
+            self.stats["written"] = self.write_output()
+            self.stats["duration_seconds"] = round(time.perf_counter() - started, 2)
+            logger.info(
+                f"Enrichment of {self.csv_path}: {self.stats['resolved']} resolved, "
+                f"{self.stats['unresolved']} unresolved in {self.stats['batches']} batches "
+                f"({self.stats['duration_seconds']:.1f}s); wrote {self.output_path}"
+            )
+        return self.stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Enrich a catalog CSV with MusicBrainz IDs and print the run's statistics."""
+    from app.config import get_settings
+    
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Fill in missing MBIDs/ISRCs from MusicBrainz, in batches.")
+    parser.add_argument("--catalog", default=settings.catalog_path, help="Catalog CSV to enrich")
+    parser.add_argument("--output", help="Enriched catalog CSV (default: <catalog>.enriched.csv)")
+    parser.add_argument("--progress", help="Progress file (default: <output>.progress.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=25, help="MBIDs or ISRCs per request")
+    parser.add_argument("--match-batch-size", type=int, default=10, help="Title/artist pairs per request")
+    parser.add_argument("--max-rows", type=int, help="Stop after looking up this many rows")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format=settings.log_format)
+    catalog = Path(args.catalog)
+    output = args.output or str(catalog.with_name(f"{catalog.stem}.enriched{catalog.suffix}"))
+    
+    async def enrich() -> Dict[str, Any]:
+        service = MusicBrainzService(
+            app_name=settings.musicbrainz_app_name,
+            app_version=settings.musicbrainz_version,
+            contact=settings.musicbrainz_contact,
+            rate_limit=settings.musicbrainz_rate_limit,
+            cache_dir=settings.cache_dir,
+            base_url=settings.musicbrainz_base_url,
+            timeout=settings.musicbrainz_timeout,
+            rate_burst=settings.musicbrainz_rate_burst,
+            rate_state_path=settings.musicbrainz_rate_state_path or None,
+            # A batch job queues for its turn however long that takes
+            rate_wait_timeout=None,
+            cache_backend=settings.cache_backend,
+            cache_sqlite_path=settings.cache_sqlite_path or None
+        )
+        try:
+            job = CatalogEnrichment(
+                service, str(catalog), output,
+                progress_path=args.progress,
+                batch_size=args.batch_size,
+                match_batch_size=args.match_batch_size
+            )
+            return await job.run(args.max_rows)
+        finally:
+            await service.aclose()
+    
+    try:
+        stats = asyncio.run(enrich())
+    except Exception as e:
+        logger.error(f"Enrichment stopped: {e}. Run again to resume.")
+        return 1
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
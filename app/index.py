@@ -0,0 +1,603 @@
+"""
+Precomputed search index for the music catalog.
+
+Text normalization is done once per track when the catalog is loaded so that
+a search only has to normalize the query. Tracks are addressed by their
+position in the index ("track ids" below), which is also catalog order.
+"""
+
+from typing import List, FrozenSet, Iterable, Dict, Set, Optional, Hashable, Tuple, Sequence
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from app.models import Track, ClearanceStatus
+from app.columnar import ColumnarIndex, numpy_available
+import itertools
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counter; each CatalogIndex gets a fresh generation number
+_generations = itertools.count(1)
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for matching: lowercase, strip punctuation, trim."""
+    # Convert to lowercase
+    text = text.lower()
+    # Remove punctuation but keep spaces
+    text = _PUNCTUATION_RE.sub('', text)
+    # Normalize whitespace
+    return ' '.join(text.split())
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """Tokenize text into a set of normalized words."""
+    return frozenset(normalize_text(text).split())
+
+
+class TrackFeatures:
+    """Normalized, query-independent representation of a single track."""
+
+    __slots__ = (
+        'title', 'artist', 'album', 'mood', 'genre', 'year', 'tags',
+        'title_tokens', 'artist_tokens', 'album_tokens',
+        'mood_tokens', 'genre_tokens', 'tag_tokens',
+    )
+
+    def __init__(self, track: Track):
+        # Normalized field strings (used for exact/partial phrase matching)
+        self.title = normalize_text(track.title)
+        self.artist = normalize_text(track.artist)
+        self.album = normalize_text(track.album)
+        self.mood = normalize_text(track.mood)
+        self.genre = normalize_text(track.genre)
+        self.year = str(track.year)
+
+        # Normalized tags (used by the tag filter and tag filter boost)
+        self.tags: FrozenSet[str] = frozenset(normalize_text(t) for t in track.get_tags_list())
+
+        # Token sets (used for token overlap scoring)
+        self.title_tokens = frozenset(self.title.split())
+        self.artist_tokens = frozenset(self.artist.split())
+        self.album_tokens = frozenset(self.album.split())
+        self.mood_tokens = frozenset(self.mood.split())
+        self.genre_tokens = frozenset(self.genre.split())
+        self.tag_tokens = frozenset(token for tag in self.tags for token in tag.split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of a string (empty for strings shorter than 3)."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SubstringIndex:
+    """
+    Maps distinct field values to track ids and answers substring lookups.
+    
+    Lookups of 3+ characters intersect trigram posting lists over the distinct
+    values and verify the survivors; shorter lookups scan the distinct values.
+    """
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.ids_by_value: Dict[str, List[int]] = {}
+        self.value_ids_by_trigram: Dict[str, Set[int]] = {}
+
+    def add(self, value: str, track_id: int) -> None:
+        ids = self.ids_by_value.get(value)
+        if ids is None:
+            ids = self.ids_by_value[value] = []
+            value_id = len(self.values)
+            self.values.append(value)
+            for gram in trigrams(value):
+                self.value_ids_by_trigram.setdefault(gram, set()).add(value_id)
+        ids.append(track_id)
+
+    def find_value_ids(self, text: str) -> List[int]:
+        """Positions in `values` of the distinct values containing `text` as a substring."""
+        grams = trigrams(text)
+        if not grams:
+            return [i for i, value in enumerate(self.values) if text in value]
+        
+        # Intersect starting from the rarest trigram
+        postings = sorted(
+            (self.value_ids_by_trigram.get(gram, set()) for gram in grams),
+            key=len
+        )
+        value_ids = set(postings[0])
+        for posting in postings[1:]:
+            if not value_ids:
+                break
+            value_ids.intersection_update(posting)
+        
+        return [i for i in value_ids if text in self.values[i]]
+
+    def find_values(self, text: str) -> List[str]:
+        """Distinct values containing `text` as a substring."""
+        return [self.values[i] for i in self.find_value_ids(text)]
+
+    def ids_of(self, value_id: int) -> Sequence[int]:
+        """Track ids for the distinct value at position `value_id` in `values`."""
+        return self.ids_by_value[self.values[value_id]]
+
+    def find(self, text: str) -> Set[int]:
+        """Track ids whose value contains `text` as a substring."""
+        ids: Set[int] = set()
+        for value_id in self.find_value_ids(text):
+            ids.update(self.ids_of(value_id))
+        return ids
+    
+    def find_within(self, text: str) -> Set[int]:
+        """Track ids whose value is a substring of `text` (looks up each substring of `text`)."""
+        ids: Set[int] = set(self.ids_by_value.get('', ()))
+        seen: Set[str] = set()
+        for start in range(len(text)):
+            for end in range(start + 1, len(text) + 1):
+                part = text[start:end]
+                if part not in seen:
+                    seen.add(part)
+                    ids.update(self.ids_by_value.get(part, ()))
+        return ids
+
+
+def ids_to_bitset(ids: Iterable[int], size: int) -> int:
+    """Pack track ids into an int bitset (bit i set <=> track id i present)."""
+    buffer = bytearray((size + 7) >> 3)
+    for track_id in ids:
+        buffer[track_id >> 3] |= 1 << (track_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bitset_to_ids(bits: int) -> List[int]:
+    """Unpack an int bitset into ascending track ids."""
+    # Reversed binary string puts bit i at position i; find() skips zero runs in C
+    digits = bin(bits)[:1:-1]
+    ids = []
+    position = digits.find('1')
+    while position != -1:
+        ids.append(position)
+        position = digits.find('1', position + 1)
+    return ids
+
+
+class FacetIndex:
+    """
+    Bitset of track ids per facet value (mood, genre, tag, stems, clearance).
+    
+    Bitsets are Python ints, so AND/OR over a whole facet is a single C-level
+    operation. Values with very few tracks keep a plain id list instead (a
+    dense bitset costs size/8 bytes regardless of how many bits are set) and
+    are packed on demand.
+    """
+
+    # Memoized filter combinations per index
+    FILTER_CACHE_SIZE = 256
+
+    def __init__(self):
+        self.size = 0
+        self._ids: Dict[Tuple[str, Hashable], List[int]] = {}
+        self._bitsets: Dict[Tuple[str, Hashable], int] = {}
+        self._filter_cache: "OrderedDict[Tuple, int]" = OrderedDict()
+
+    def add(self, facet: str, value: Hashable, track_id: int) -> None:
+        self._ids.setdefault((facet, value), []).append(track_id)
+
+    def ids(self, facet: str, value: Hashable) -> Sequence[int]:
+        """Ids of tracks having `value` for `facet`, ascending."""
+        return self._ids.get((facet, value), ())
+
+    def freeze(self, size: int) -> None:
+        """Pack dense posting lists into bitsets once all tracks are added."""
+        self.size = size
+        self._bitsets = {}
+        self._filter_cache.clear()
+        for key, ids in self._ids.items():
+            # A small int in a list costs ~36 bytes; a bitset costs size/8 bytes
+            if len(ids) * 288 >= size:
+                self._bitsets[key] = ids_to_bitset(ids, size)
+
+    def bitset(self, facet: str, value: Hashable) -> int:
+        """Bitset of tracks having `value` for `facet` (0 if none)."""
+        key = (facet, value)
+        bits = self._bitsets.get(key)
+        if bits is None:
+            ids = self._ids.get(key)
+            bits = ids_to_bitset(ids, self.size) if ids else 0
+        return bits
+
+    def any_of(self, facet: str, values: Iterable[Hashable]) -> int:
+        """OR of the bitsets for `values`."""
+        bits = 0
+        for value in values:
+            bits |= self.bitset(facet, value)
+        return bits
+
+    def filter(
+        self,
+        moods: Optional[FrozenSet[str]] = None,
+        genres: Optional[FrozenSet[str]] = None,
+        tags: Optional[FrozenSet[str]] = None,
+        stems_required: bool = False,
+        clearance_required: bool = False
+    ) -> Optional[int]:
+        """
+        Bitset of tracks passing the facet filters (OR within, AND across).
+        
+        Returns:
+            Bitset, or None if no facet filter is requested
+        """
+        key = (moods, genres, tags, bool(stems_required), bool(clearance_required))
+        if key == (None, None, None, False, False):
+            return None
+        
+        bits = self._filter_cache.get(key)
+        if bits is not None:
+            self._filter_cache.move_to_end(key)
+            return bits
+        
+        bits = (1 << self.size) - 1
+        if moods is not None:
+            bits &= self.any_of('mood', moods)
+        if genres is not None:
+            bits &= self.any_of('genre', genres)
+        if tags is not None:
+            bits &= self.any_of('tag', tags)
+        if stems_required:
+            bits &= self.bitset('stems', True)
+        if clearance_required:
+            bits &= self.bitset('clearance', ClearanceStatus.cleared.value)
+        
+        self._filter_cache[key] = bits
+        if len(self._filter_cache) > self.FILTER_CACHE_SIZE:
+            self._filter_cache.popitem(last=False)
+        return bits
+
+
+class RangeIndex:
+    """
+    Numeric column sorted by value, with the owning track ids alongside.
+    
+    Tracks with a missing value are not in the column, so any range query
+    excludes them.
+    """
+
+    def __init__(self, values: Iterable[Tuple[float, int]] = ()):
+        pairs = sorted(values)
+        self.values: List[float] = [value for value, _ in pairs]
+        self.ids: List[int] = [track_id for _, track_id in pairs]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def ids_in_range(self, low: Optional[float] = None, high: Optional[float] = None) -> List[int]:
+        """Ids of tracks with low <= value <= high (unsorted)."""
+        start = 0 if low is None else bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect_right(self.values, high)
+        return self.ids[start:end]
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance (insertions, deletions and substitutions cost 1)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        previous = current
+    return previous[-1]
+
+
+def edit_similarity(a: str, b: str) -> float:
+    """1 - edit distance / length of the longer string (1.0 for identical strings)."""
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    return 1.0 - edit_distance(a, b) / longest
+
+
+class FuzzyIndex:
+    """
+    Approximate string lookup for misspelled queries ("bohemian rapsody").
+    
+    Candidates are the distinct values sharing the most character trigrams
+    with the lookup (padded with spaces, so word boundaries count and short
+    values still have trigrams); they are re-ranked by edit similarity.
+    """
+    
+    def __init__(self):
+        self.values: List[str] = []
+        self.ids_by_value: Dict[str, List[int]] = {}
+        self.gram_counts: List[int] = []
+        self.value_ids_by_trigram: Dict[str, List[int]] = {}
+    
+    @staticmethod
+    def _grams(text: str) -> Set[str]:
+        return trigrams(f" {text} ")
+    
+    def add(self, value: str, track_id: int) -> None:
+        if not value:
+            return
+        ids = self.ids_by_value.get(value)
+        if ids is None:
+            ids = self.ids_by_value[value] = []
+            value_id = len(self.values)
+            self.values.append(value)
+            grams = self._grams(value)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                self.value_ids_by_trigram.setdefault(gram, []).append(value_id)
+        if not ids or ids[-1] != track_id:
+            ids.append(track_id)
+    
+    def search(self, text: str, candidates: int = 20, min_overlap: float = 0.3) -> List[Tuple[float, str]]:
+        """
+        Distinct values most similar to `text`.
+        
+        Args:
+            text: Normalized lookup string
+            candidates: Values re-ranked by edit similarity (best trigram overlap first)
+            min_overlap: Minimum Dice coefficient of the trigram sets to be a candidate
+        
+        Returns:
+            (edit similarity, value) pairs, most similar first
+        """
+        grams = self._grams(text)
+        if not text or not grams:
+            return []
+        
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for value_id in self.value_ids_by_trigram.get(gram, ()):
+                shared[value_id] = shared.get(value_id, 0) + 1
+        
+        scored = []
+        for value_id, count in shared.items():
+            dice = 2.0 * count / (len(grams) + self.gram_counts[value_id])
+            if dice >= min_overlap:
+                scored.append((dice, value_id))
+        scored.sort(reverse=True)
+        
+        ranked = [
+            (edit_similarity(text, self.values[value_id]), self.values[value_id])
+            for _, value_id in scored[:candidates]
+        ]
+        ranked.sort(key=lambda pair: -pair[0])
+        return ranked
+
+
+class CatalogIndex:
+    """Search index built once from the catalog tracks."""
+
+    # Fields with token posting lists
+    TOKEN_FIELDS = ('title', 'artist', 'album', 'tags', 'mood', 'genre')
+    # Fields scored on "normalized query is a substring of the field"
+    SUBSTRING_FIELDS = ('title', 'artist', 'mood', 'genre')
+
+    # Supported scoring backends
+    BACKENDS = ('python', 'numpy')
+
+    def __init__(
+        self,
+        tracks: Optional[Iterable[Track]] = None,
+        backend: str = 'python',
+        finish: bool = True,
+        previous: Optional['CatalogIndex'] = None
+    ):
+        """
+        Args:
+            tracks: Catalog tracks; more can be appended with extend() before finish()
+            backend: Scoring backend ('python' or 'numpy')
+            finish: Build the final structures now; pass False to index incrementally
+            previous: Earlier build of the catalog; unchanged tracks reuse its features
+        """
+        # Identifies this build of the index (e.g. for result caches)
+        self.generation = next(_generations)
+        self.backend = backend
+        self.tracks: Sequence[Track] = []
+        self.features: List[TrackFeatures] = []
+        
+        # Inverted index: field -> token -> posting list of track ids (ascending)
+        self.postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in self.TOKEN_FIELDS}
+        # Distinct normalized values for substring fallbacks, plus raw year strings
+        self.substrings: Dict[str, SubstringIndex] = {field: SubstringIndex() for field in self.SUBSTRING_FIELDS}
+        self.ids_by_year: Dict[str, List[int]] = {}
+        # Trigram index over title, artist and "title artist" for misspelled lookups
+        self.fuzzy = FuzzyIndex()
+        # Lowercased (not normalized) title/artist and external ids, for matching
+        # MusicBrainz answers back to catalog rows
+        self.lowercase: Dict[str, SubstringIndex] = {'title': SubstringIndex(), 'artist': SubstringIndex()}
+        self.ids_by_mbid: Dict[str, List[int]] = {}
+        self.ids_by_isrc: Dict[str, List[int]] = {}
+        # Facet bitsets for the mood/genre/tag/stems/clearance filters
+        self.facets = FacetIndex()
+        # Sorted columns for the energy/valence range filters, built by finish()
+        self.energy = RangeIndex([])
+        self.valence = RangeIndex([])
+        self._energy_values: List[Tuple[float, int]] = []
+        self._valence_values: List[Tuple[float, int]] = []
+        self.columns: Optional[ColumnarIndex] = None
+        # Scorer used instead of SearchRanker's per-track scoring, if any (see app.mmap_store)
+        self.ranker = None
+        
+        # Features from the previous build by buffet_track_id; normalizing and
+        # tokenizing is most of the build cost, and a reload usually changes few rows
+        self._previous: Dict[str, Tuple[Track, TrackFeatures]] = {}
+        if previous is not None:
+            self._previous = {
+                track.buffet_track_id: (track, features)
+                for track, features in zip(previous.tracks, previous.features)
+            }
+        self.reused = 0
+        
+        # Read-only sequences (e.g. a memory-mapped track list) are kept as is
+        if isinstance(tracks, Sequence) and not isinstance(tracks, list):
+            self.tracks = tracks
+            self._index_tracks(0, tracks)
+        else:
+            self.tracks = []
+            self.extend(tracks or ())
+        
+        if finish:
+            self.finish()
+    
+    def extend(self, tracks: Iterable[Track]) -> None:
+        """Append and index more tracks (e.g. one ingest batch). Call finish() when done."""
+        start = len(self.tracks)
+        self.tracks.extend(tracks)
+        self._index_tracks(start, self.tracks[start:])
+    
+    def _index_tracks(self, start: int, tracks: Iterable[Track]) -> None:
+        # Single pass over the tracks (a lazy track list builds each one once)
+        for track_id, track in enumerate(tracks, start):
+            reusable = self._previous.get(track.buffet_track_id) if self._previous else None
+            if reusable is not None and reusable[0] == track:
+                features = reusable[1]
+                self.reused += 1
+            else:
+                features = TrackFeatures(track)
+            self.features.append(features)
+            self._index_features(track_id, features)
+            self._index_facets(track_id, track, features)
+            self._index_identifiers(track_id, track)
+            if track.energy is not None:
+                self._energy_values.append((track.energy, track_id))
+            if track.valence is not None:
+                self._valence_values.append((track.valence, track_id))
+    
+    def finish(self) -> None:
+        """Build the structures that need every track (bitsets, sorted ranges, columns)."""
+        self.facets.freeze(len(self.tracks))
+        self.energy = RangeIndex(self._energy_values)
+        self.valence = RangeIndex(self._valence_values)
+        self._energy_values = []
+        self._valence_values = []
+        self._previous = {}
+        self.build_columns()
+        
+        logger.debug(f"Built search index for {len(self.tracks)} tracks")
+    
+    def build_columns(self) -> None:
+        """Build the optional columnar copy for the vectorized scoring backend."""
+        backend = self.backend
+        if backend == 'numpy':
+            if numpy_available():
+                self.columns = ColumnarIndex(self)
+            else:
+                logger.warning("numpy is not installed; falling back to the python search backend")
+        elif backend != 'python':
+            logger.warning(f"Unknown search backend '{backend}'; using the python search backend")
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+    
+    def __setstate__(self, state):
+        # An index restored from a snapshot is a new build for this process
+        self.__dict__.update(state)
+        self.generation = next(_generations)
+
+    def _index_features(self, track_id: int, features: TrackFeatures) -> None:
+        field_tokens = (
+            ('title', features.title_tokens),
+            ('artist', features.artist_tokens),
+            ('album', features.album_tokens),
+            ('tags', features.tag_tokens),
+            ('mood', features.mood_tokens),
+            ('genre', features.genre_tokens),
+        )
+        for field, tokens in field_tokens:
+            postings = self.postings[field]
+            for token in tokens:
+                postings.setdefault(token, []).append(track_id)
+        
+        self.substrings['title'].add(features.title, track_id)
+        self.substrings['artist'].add(features.artist, track_id)
+        self.substrings['mood'].add(features.mood, track_id)
+        self.substrings['genre'].add(features.genre, track_id)
+        self.fuzzy.add(features.title, track_id)
+        self.fuzzy.add(features.artist, track_id)
+        self.fuzzy.add(f"{features.title} {features.artist}", track_id)
+        self.ids_by_year.setdefault(features.year, []).append(track_id)
+
+    def _index_facets(self, track_id: int, track: Track, features: TrackFeatures) -> None:
+        self.facets.add('mood', features.mood, track_id)
+        self.facets.add('genre', features.genre, track_id)
+        for tag in features.tags:
+            self.facets.add('tag', tag, track_id)
+        self.facets.add('stems', bool(track.stems_available), track_id)
+        self.facets.add('clearance', ClearanceStatus(track.clearance_status).value, track_id)
+    
+    def _index_identifiers(self, track_id: int, track: Track) -> None:
+        self.lowercase['title'].add(track.title.lower(), track_id)
+        self.lowercase['artist'].add(track.artist.lower(), track_id)
+        if track.mbid:
+            self.ids_by_mbid.setdefault(track.mbid.strip().lower(), []).append(track_id)
+        if track.isrc:
+            self.ids_by_isrc.setdefault(track.isrc.strip().upper(), []).append(track_id)
+    
+    def ids_for_recording(self, mbid: str, isrcs: Iterable[str] = ()) -> List[int]:
+        """Ids of tracks that already carry this MusicBrainz recording id or one of its ISRCs."""
+        ids = list(self.ids_by_mbid.get(mbid.strip().lower(), ())) if mbid else []
+        for isrc in isrcs:
+            ids.extend(self.ids_by_isrc.get(isrc.strip().upper(), ()))
+        return ids
+
+    def match_candidates(self, text: str, tokens: Iterable[str], raw: str) -> Optional[Set[int]]:
+        """
+        Ids of every track that can get a positive query-match score.
+        
+        Args:
+            text: Normalized query
+            tokens: Normalized query tokens
+            raw: Raw query (the year match uses it verbatim)
+        
+        Returns:
+            Set of track ids, or None if every track may match (empty query)
+        """
+        # An empty normalized query is a substring of every field
+        if not text:
+            return None
+        
+        candidates: Set[int] = set()
+        
+        # Token overlap on any field
+        for token in tokens:
+            for postings in self.postings.values():
+                candidates.update(postings.get(token, ()))
+        
+        # Partial phrase matches that are not whole tokens ("rhap" in "bohemian rhapsody")
+        for substrings in self.substrings.values():
+            candidates.update(substrings.find(text))
+        
+        # Year match ("197" in "1975")
+        for year, ids in self.ids_by_year.items():
+            if raw in year:
+                candidates.update(ids)
+        
+        return candidates
+    
+    def fuzzy_match(self, text: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        Tracks whose title, artist or "title artist" is closest to `text`.
+        
+        Args:
+            text: Normalized query
+            limit: Maximum number of tracks
+        
+        Returns:
+            (track id, edit similarity) pairs, most similar first (ties in catalog order)
+        """
+        best: Dict[int, float] = {}
+        for similarity, value in self.fuzzy.search(text):
+            for track_id in self.fuzzy.ids_by_value[value]:
+                if similarity > best.get(track_id, 0.0):
+                    best[track_id] = similarity
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]
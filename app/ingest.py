@@ -0,0 +1,264 @@
+"""
+Streaming catalog CSV ingestion.
+
+The CSV is read in batches: each batch of raw rows is converted and
+validated together, handed to the caller (typically to extend a
+CatalogIndex) and dropped, so only one batch of raw rows is held at a
+time. Rows that fail conversion or validation are recorded in an
+IngestReport instead of aborting the load, along with throughput and the
+peak memory of the process.
+
+Check a catalog export without starting the service:
+
+    python -m app.ingest [--catalog data/music_catalog.csv]
+"""
+
+from typing import Dict, Iterator, List, Optional, Any
+from itertools import chain
+import argparse
+import csv
+import hashlib
+import io
+import logging
+import sys
+import time
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.models import Track, ClearanceStatus, IngestReport, IngestRejection
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Columns every catalog export must have (plus buffet_track_id or id)
+REQUIRED_COLUMNS = ('title', 'artist', 'album', 'duration', 'genre', 'mood', 'tags', 'year')
+
+_track_list = TypeAdapter(List[Track])
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _int_field(row: Dict[str, Any], field: str) -> int:
+    try:
+        return int(row[field])
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid {field} {row[field]!r}")
+
+
+def parse_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a raw CSV row (old or new schema) into Track fields.
+    
+    Raises:
+        ValueError: If the row has no ID or a malformed integer field
+    """
+    # Normalize ID: prefer buffet_track_id, fall back to id
+    if row.get('buffet_track_id'):
+        buffet_track_id = row['buffet_track_id']
+        legacy_id = _int_field(row, 'id') if row.get('id') else None
+    elif row.get('id'):
+        # Convert legacy numeric ID to string buffet_track_id
+        legacy_id = _int_field(row, 'id')
+        buffet_track_id = f"track_{legacy_id:04d}"
+    else:
+        raise ValueError("row has no buffet_track_id or id")
+    
+    # Build track with required fields
+    track_data = {
+        'buffet_track_id': buffet_track_id,
+        'id': legacy_id,
+        'title': row['title'],
+        'artist': row['artist'],
+        'album': row['album'],
+        'duration': _int_field(row, 'duration'),
+        'genre': row['genre'],
+        'mood': row['mood'],
+        'tags': row['tags'],
+        'year': _int_field(row, 'year'),
+    }
+    
+    # Add optional fields if present
+    if row.get('mbid'):
+        track_data['mbid'] = row['mbid']
+    if row.get('isrc'):
+        track_data['isrc'] = row['isrc']
+    if row.get('spotify_id'):
+        track_data['spotify_id'] = row['spotify_id']
+    if row.get('stems_available'):
+        track_data['stems_available'] = row['stems_available'].lower() in ('true', '1', 'yes')
+    if row.get('clearance_status'):
+        try:
+            track_data['clearance_status'] = ClearanceStatus(row['clearance_status'].lower())
+        except ValueError:
+            track_data['clearance_status'] = ClearanceStatus.unknown
+    if row.get('energy'):
+        try:
+            track_data['energy'] = float(row['energy'])
+        except ValueError:
+            pass
+    if row.get('valence'):
+        try:
+            track_data['valence'] = float(row['valence'])
+        except ValueError:
+            pass
+    
+    return track_data
+
+
+def _validation_reason(errors: List[Dict[str, Any]]) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in errors)
+
+
+class _HashingFile(io.FileIO):
+    """Binary file that computes the SHA-256 of everything read through it."""
+    
+    def __init__(self, path: str):
+        super().__init__(path, 'r')
+        self.digest = hashlib.sha256()
+    
+    def readinto(self, buffer) -> Optional[int]:
+        count = super().readinto(buffer)
+        if count:
+            self.digest.update(memoryview(buffer)[:count])
+        return count
+    
+    def readall(self) -> bytes:
+        data = super().readall()
+        self.digest.update(data)
+        return data
+
+
+class CatalogIngest:
+    """Streams a catalog CSV as batches of validated Tracks, recording rejected rows."""
+    
+    def __init__(self, csv_path: str, batch_size: int = 5000, max_rejections: int = 1000):
+        """
+        Args:
+            csv_path: Catalog CSV to read
+            batch_size: Rows converted and validated together
+            max_rejections: Rejected rows kept in the report (all are counted)
+        """
+        self.csv_path = csv_path
+        self.batch_size = max(1, batch_size)
+        self.max_rejections = max_rejections
+        self.report = IngestReport(source=csv_path)
+        # SHA-256 of the CSV as it was read, set once batches() has read all of it
+        self.checksum: Optional[bytes] = None
+    
+    def batches(self) -> Iterator[List[Track]]:
+        """
+        Yield validated Tracks in CSV order, one batch at a time.
+        
+        Raises:
+            ValueError: If the header is missing a required column
+        """
+        self.report = IngestReport(source=self.csv_path)
+        self.checksum = None
+        started = time.perf_counter()
+        
+        # Hashed while parsing: one read, and the digest matches the rows loaded
+        raw = _HashingFile(self.csv_path)
+        with io.TextIOWrapper(io.BufferedReader(raw), encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            columns = set(reader.fieldnames or ())
+            missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+            if 'buffet_track_id' not in columns and 'id' not in columns:
+                missing.insert(0, 'buffet_track_id/id')
+            if missing:
+                raise ValueError(f"Catalog {self.csv_path} is missing columns: {', '.join(missing)}")
+            
+            lines: List[int] = []
+            rows: List[Dict[str, Any]] = []
+            for row in reader:
+                self.report.rows_read += 1
+                try:
+                    rows.append(parse_row(row))
+                    lines.append(reader.line_num)
+                except ValueError as e:
+                    self._reject(reader.line_num, row.get('buffet_track_id') or row.get('id') or None, str(e))
+                
+                if len(rows) >= self.batch_size:
+                    yield self._validate(lines, rows)
+                    lines, rows = [], []
+            
+            if rows:
+                yield self._validate(lines, rows)
+            self.checksum = raw.digest.digest()
+        
+        self._finish(time.perf_counter() - started)
+    
+    def tracks(self) -> Iterator[Track]:
+        """Yield validated Tracks one at a time."""
+        return chain.from_iterable(self.batches())
+    
+    def _validate(self, lines: List[int], rows: List[Dict[str, Any]]) -> List[Track]:
+        """Validate a batch at once; on failure, reject the bad rows and validate the rest."""
+        try:
+            tracks = _track_list.validate_python(rows)
+        except ValidationError as e:
+            errors_by_row: Dict[int, List[Dict[str, Any]]] = {}
+            for error in e.errors():
+                position, *loc = error['loc']
+                errors_by_row.setdefault(position, []).append({**error, 'loc': loc})
+            for position, errors in errors_by_row.items():
+                self._reject(lines[position], rows[position]['buffet_track_id'], _validation_reason(errors))
+            tracks = _track_list.validate_python(
+                [row for position, row in enumerate(rows) if position not in errors_by_row]
+            )
+        
+        self.report.rows_loaded += len(tracks)
+        return tracks
+    
+    def _reject(self, line: int, track_id: Optional[str], reason: str) -> None:
+        self.report.rows_rejected += 1
+        if len(self.report.rejections) < self.max_rejections:
+            self.report.rejections.append(IngestRejection(line=line, track_id=track_id, reason=reason))
+        logger.debug(f"Rejected catalog row at line {line} ({track_id}): {reason}")
+    
+    def _finish(self, duration: float) -> None:
+        report = self.report
+        report.duration_seconds = round(duration, 3)
+        report.rows_per_second = round(report.rows_read / duration, 1) if duration > 0 else 0.0
+        report.peak_memory_mb = peak_memory_mb()
+        
+        memory = f"{report.peak_memory_mb:.0f} MB" if report.peak_memory_mb is not None else "unknown"
+        logger.info(
+            f"Ingested {report.rows_loaded}/{report.rows_read} rows from {self.csv_path} in "
+            f"{report.duration_seconds:.2f}s ({report.rows_per_second:.0f} rows/s, peak memory {memory})"
+        )
+        if report.rows_rejected:
+            logger.warning(f"Rejected {report.rows_rejected} catalog rows from {self.csv_path}; see the ingest report")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Validate a catalog CSV and print the ingest report as JSON."""
+    from app.config import get_settings
+    
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Validate a catalog CSV and report rejected rows.")
+    parser.add_argument("--catalog", default=settings.catalog_path, help="Catalog CSV to check")
+    parser.add_argument("--batch-size", type=int, default=settings.catalog_ingest_batch_size, help="Rows per batch")
+    parser.add_argument("--max-rejections", type=int, default=1000, help="Rejected rows to list in the report")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format=settings.log_format)
+    ingest = CatalogIngest(args.catalog, batch_size=args.batch_size, max_rejections=args.max_rejections)
+    for _ in ingest.batches():
+        pass
+    print(ingest.report.model_dump_json(indent=2))
+    return 1 if ingest.report.rows_rejected else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,23 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
 from pathlib import Path
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 
 from app.config import Settings, get_settings, reload_settings
-from app.models import Track, TrackSearchResult, SearchRequest, ResolveRequest, ResolveResponse
+from app.models import (
+    Track, TrackSearchResult, SearchRequest, ResolveRequest, ResolveResponse,
+    BatchResolveRequest, BatchResolveResponse
+)
 from app.catalog import MusicCatalog
 from app.search import SearchRanker
 from app.musicbrainz import MusicBrainzService
 from app.resolver import ResolverService
 from app.elevenlabs import ElevenLabsHandler
+from app.watcher import CatalogWatcher
 from app import agent
 
 # Configure logging from settings
@@ -29,12 +34,13 @@ catalog = None
 musicbrainz_service = None
 resolver_service = None
 elevenlabs_handler = None
+catalog_watcher = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize and cleanup services."""
-    global catalog, musicbrainz_service, resolver_service, elevenlabs_handler
+    global catalog, musicbrainz_service, resolver_service, elevenlabs_handler, catalog_watcher
     
     # Startup
     logger.info("Starting Music Metadata Aggregator service...")
@@ -46,7 +52,29 @@ async def lifespan(app: FastAPI):
         # Make path relative to project root
         catalog_path = Path(__file__).parent.parent / settings.catalog_path
     
-    catalog = MusicCatalog(str(catalog_path))
+    # Prebuilt snapshot (if current) skips CSV parsing and index building
+    snapshot_path = None
+    if settings.catalog_snapshot_path:
+        snapshot_path = Path(settings.catalog_snapshot_path)
+        if not snapshot_path.is_absolute():
+            snapshot_path = Path(__file__).parent.parent / settings.catalog_snapshot_path
+    
+    # Shared memory-mapped store (opt-in) keeps one copy of the track data across workers
+    mmap_path = None
+    if settings.catalog_mmap_path:
+        mmap_path = Path(settings.catalog_mmap_path)
+        if not mmap_path.is_absolute():
+            mmap_path = Path(__file__).parent.parent / settings.catalog_mmap_path
+    
+    catalog = MusicCatalog(
+        str(catalog_path),
+        search_backend=settings.search_backend,
+        search_cache_size=settings.search_cache_size,
+        search_cache_ttl=settings.search_cache_ttl,
+        snapshot_path=str(snapshot_path) if snapshot_path else None,
+        mmap_path=str(mmap_path) if mmap_path else None,
+        ingest_batch_size=settings.catalog_ingest_batch_size
+    )
     logger.info(f"Loaded {len(catalog.tracks)} tracks from catalog")
     
     # Initialize MusicBrainz service (if enabled)
@@ -56,7 +84,22 @@ async def lifespan(app: FastAPI):
             app_version=settings.musicbrainz_version,
             contact=settings.musicbrainz_contact,
             rate_limit=settings.musicbrainz_rate_limit,
-            cache_dir=settings.cache_dir
+            cache_dir=settings.cache_dir,
+            base_url=settings.musicbrainz_base_url,
+            timeout=settings.musicbrainz_timeout,
+            rate_burst=settings.musicbrainz_rate_burst,
+            rate_state_path=settings.musicbrainz_rate_state_path or None,
+            rate_wait_timeout=settings.musicbrainz_rate_wait_timeout,
+            failure_ttl=settings.musicbrainz_failure_ttl,
+            memory_cache_entries=settings.cache_memory_entries,
+            memory_cache_bytes=settings.cache_memory_bytes,
+            query_cache_ttl=settings.cache_query_ttl or None,
+            mbid_cache_ttl=settings.cache_mbid_ttl or None,
+            disk_cache_bytes=settings.cache_max_bytes or None,
+            cache_backend=settings.cache_backend,
+            cache_sqlite_path=settings.cache_sqlite_path or None,
+            negative_cache_ttl=settings.cache_negative_ttl or None,
+            stale_grace=settings.cache_stale_grace or None
         )
         logger.info("MusicBrainz service initialized with caching and rate limiting")
     else:
@@ -64,8 +107,11 @@ async def lifespan(app: FastAPI):
     
     # Initialize resolver service
     resolver_service = ResolverService(
-        catalog_tracks=catalog.get_all_tracks(),
-        musicbrainz_service=musicbrainz_service
+        musicbrainz_service=musicbrainz_service,
+        catalog=catalog,
+        cache_size=settings.resolve_cache_size,
+        cache_internal_ttl=settings.resolve_cache_internal_ttl or None,
+        cache_musicbrainz_ttl=settings.resolve_cache_musicbrainz_ttl or None
     )
     logger.info("Resolver service initialized")
     
@@ -80,10 +126,38 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("11Labs integration disabled")
     
+    # Watch the catalog CSV for changes (if enabled)
+    watcher_task = None
+    if settings.catalog_watch_enabled:
+        catalog_watcher = CatalogWatcher(
+            catalog,
+            interval=settings.catalog_watch_interval,
+            debounce=settings.catalog_watch_debounce
+        )
+        watcher_task = asyncio.create_task(catalog_watcher.run())
+    
+    # Expire and evict MusicBrainz cache files in the background
+    compaction_task = None
+    if musicbrainz_service and settings.cache_compaction_interval > 0:
+        compaction_task = asyncio.create_task(
+            musicbrainz_service.cache.run_compaction(settings.cache_compaction_interval)
+        )
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Music Metadata Aggregator service...")
+    for task in (watcher_task, compaction_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if resolver_service:
+        await resolver_service.aclose()
+    if musicbrainz_service:
+        await musicbrainz_service.aclose()
 
 
 # Initialize FastAPI app
@@ -118,6 +192,7 @@ async def root():
             "search": "/api/v1/search",
             "track_by_id": "/api/v1/tracks/{track_id}",
             "resolve": "/api/v1/resolve",
+            "resolve_batch": "/api/v1/resolve/batch",
             "all_tracks": "/api/v1/tracks"
         }
     }
@@ -134,7 +209,8 @@ async def get_all_tracks():
     if catalog is None:
         raise HTTPException(status_code=500, detail="Catalog not initialized")
     
-    return catalog.get_all_tracks()
+    # Materialize lazy (memory-mapped) catalogs for the response model
+    return list(catalog.get_all_tracks())
 
 
 @app.get("/api/v1/tracks/{track_id}", response_model=Track)
@@ -195,12 +271,7 @@ async def search_tracks(search_request: SearchRequest):
     if catalog is None:
         raise HTTPException(status_code=500, detail="Catalog not initialized")
     
-    results = SearchRanker.search_tracks(
-        tracks=catalog.get_all_tracks(),
-        request=search_request
-    )
-    
-    return results
+    return catalog.search(search_request)
 
 
 @app.post("/api/v1/resolve", response_model=ResolveResponse)
@@ -213,6 +284,10 @@ async def resolve_query(resolve_request: ResolveRequest):
     2. If confidence is low, queries MusicBrainz API
     3. Returns best match with candidates, confidence score, and source
     
+    With `budget_ms`, the answer comes back within the budget; if
+    MusicBrainz is still working, `upgrade_pending` is set and a repeat
+    request gets the upgraded answer.
+    
     Args:
         resolve_request: Request containing the free-text query
         
@@ -222,11 +297,50 @@ async def resolve_query(resolve_request: ResolveRequest):
     if resolver_service is None:
         raise HTTPException(status_code=500, detail="Resolver service not initialized")
     
-    result = resolver_service.resolve(resolve_request.query)
+    if resolve_request.budget_ms is not None:
+        return await resolver_service.aresolve_within(resolve_request.query, resolve_request.budget_ms / 1000.0)
+    
+    result = await resolver_service.aresolve(resolve_request.query)
     
     return result
 
 
+@app.post("/api/v1/resolve/batch", response_model=BatchResolveResponse)
+async def resolve_batch(batch_request: BatchResolveRequest):
+    """
+    Resolve many free-text queries (e.g. a cue sheet) in one request.
+    
+    Duplicate queries (after normalization) are resolved once, every query
+    is matched against the internal catalog first, and only low-confidence
+    ones go to MusicBrainz through the shared rate limiter.
+    
+    Args:
+        batch_request: Queries, plus `stream` to receive NDJSON
+        
+    Returns:
+        BatchResolveResponse with one result per query in request order, or
+        with `stream`, NDJSON lines of {"index", "result"} as each finishes
+    """
+    if resolver_service is None:
+        raise HTTPException(status_code=500, detail="Resolver service not initialized")
+    
+    if len(batch_request.queries) > settings.resolve_batch_max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.resolve_batch_max_queries} queries per batch"
+        )
+    
+    concurrency = settings.resolve_batch_concurrency
+    if not batch_request.stream:
+        return await resolver_service.aresolve_batch(batch_request.queries, concurrency)
+    
+    async def lines():
+        async for item in resolver_service.aiter_resolve_batch(batch_request.queries, concurrency):
+            yield item.model_dump_json() + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.get("/health")
 async def health_check():
     """
@@ -237,18 +351,42 @@ async def health_check():
     - Catalog loading status and track count
     - MusicBrainz service status
     - Cache status
+    - MusicBrainz rate limiter queue wait metrics
+    - Search result cache hit/miss counters
+    - Resolve result cache hit/miss counters
+    - Budgeted resolve counters (speculative lookups, timeouts, background upgrades)
+    - Catalog generation (the checksum matches across workers serving the same CSV)
     """
     cache_status = {}
+    rate_limit_status = {}
     if musicbrainz_service:
         cache_status = musicbrainz_service.get_cache_status()
+        rate_limit_status = musicbrainz_service.get_rate_limit_status()
+    
+    search_cache_status = catalog.search_cache.get_cache_status() if catalog else {}
+    
+    generation = catalog.current if catalog else None
+    generation_status = None
+    if generation:
+        generation_status = {
+            "number": generation.number,
+            "checksum": generation.source_checksum,
+            "loaded_at": generation.loaded_at
+        }
     
     return {
         "status": "healthy",
         "catalog_loaded": catalog is not None,
-        "tracks_count": len(catalog.tracks) if catalog else 0,
+        "tracks_count": len(generation.tracks) if generation else 0,
         "catalog_path": settings.catalog_path,
+        "catalog_generation": generation_status,
+        "catalog_watcher": catalog_watcher.get_status() if catalog_watcher else None,
         "musicbrainz_enabled": settings.musicbrainz_enabled,
         "cache_status": cache_status,
+        "musicbrainz_rate_limit": rate_limit_status,
+        "search_cache": search_cache_status,
+        "resolve_cache": resolver_service.cache.get_cache_status() if resolver_service else {},
+        "resolve_budget": resolver_service.get_budget_status() if resolver_service else {},
         "features": {
             "dev_endpoints": settings.enable_dev_endpoints,
             "elevenlabs": settings.enable_elevenlabs,
@@ -268,33 +406,29 @@ async def reload_catalog():
     Useful for updating the catalog without restarting the server.
     
     Returns:
-        Status and new track count
+        Status, new track count, generation number, diff against the previous
+        generation and the ingest report (rejected rows, throughput)
     """
     if not settings.enable_dev_endpoints:
         raise HTTPException(status_code=404, detail="Endpoint not found")
     
-    global catalog, resolver_service
-    
     if catalog is None:
         raise HTTPException(status_code=500, detail="Catalog not initialized")
     
     try:
-        # Reload catalog
-        catalog.load_catalog()
-        
-        # Update resolver with new tracks
-        if resolver_service:
-            resolver_service.catalog_tracks = catalog.get_all_tracks()
-        
-        # Update agent dependencies
-        agent.set_dependencies(catalog, musicbrainz_service, resolver_service)
+        # Build the new generation off the event loop; requests keep using the
+        # current one until it is swapped in (resolver, agent and 11Labs all read it)
+        generation = await asyncio.to_thread(catalog.load_catalog)
         
-        logger.info(f"Catalog reloaded: {len(catalog.tracks)} tracks")
+        logger.info(f"Catalog reloaded: {len(generation.tracks)} tracks (generation {generation.number})")
         
         return {
             "status": "success",
-            "tracks_count": len(catalog.tracks),
-            "message": "Catalog reloaded successfully"
+            "tracks_count": len(generation.tracks),
+            "generation": generation.number,
+            "message": "Catalog reloaded successfully",
+            "diff": generation.diff.model_dump() if generation.diff else None,
+            "ingest": generation.ingest_report.model_dump() if generation.ingest_report else None
         }
     except Exception as e:
         logger.error(f"Failed to reload catalog: {e}")
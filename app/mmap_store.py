@@ -0,0 +1,731 @@
+"""
+Read-only, memory-mapped catalog store shared by all workers.
+
+Track data is laid out as columns in a single file: string tables (offsets
+plus a UTF-8 blob), fixed-width numeric arrays, and an open-addressing hash
+table from buffet_track_id to row. Every worker maps the same file, so the
+page cache holds one copy of the catalog no matter how many workers run,
+and Track objects are only built for rows that are actually returned.
+
+The search index is stored in the same file: posting lists, distinct-value
+tables, facet bitsets and range columns are written once by the worker
+that builds the store and read in place by every worker, so no worker
+holds per-track index structures. Searches are scored from the posting
+lists (see MappedRanker), so Track objects are only built for the results.
+
+The store records the size, mtime and SHA-256 of the source CSV. When it
+is missing or stale, the first worker to take the lock rebuilds it from
+the CSV; the others wait and then map the new file.
+"""
+
+from typing import List, Optional, Iterable, Iterator, Sequence, Mapping, Callable, Tuple, Hashable, Set, Dict
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+
+from app.models import Track, ClearanceStatus, SearchRequest
+from app.cache import LRUCache
+from app.index import CatalogIndex, TrackFeatures, SubstringIndex, FuzzyIndex, FacetIndex, RangeIndex
+from app.search import SearchRanker, QueryFeatures
+from app.snapshot import file_checksum
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_MAGIC = b"MSCATMAP"
+STORE_VERSION = 3
+
+STRING_COLUMNS = ('buffet_track_id', 'title', 'artist', 'album', 'genre', 'mood', 'tags', 'mbid', 'isrc', 'spotify_id')
+INT_COLUMNS = ('id', 'duration', 'year')
+FLOAT_COLUMNS = ('energy', 'valence')
+# Optional string columns store None as the empty string
+OPTIONAL_STRING_COLUMNS = ('mbid', 'isrc', 'spotify_id')
+
+_NO_INT = -(1 << 63)
+_CLEARANCE_CODES = [status.value for status in ClearanceStatus]
+
+# magic, version, rows, hash slots, source size, source mtime_ns, source sha256, index directory offset
+_HEADER = struct.Struct("<8sHQQQq32sQ")
+# Sections: per string column (offsets, blob), per int column, per float column, stems, clearance, hash table
+_SECTION_COUNT = 2 * len(STRING_COLUMNS) + len(INT_COLUMNS) + len(FLOAT_COLUMNS) + 3
+_DIRECTORY = struct.Struct("<" + "QQ" * _SECTION_COUNT)
+
+
+def _key_hash(key: str) -> int:
+    """Process-independent 64-bit hash (the built-in hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _pad8(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 8)
+
+
+def _layout(sections: Sequence[bytes], offset: int) -> List[int]:
+    """Directory entries (offset, length) for sections laid out from `offset`, 8-byte aligned."""
+    directory = []
+    for data in sections:
+        directory.extend((offset, len(data)))
+        offset += len(_pad8(data))
+    return directory
+
+
+def _facet_key(key: Tuple[str, Hashable]) -> str:
+    facet, value = key
+    return f"{facet}\x1f{value}"
+
+
+def _string_sections(values: Iterable[str]) -> List[bytes]:
+    """End offsets plus a UTF-8 blob (read back by MappedStrings)."""
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return [offsets.tobytes(), bytes(blob)]
+
+
+def _table_sections(table: Mapping[str, bytes]) -> List[bytes]:
+    """Sorted keys plus one packed value per key (read back by MappedTable)."""
+    keys = sorted(table)
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for key in keys:
+        blob += table[key]
+        offsets.append(len(blob))
+    return _string_sections(keys) + [offsets.tobytes(), bytes(blob)]
+
+
+def _id_table_sections(table: Mapping[str, Iterable[int]]) -> List[bytes]:
+    return _table_sections({key: array('i', sorted(ids)).tobytes() for key, ids in table.items()})
+
+
+def _substring_sections(substrings: SubstringIndex) -> List[bytes]:
+    # Row of each distinct value in the sorted ids_by_value table, so substring
+    # matches reach their track ids without a key search (MappedSubstringIndex)
+    table_rows = {value: row for row, value in enumerate(sorted(substrings.ids_by_value))}
+    return (
+        _string_sections(substrings.values)
+        + _id_table_sections(substrings.ids_by_value)
+        + _id_table_sections(substrings.value_ids_by_trigram)
+        + [array('i', [table_rows[value] for value in substrings.values]).tobytes()]
+    )
+
+
+def _index_sections(index: CatalogIndex) -> List[bytes]:
+    """Pack a finished CatalogIndex; MappedCatalogStore.catalog_index() reads the sections back in this order."""
+    sections: List[bytes] = []
+    for field in CatalogIndex.TOKEN_FIELDS:
+        sections += _id_table_sections(index.postings[field])
+    for field in CatalogIndex.SUBSTRING_FIELDS:
+        sections += _substring_sections(index.substrings[field])
+    sections += _id_table_sections(index.ids_by_year)
+    
+    fuzzy = index.fuzzy
+    sections += _string_sections(fuzzy.values)
+    sections += _id_table_sections(fuzzy.ids_by_value)
+    sections.append(array('i', fuzzy.gram_counts).tobytes())
+    sections += _id_table_sections(fuzzy.value_ids_by_trigram)
+    
+    for field in ('title', 'artist'):
+        sections += _substring_sections(index.lowercase[field])
+    sections += _id_table_sections(index.ids_by_mbid)
+    sections += _id_table_sections(index.ids_by_isrc)
+    
+    facets = index.facets
+    sections += _id_table_sections({_facet_key(key): ids for key, ids in facets._ids.items()})
+    bitset_size = (facets.size + 7) >> 3
+    sections += _table_sections({
+        _facet_key(key): bits.to_bytes(bitset_size, 'little') for key, bits in facets._bitsets.items()
+    })
+    
+    for column in (index.energy, index.valence):
+        sections.append(array('d', column.values).tobytes())
+        sections.append(array('i', column.ids).tobytes())
+    return sections
+
+
+def write_store(
+    store_path: str,
+    csv_path: str,
+    tracks: Iterable[Track],
+    checksum: Optional[Callable[[], bytes]] = None
+) -> None:
+    """
+    Write `tracks` (loaded from `csv_path`) as a memory-mappable store, atomically.
+    
+    Tracks are consumed in a single pass, so a streamed catalog never has to be
+    held as Track objects; only the packed columns are kept in memory. The
+    search index is then built from the rows just written and appended.
+    `checksum` returns the CSV digest computed while the tracks were read
+    (default: hash the file again).
+    """
+    offsets = {column: array('Q', [0]) for column in STRING_COLUMNS}
+    blobs = {column: bytearray() for column in STRING_COLUMNS}
+    ints = {column: array('q') for column in INT_COLUMNS}
+    floats = {column: array('d') for column in FLOAT_COLUMNS}
+    stems = bytearray()
+    clearance = bytearray()
+    hashes = array('Q')
+    
+    for track in tracks:
+        for column in STRING_COLUMNS:
+            blob = blobs[column]
+            blob += (getattr(track, column) or '').encode('utf-8')
+            offsets[column].append(len(blob))
+        for column in INT_COLUMNS:
+            value = getattr(track, column)
+            ints[column].append(_NO_INT if value is None else value)
+        for column in FLOAT_COLUMNS:
+            value = getattr(track, column)
+            floats[column].append(math.nan if value is None else value)
+        stems.append(bool(track.stems_available))
+        clearance.append(_CLEARANCE_CODES.index(ClearanceStatus(track.clearance_status).value))
+        hashes.append(_key_hash(track.buffet_track_id))
+    
+    sections: List[bytes] = []
+    for column in STRING_COLUMNS:
+        sections.append(offsets[column].tobytes())
+        sections.append(bytes(blobs[column]))
+    sections.extend(ints[column].tobytes() for column in INT_COLUMNS)
+    sections.extend(floats[column].tobytes() for column in FLOAT_COLUMNS)
+    sections.append(bytes(stems))
+    sections.append(bytes(clearance))
+    
+    # Open addressing with linear probing; slots hold row + 1 (0 = empty)
+    row_count = len(hashes)
+    ids_offsets, ids_blob = offsets['buffet_track_id'], blobs['buffet_track_id']
+    
+    def track_id(row: int) -> bytes:
+        return bytes(ids_blob[ids_offsets[row]:ids_offsets[row + 1]])
+    
+    slot_count = 1
+    while slot_count < 2 * row_count:
+        slot_count <<= 1
+    slots = array('Q', bytes(8 * slot_count))
+    mask = slot_count - 1
+    for row, key_hash in enumerate(hashes):
+        slot = key_hash & mask
+        # A repeated id replaces the earlier row, like the tracks_by_id dict
+        while slots[slot] and track_id(slots[slot] - 1) != track_id(row):
+            slot = (slot + 1) & mask
+        slots[slot] = row + 1
+    sections.append(slots.tobytes())
+    
+    source = os.stat(csv_path)
+    source_checksum = checksum() if checksum is not None else file_checksum(csv_path)
+    
+    def header(index_offset: int) -> bytes:
+        return _HEADER.pack(
+            STORE_MAGIC, STORE_VERSION, row_count, slot_count,
+            source.st_size, source.st_mtime_ns, source_checksum, index_offset
+        )
+    
+    # Lay sections out after the header and directory, 8-byte aligned
+    directory = _layout(sections, _HEADER.size + _DIRECTORY.size)
+    
+    target = Path(store_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(target.parent), prefix=target.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header(0))
+            f.write(_DIRECTORY.pack(*directory))
+            for data in sections:
+                f.write(_pad8(data))
+            f.flush()
+            
+            # Index the rows through the file just written, so tracks are built one at a time;
+            # the index sections follow their own directory (count, then offset/length pairs)
+            index_sections = _index_sections(CatalogIndex(MappedTrackList(MappedCatalogStore(tmp_path))))
+            index_offset = f.tell()
+            index_directory = _layout(index_sections, index_offset + 8 * (1 + 2 * len(index_sections)))
+            f.write(struct.pack(f"<{1 + len(index_directory)}Q", len(index_sections), *index_directory))
+            for data in index_sections:
+                f.write(_pad8(data))
+            f.seek(0)
+            f.write(header(index_offset))
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    logger.info(f"Wrote memory-mapped catalog store with {row_count} tracks to {store_path}")
+
+
+def _int32s(data: memoryview) -> memoryview:
+    return data.cast('i')
+
+
+def _bitset(data: memoryview) -> int:
+    return int.from_bytes(data, 'little')
+
+
+class MappedStrings(Sequence):
+    """Read-only list of strings stored as end offsets plus a UTF-8 blob."""
+    
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets.cast('Q')
+        self._blob = blob
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, row: int) -> str:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("string index out of range")
+        return str(self._blob[self._offsets[row]:self._offsets[row + 1]], 'utf-8')
+    
+    def __iter__(self) -> Iterator[str]:
+        offsets, blob = self._offsets, self._blob
+        for row in range(len(offsets) - 1):
+            yield str(blob[offsets[row]:offsets[row + 1]], 'utf-8')
+
+
+class MappedTable(Mapping):
+    """
+    Read-only str -> value mapping: sorted keys (binary search) and one packed value per key.
+    
+    `decode` turns a value's bytes into what lookups return, e.g. an int32
+    view of a posting list. Nothing is copied until a key is looked up.
+    """
+    
+    def __init__(self, keys: MappedStrings, offsets: memoryview, blob: memoryview, decode: Callable):
+        self._keys = keys
+        self._offsets = offsets.cast('Q')
+        self._blob = blob
+        self._decode = decode
+    
+    def _row(self, key) -> Optional[int]:
+        if not isinstance(key, str):
+            return None
+        row = bisect_left(self._keys, key)
+        if row < len(self._keys) and self._keys[row] == key:
+            return row
+        return None
+    
+    def __getitem__(self, key: str):
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        return self.value_at(row)
+    
+    def value_at(self, row: int):
+        """Value of the key at position `row` in sorted order."""
+        return self._decode(self._blob[self._offsets[row]:self._offsets[row + 1]])
+    
+    def __contains__(self, key) -> bool:
+        return self._row(key) is not None
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+
+class _FacetKeys:
+    """(facet, value) lookups in a MappedTable keyed by _facet_key(); FacetIndex queries only call get()."""
+    
+    def __init__(self, table: MappedTable):
+        self.table = table
+    
+    def get(self, key: Tuple[str, Hashable], default=None):
+        return self.table.get(_facet_key(key), default)
+
+
+class MappedSubstringIndex(SubstringIndex):
+    """SubstringIndex over store sections; matched values go straight to their posting lists."""
+    
+    def __init__(self, values: MappedStrings, ids_by_value: MappedTable, value_ids_by_trigram: MappedTable, table_rows: memoryview):
+        super().__init__()
+        self.values = values
+        self.ids_by_value = ids_by_value
+        self.value_ids_by_trigram = value_ids_by_trigram
+        self._table_rows = table_rows
+    
+    def ids_of(self, value_id: int) -> Sequence[int]:
+        return self.ids_by_value.value_at(self._table_rows[value_id])
+
+
+class _SectionReader:
+    """Hands out index sections in the order _index_sections() wrote them."""
+    
+    def __init__(self, sections: Iterable[memoryview]):
+        self._sections = iter(sections)
+    
+    def raw(self) -> memoryview:
+        return next(self._sections)
+    
+    def strings(self) -> MappedStrings:
+        return MappedStrings(self.raw(), self.raw())
+    
+    def table(self, decode: Callable) -> MappedTable:
+        return MappedTable(self.strings(), self.raw(), self.raw(), decode)
+    
+    def id_table(self) -> MappedTable:
+        return self.table(_int32s)
+    
+    def substrings(self) -> MappedSubstringIndex:
+        return MappedSubstringIndex(self.strings(), self.id_table(), self.id_table(), _int32s(self.raw()))
+    
+    def range(self) -> RangeIndex:
+        column = RangeIndex()
+        column.values = self.raw().cast('d')
+        column.ids = self.raw().cast('i')
+        return column
+
+
+class MappedCatalogStore:
+    """Read-only view over a store file written by write_store()."""
+    
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        with open(store_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        
+        (magic, version, self.row_count, self.slot_count, self.source_size,
+         self.source_mtime_ns, self.source_checksum, self.index_offset) = _HEADER.unpack_from(view)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f"Unsupported catalog store format in {store_path} (version {version})")
+        
+        directory = _DIRECTORY.unpack_from(view, _HEADER.size)
+        sections = [view[directory[i]:directory[i] + directory[i + 1]] for i in range(0, len(directory), 2)]
+        
+        self._strings = {}
+        for i, column in enumerate(STRING_COLUMNS):
+            self._strings[column] = MappedStrings(sections[2 * i], sections[2 * i + 1])
+        position = 2 * len(STRING_COLUMNS)
+        self._ints = {column: sections[position + i].cast('q') for i, column in enumerate(INT_COLUMNS)}
+        position += len(INT_COLUMNS)
+        self._floats = {column: sections[position + i].cast('d') for i, column in enumerate(FLOAT_COLUMNS)}
+        position += len(FLOAT_COLUMNS)
+        self._stems = sections[position]
+        self._clearance = sections[position + 1]
+        self._slots = sections[position + 2].cast('Q')
+    
+    def __len__(self) -> int:
+        return self.row_count
+    
+    def is_current(self, csv_path: str) -> bool:
+        """Whether the store was built from the current contents of `csv_path`."""
+        source = os.stat(csv_path)
+        if source.st_size != self.source_size:
+            return False
+        return source.st_mtime_ns == self.source_mtime_ns or file_checksum(csv_path) == self.source_checksum
+    
+    def string(self, column: str, row: int) -> str:
+        return self._strings[column][row]
+    
+    def find_row(self, buffet_track_id: str) -> Optional[int]:
+        """Row number of a buffet_track_id, or None."""
+        if not self.slot_count:
+            return None
+        mask = self.slot_count - 1
+        slot = _key_hash(buffet_track_id) & mask
+        while True:
+            entry = self._slots[slot]
+            if not entry:
+                return None
+            if self.string('buffet_track_id', entry - 1) == buffet_track_id:
+                return entry - 1
+            slot = (slot + 1) & mask
+    
+    def track_at(self, row: int) -> Track:
+        """Build the Track for a row (values were validated when the store was written)."""
+        data = {column: self.string(column, row) for column in STRING_COLUMNS}
+        for column in OPTIONAL_STRING_COLUMNS:
+            data[column] = data[column] or None
+        for column, values in self._ints.items():
+            value = values[row]
+            data[column] = None if value == _NO_INT else value
+        for column, values in self._floats.items():
+            value = values[row]
+            data[column] = None if math.isnan(value) else value
+        data['stems_available'] = bool(self._stems[row])
+        data['clearance_status'] = _CLEARANCE_CODES[self._clearance[row]]
+        return Track.model_construct(**data)
+    
+    def catalog_index(self, tracks: 'MappedTrackList', backend: str = 'python') -> CatalogIndex:
+        """
+        CatalogIndex over the index stored in the file, for `tracks` (a view of this store).
+        
+        Lookup structures are read in place; only the optional columnar copy
+        for the numpy backend is built in this process.
+        """
+        if not self.index_offset:
+            raise ValueError(f"Catalog store {self.store_path} has no search index")
+        (count,) = struct.unpack_from("<Q", self._view, self.index_offset)
+        directory = struct.unpack_from(f"<{2 * count}Q", self._view, self.index_offset + 8)
+        read = _SectionReader(
+            self._view[directory[i]:directory[i] + directory[i + 1]] for i in range(0, len(directory), 2)
+        )
+        
+        index = CatalogIndex(backend=backend, finish=False)
+        index.tracks = tracks
+        index.features = MappedFeatureList(tracks)
+        index.postings = {field: read.id_table() for field in CatalogIndex.TOKEN_FIELDS}
+        index.substrings = {field: read.substrings() for field in CatalogIndex.SUBSTRING_FIELDS}
+        index.ids_by_year = read.id_table()
+        
+        index.fuzzy = FuzzyIndex()
+        index.fuzzy.values = read.strings()
+        index.fuzzy.ids_by_value = read.id_table()
+        index.fuzzy.gram_counts = read.raw().cast('i')
+        index.fuzzy.value_ids_by_trigram = read.id_table()
+        
+        index.lowercase = {field: read.substrings() for field in ('title', 'artist')}
+        index.ids_by_mbid = read.id_table()
+        index.ids_by_isrc = read.id_table()
+        
+        index.facets = FacetIndex()
+        index.facets.size = self.row_count
+        index.facets._ids = _FacetKeys(read.id_table())
+        index.facets._bitsets = _FacetKeys(read.table(_bitset))
+        
+        index.energy = read.range()
+        index.valence = read.range()
+        index.build_columns()
+        if index.columns is None:
+            index.ranker = MappedRanker(index, self)
+        return index
+
+
+class MappedTrackList(Sequence):
+    """Lazy, read-only list of Tracks backed by a MappedCatalogStore."""
+    
+    def __init__(self, store: MappedCatalogStore, cache_size: int = 4096):
+        self.store = store
+        # Recently returned tracks, so hot results aren't rebuilt on every request
+        self._cache = LRUCache(maxsize=cache_size)
+    
+    def __len__(self) -> int:
+        return len(self.store)
+    
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("track index out of range")
+        track = self._cache.get(row)
+        if track is None:
+            track = self.store.track_at(row)
+            self._cache.set(row, track)
+        return track
+    
+    def __iter__(self) -> Iterator[Track]:
+        # Full scans (e.g. index builds) don't go through the cache
+        for row in range(len(self)):
+            yield self.store.track_at(row)
+
+
+class MappedRanker:
+    """
+    Scores a mapped index from its posting lists, mirroring SearchRanker.score_features.
+    
+    Each part of the score is looked up once per search as a set of rows (or
+    per-row counts) from the stored index, so scoring a row takes a few set
+    lookups and never builds its Track or TrackFeatures. Parts are added in
+    the same order with the same weights, so scores are the same floats.
+    """
+    
+    def __init__(self, index: CatalogIndex, store: MappedCatalogStore):
+        self.index = index
+        self.store = store
+        self._cleared = _CLEARANCE_CODES.index(ClearanceStatus.cleared.value)
+    
+    def _rows(self, *id_lists: Iterable[int]) -> Set[int]:
+        rows: Set[int] = set()
+        for ids in id_lists:
+            rows.update(ids)
+        return rows
+    
+    def score(self, track_ids: Iterable[int], query: QueryFeatures, request: SearchRequest) -> Iterator[Tuple[int, float]]:
+        """(track id, score) for each of `track_ids`."""
+        index = self.index
+        text = query.text
+        title, artist = index.substrings['title'], index.substrings['artist']
+        title_exact = self._rows(title.ids_by_value.get(text, ()))
+        artist_exact = self._rows(artist.ids_by_value.get(text, ()))
+        # Every value contains the empty string; None stands for "all rows"
+        title_partial = artist_partial = mood_partial = genre_partial = None
+        if text:
+            title_partial = title.find(text)
+            artist_partial = artist.find(text)
+            mood_partial = index.substrings['mood'].find(text)
+            genre_partial = index.substrings['genre'].find(text)
+        
+        # Per-row count of query tokens in each field (postings hold each track once per token)
+        overlap: Dict[str, Counter] = {field: Counter() for field in CatalogIndex.TOKEN_FIELDS}
+        for token in query.tokens:
+            for field, counts in overlap.items():
+                counts.update(index.postings[field].get(token, ()))
+        title_tokens, artist_tokens, album_tokens = overlap['title'], overlap['artist'], overlap['album']
+        tag_tokens, mood_tokens, genre_tokens = overlap['tags'], overlap['mood'], overlap['genre']
+        
+        years = self._rows(*(ids for year, ids in index.ids_by_year.items() if query.raw in year))
+        mood_boost = genre_boost = None
+        if query.moods is not None:
+            mood_boost = self._rows(*(index.substrings['mood'].ids_by_value.get(m, ()) for m in query.moods))
+        if query.genres is not None:
+            genre_boost = self._rows(*(index.substrings['genre'].ids_by_value.get(g, ()) for g in query.genres))
+        tag_boost = None
+        if query.tags is not None:
+            tag_boost = Counter()
+            for tag in query.tags:
+                tag_boost.update(index.facets.ids('tag', tag))
+        stems = self.store._stems if request.stems_required else None
+        clearance = self.store._clearance if request.clearance_required else None
+        cleared = self._cleared
+        
+        for row in track_ids:
+            score = 0.0
+            if row in title_exact:
+                score += 10.0
+            if row in artist_exact:
+                score += 8.0
+            if title_partial is None or row in title_partial:
+                score += 3.0
+            if artist_partial is None or row in artist_partial:
+                score += 2.5
+            score += title_tokens.get(row, 0) * 1.5
+            score += artist_tokens.get(row, 0) * 1.2
+            score += album_tokens.get(row, 0) * 0.5
+            score += tag_tokens.get(row, 0) * 2.0
+            if mood_partial is None or row in mood_partial:
+                score += 1.5
+            score += mood_tokens.get(row, 0) * 1.0
+            if genre_partial is None or row in genre_partial:
+                score += 1.5
+            score += genre_tokens.get(row, 0) * 1.0
+            if row in years:
+                score += 1.0
+            if mood_boost is not None and row in mood_boost:
+                score += 2.0
+            if genre_boost is not None and row in genre_boost:
+                score += 2.0
+            if tag_boost is not None:
+                score += tag_boost.get(row, 0) * 1.5
+            if stems is not None and not stems[row]:
+                score -= 5.0
+            if clearance is not None and clearance[row] != cleared:
+                score -= 5.0
+            yield row, score
+    
+    def rank(self, track_ids: Iterable[int], query: QueryFeatures, request: SearchRequest, limit: int) -> List[Tuple[int, float]]:
+        """Top `limit` (track id, score) pairs with a positive score, like SearchRanker._rank."""
+        return SearchRanker.top_k(self.score(track_ids, query, request), limit)
+
+
+class MappedFeatureList(Sequence):
+    """Lazy, read-only list of TrackFeatures for a MappedTrackList, derived per scored row."""
+    
+    def __init__(self, tracks: MappedTrackList, cache_size: int = 4096):
+        self.tracks = tracks
+        self._cache = LRUCache(maxsize=cache_size)
+    
+    def __len__(self) -> int:
+        return len(self.tracks)
+    
+    def __getitem__(self, row: int) -> TrackFeatures:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("track index out of range")
+        features = self._cache.get(row)
+        if features is None:
+            features = TrackFeatures(self.tracks[row])
+            self._cache.set(row, features)
+        return features
+    
+    def __iter__(self) -> Iterator[TrackFeatures]:
+        # Full scans (e.g. the columnar backend) don't go through the cache
+        for track in self.tracks:
+            yield TrackFeatures(track)
+
+
+class MappedTrackIndex(Mapping):
+    """Read-only buffet_track_id -> Track mapping backed by a MappedCatalogStore."""
+    
+    def __init__(self, tracks: MappedTrackList):
+        self.tracks = tracks
+    
+    def __getitem__(self, buffet_track_id: str) -> Track:
+        row = self.tracks.store.find_row(buffet_track_id)
+        if row is None:
+            raise KeyError(buffet_track_id)
+        return self.tracks[row]
+    
+    def __contains__(self, buffet_track_id) -> bool:
+        return isinstance(buffet_track_id, str) and self.tracks.store.find_row(buffet_track_id) is not None
+    
+    def __len__(self) -> int:
+        return len(self.tracks)
+    
+    def __iter__(self) -> Iterator[str]:
+        store = self.tracks.store
+        return (store.string('buffet_track_id', row) for row in range(len(store)))
+
+
+def open_store(
+    store_path: str,
+    csv_path: str,
+    load_tracks: Callable[[], Iterable[Track]],
+    checksum: Optional[Callable[[], bytes]] = None
+) -> MappedCatalogStore:
+    """
+    Map the store for `csv_path`, rebuilding it first if it is missing or stale.
+    
+    Args:
+        store_path: Store file shared by all workers
+        csv_path: Source catalog CSV
+        load_tracks: Parses the CSV; only called by the worker that rebuilds the store
+        checksum: CSV digest computed by `load_tracks` (see write_store)
+    """
+    store = _open_if_current(store_path, csv_path)
+    if store is not None:
+        return store
+    
+    # Serialize rebuilds across workers; whoever gets the lock second finds a current store
+    lock_path = f"{store_path}.lock"
+    Path(lock_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            store = _open_if_current(store_path, csv_path)
+            if store is None:
+                logger.info(f"Catalog store {store_path} is missing or stale; rebuilding from {csv_path}")
+                write_store(store_path, csv_path, load_tracks(), checksum)
+                store = MappedCatalogStore(store_path)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    return store
+
+
+def _open_if_current(store_path: str, csv_path: str) -> Optional[MappedCatalogStore]:
+    if not Path(store_path).exists():
+        return None
+    try:
+        store = MappedCatalogStore(store_path)
+    except (ValueError, struct.error, OSError) as e:
+        logger.warning(f"Failed to map catalog store {store_path}: {e}")
+        return None
+    return store if store.is_current(csv_path) else None
@@ -81,6 +81,10 @@ class SearchRequest(BaseModel):
 class ResolveRequest(BaseModel):
     """Model for resolve request parameters."""
     query: str = Field(description="Free-text query to resolve to canonical ID")
+    budget_ms: Optional[int] = Field(
+        default=None, ge=1, le=60000,
+        description="Latency budget; the best answer so far is returned when it runs out (e.g. 300 for voice)"
+    )
 
 
 class ResolveResponse(BaseModel):
@@ -90,8 +94,58 @@ class ResolveResponse(BaseModel):
     candidates: List[Track] = Field(default_factory=list, description="Alternative candidate matches")
     confidence: float = Field(description="Confidence score of the best match (0-1)")
     source: str = Field(description="Match source: 'internal' or 'musicbrainz'")
+    upgrade_pending: bool = Field(
+        default=False,
+        description="The budget ran out before MusicBrainz answered; the lookup finishes in the background and a repeat resolve gets its result"
+    )
     
     # Legacy fields for backwards compatibility
     canonical_id: Optional[str] = Field(default=None, description="Internal buffet_track_id if found")
     musicbrainz_id: Optional[str] = Field(default=None, description="MusicBrainz recording ID if found")
     matched_track: Optional[Track] = Field(default=None, description="Same as best_match (deprecated)")
+
+
+class BatchResolveRequest(BaseModel):
+    """Model for batch resolve request parameters."""
+    queries: List[str] = Field(min_length=1, description="Free-text queries to resolve (e.g. a cue sheet)")
+    stream: bool = Field(default=False, description="Stream items as NDJSON as they finish instead of one response")
+
+
+class BatchResolveItem(BaseModel):
+    """One resolved query of a batch."""
+    index: int = Field(description="Position of the query in the request")
+    result: ResolveResponse
+
+
+class BatchResolveResponse(BaseModel):
+    """Model for batch resolve response (results in request order)."""
+    results: List[ResolveResponse]
+    unique_queries: int = Field(description="Distinct queries after normalization")
+    external_lookups: int = Field(description="Distinct queries sent to MusicBrainz")
+
+
+class IngestRejection(BaseModel):
+    """A catalog CSV row that could not be loaded."""
+    line: int = Field(description="Line number in the CSV file (the header is line 1)")
+    track_id: Optional[str] = Field(default=None, description="buffet_track_id or legacy id of the row, if present")
+    reason: str = Field(description="Why the row was rejected")
+
+
+class IngestReport(BaseModel):
+    """Summary of a streaming catalog load."""
+    source: str = Field(description="Path of the CSV that was loaded")
+    rows_read: int = 0
+    rows_loaded: int = 0
+    rows_rejected: int = 0
+    duration_seconds: float = 0.0
+    rows_per_second: float = 0.0
+    peak_memory_mb: Optional[float] = Field(default=None, description="Peak resident memory of the process, if known")
+    rejections: List[IngestRejection] = Field(default_factory=list, description="Rejected rows (capped sample)")
+
+
+class CatalogDiff(BaseModel):
+    """Changes between two catalog generations, by buffet_track_id."""
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+    unchanged: int = 0
@@ -1,13 +1,162 @@
 import musicbrainzngs
+import httpx
+import asyncio
 import logging
+import threading
 import time
-from typing import Optional, Tuple, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple, List, Dict, Any, Sequence, Set
 from app.models import Track
-from app.cache import MusicBrainzCache
+from app.index import CatalogIndex, SubstringIndex
+from app.cache import MusicBrainzCache, LRUCache, SingleFlight, AsyncSingleFlight, NEGATIVE
+from app.ratelimit import TokenBucket, RateLimitTimeout
 
 logger = logging.getLogger(__name__)
 
 
+def _normalize_artist_credit(credits: List[Dict[str, Any]]) -> Tuple[List[Any], str]:
+    """JSON artist-credit -> musicbrainzngs form (credits interleaved with join phrases) and phrase."""
+    normalized: List[Any] = []
+    phrase = ''
+    for credit in credits:
+        artist = credit.get('artist', {})
+        entry = {'artist': {key: artist[key] for key in ('id', 'name', 'sort-name') if key in artist}}
+        if credit.get('name') and credit['name'] != artist.get('name'):
+            entry['name'] = credit['name']
+        normalized.append(entry)
+        phrase += credit.get('name') or artist.get('name', '')
+        if credit.get('joinphrase'):
+            normalized.append(credit['joinphrase'])
+            phrase += credit['joinphrase']
+    return normalized, phrase
+
+
+def normalize_recording(recording: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a recording from the MusicBrainz JSON web service into the shape
+    musicbrainzngs returns (which the cache and matching code expect).
+    """
+    normalized: Dict[str, Any] = {'id': recording.get('id', ''), 'title': recording.get('title', '')}
+    if 'score' in recording:
+        normalized['ext:score'] = str(recording['score'])
+    if recording.get('length') is not None:
+        normalized['length'] = str(recording['length'])
+    if recording.get('disambiguation'):
+        normalized['disambiguation'] = recording['disambiguation']
+    if recording.get('artist-credit'):
+        normalized['artist-credit'], normalized['artist-credit-phrase'] = _normalize_artist_credit(
+            recording['artist-credit']
+        )
+    if recording.get('releases'):
+        normalized['release-list'] = [
+            {key: release[key] for key in ('id', 'title', 'date', 'country', 'status') if key in release}
+            for release in recording['releases']
+        ]
+    if recording.get('isrcs'):
+        normalized['isrc-list'] = list(recording['isrcs'])
+    return normalized
+
+
+# Results per combined search (the web service maximum)
+BATCH_SEARCH_LIMIT = 100
+
+
+def lucene_phrase(text: str) -> str:
+    """Quote text as a Lucene phrase for a MusicBrainz search field."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _best_recording_for(recordings: List[dict], title: str, artist: str) -> Optional[dict]:
+    """Best scored recording with this title whose artist credit matches the artist."""
+    title = title.strip().lower()
+    artist = artist.strip().lower()
+    best = None
+    best_score = -1.0
+    for recording in recordings:
+        if recording.get('title', '').strip().lower() != title:
+            continue
+        credit = recording.get('artist-credit-phrase', '').strip().lower()
+        if not credit or (credit != artist and artist not in credit and credit not in artist):
+            continue
+        score = float(recording.get('ext:score', 0))
+        if score > best_score:
+            best, best_score = recording, score
+    return best
+
+
+def _isrcs(recordings: List[dict]) -> List[str]:
+    """ISRCs of the best (first) recording of a search."""
+    return list(recordings[0].get('isrc-list', [])) if recordings else []
+
+
+def _scan_catalog(catalog_tracks: Sequence[Track], title: str, artist: str) -> Tuple[Optional[Track], float]:
+    """Best (track, score) by lowercase title/artist: 5 for an exact match, 3 for a partial one."""
+    best_match = None
+    best_score = 0.0
+    
+    for track in catalog_tracks:
+        score = 0.0
+        track_title = track.title.lower()
+        track_artist = track.artist.lower()
+        
+        # Exact title match
+        if track_title == title:
+            score += 5.0
+        # Partial title match
+        elif title in track_title or track_title in title:
+            score += 3.0
+        
+        # Exact artist match
+        if track_artist == artist:
+            score += 5.0
+        # Partial artist match
+        elif artist in track_artist or track_artist in artist:
+            score += 3.0
+        
+        if score > best_score:
+            best_score = score
+            best_match = track
+    
+    return best_match, best_score
+
+
+def _field_scores(substrings: SubstringIndex, text: str) -> Dict[int, float]:
+    """Track id -> 5 (exact) or 3 (one contains the other) for one lowercase field."""
+    scores = dict.fromkeys(substrings.find(text), 3.0)
+    scores.update(dict.fromkeys(substrings.find_within(text), 3.0))
+    scores.update(dict.fromkeys(substrings.ids_by_value.get(text, ()), 5.0))
+    return scores
+
+
+def _indexed_catalog_match(index: CatalogIndex, title: str, artist: str) -> Tuple[Optional[int], float]:
+    """
+    Same result as _scan_catalog, from the index.
+    
+    A score above 5 needs both the title and the artist to match at least
+    partially, so only tracks found by both lookups are scored; ties go to
+    the first track in catalog order, as in the scan.
+    """
+    title_scores = _field_scores(index.lowercase['title'], title)
+    if not title_scores:
+        return None, 0.0
+    artist_scores = _field_scores(index.lowercase['artist'], artist)
+    
+    best_id, best_score = None, 0.0
+    for track_id, title_score in title_scores.items():
+        artist_score = artist_scores.get(track_id)
+        if artist_score is None:
+            continue
+        score = title_score + artist_score
+        if score > best_score or (score == best_score and track_id < best_id):
+            best_id, best_score = track_id, score
+    return best_id, best_score
+
+
+class MusicBrainzUnavailable(Exception):
+    """A lookup failed (API error, rate-limit timeout or a recent failure), as opposed to finding nothing."""
+
+
 class MusicBrainzService:
     """Service for interacting with MusicBrainz API with caching and rate limiting."""
     
@@ -17,7 +166,22 @@ class MusicBrainzService:
         app_version: str = "1.0",
         contact: str = "",
         rate_limit: float = 1.0,
-        cache_dir: str = "data/cache"
+        cache_dir: str = "data/cache",
+        base_url: str = "https://musicbrainz.org",
+        timeout: float = 10.0,
+        rate_burst: int = 1,
+        rate_state_path: Optional[str] = None,
+        rate_wait_timeout: Optional[float] = 30.0,
+        failure_ttl: float = 30.0,
+        memory_cache_entries: int = 2048,
+        memory_cache_bytes: Optional[int] = 32 * 1024 * 1024,
+        query_cache_ttl: Optional[float] = None,
+        mbid_cache_ttl: Optional[float] = None,
+        disk_cache_bytes: Optional[int] = None,
+        cache_backend: str = "files",
+        cache_sqlite_path: Optional[str] = None,
+        negative_cache_ttl: Optional[float] = None,
+        stale_grace: Optional[float] = None
     ):
         """
         Initialize MusicBrainz service.
@@ -28,62 +192,226 @@ class MusicBrainzService:
             contact: Contact email for MusicBrainz API
             rate_limit: Minimum seconds between API requests
             cache_dir: Directory for cache files
+            base_url: MusicBrainz server for the async client (e.g. a local fake in tests)
+            timeout: Seconds before an async request times out
+            rate_burst: Requests allowed back to back after an idle period
+            rate_state_path: Rate limiter state shared by all workers
+                (default: <cache_dir>/musicbrainz.ratelimit; "" keeps it per process)
+            rate_wait_timeout: Longest a lookup queues for a rate limit slot before giving up
+            failure_ttl: Seconds a failed lookup is answered as "no result" without calling the API again
+            memory_cache_entries: Results kept in memory in front of the disk cache (0 disables it)
+            memory_cache_bytes: Serialized size of the results kept in memory
+            query_cache_ttl: Seconds before a cached search expires (None = never)
+            mbid_cache_ttl: Seconds before a cached recording expires (None = never)
+            disk_cache_bytes: Total size of the cache files; least recently used are evicted (None = no limit)
+            cache_backend: Disk cache store, 'files' or 'sqlite'
+            cache_sqlite_path: SQLite cache database (default: <cache_dir>/musicbrainz.sqlite3)
+            negative_cache_ttl: Seconds a "no match" result is cached (None = same as a match)
+            stale_grace: Seconds past expiry a cached result is still served while it is
+                refreshed in the background (None = expired results are refetched inline)
         """
         musicbrainzngs.set_useragent(app_name, app_version, contact)
         self.rate_limit = rate_limit
-        self.last_request_time = 0.0
-        self.cache = MusicBrainzCache(cache_dir=cache_dir)
+        self.rate_wait_timeout = rate_wait_timeout
+        if rate_state_path is None:
+            rate_state_path = str(Path(cache_dir) / "musicbrainz.ratelimit")
+        # One budget for every thread, task and worker process using the same state file
+        self.rate_limiter = TokenBucket(
+            rate=1.0 / rate_limit if rate_limit > 0 else 0.0,
+            burst=rate_burst,
+            state_path=rate_state_path or None
+        )
+        self.cache = MusicBrainzCache(
+            cache_dir=cache_dir,
+            memory_max_entries=memory_cache_entries,
+            memory_max_bytes=memory_cache_bytes,
+            ttl_by_type={"query": query_cache_ttl, "mbid": mbid_cache_ttl},
+            disk_max_bytes=disk_cache_bytes,
+            backend=cache_backend,
+            sqlite_path=cache_sqlite_path,
+            negative_ttl=negative_cache_ttl,
+            stale_grace=stale_grace
+        )
+        
+        # Concurrent identical lookups share one API call; failed ones are
+        # remembered briefly so their waiters and retries don't hit the API again
+        self._flights = SingleFlight()
+        self._aflights = AsyncSingleFlight()
+        self.failure_ttl = failure_ttl
+        self._failures = LRUCache(maxsize=1024, ttl=failure_ttl)
+        
+        # Background refreshes of stale entries (at most one per key)
+        self._refreshing: Set[Tuple[str, str]] = set()
+        self._refresh_lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="musicbrainz-refresh")
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self.background_refreshes = 0
+        
+        # Async client (created on first use, reused for every request)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.user_agent = f"{app_name}/{app_version} ( {contact} )" if contact else f"{app_name}/{app_version}"
+        self._client: Optional[httpx.AsyncClient] = None
         logger.info(f"MusicBrainz service initialized with {rate_limit}s rate limit")
     
     def _enforce_rate_limit(self):
-        """Enforce rate limiting (1 req/sec default)."""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.rate_limit:
-            sleep_time = self.rate_limit - elapsed
-            logger.debug(f"Rate limiting: sleeping {sleep_time:.2f}s")
-            time.sleep(sleep_time)
-        self.last_request_time = time.time()
+        """Wait for a rate limit slot (1 req/sec default). Raises RateLimitTimeout past the deadline."""
+        self.rate_limiter.acquire(timeout=self.rate_wait_timeout)
+    
+    async def _aenforce_rate_limit(self):
+        """Awaitable version of _enforce_rate_limit (same shared budget)."""
+        await self.rate_limiter.aacquire(timeout=self.rate_wait_timeout)
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={'User-Agent': self.user_agent, 'Accept': 'application/json'},
+                timeout=self.timeout
+            )
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Stop background refreshes and close the async client's connections and the cache store."""
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        self._refresh_pool.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.cache.close()
+    
+    def _recent_failure(self, key: Tuple[str, str], what: str) -> bool:
+        """Whether the same lookup failed within the last `failure_ttl` seconds."""
+        if self._failures.get(key) is None:
+            return False
+        logger.info(f"Skipping MusicBrainz lookup for {what}: it failed within the last {self.failure_ttl:.0f}s")
+        return True
+    
+    def _refresh(self, key: Tuple[str, str], fetch: Callable[[], Any]) -> None:
+        """Refetch a stale entry in a background thread while callers are served the stale copy."""
+        if not self._start_refresh(key):
+            return
+        
+        def run():
+            try:
+                self._flights.do(key, fetch)
+            except Exception as e:
+                logger.warning(f"Background refresh of MusicBrainz {key[0]} '{key[1]}' failed: {e}")
+            finally:
+                self._finish_refresh(key)
+        
+        try:
+            self._refresh_pool.submit(run)
+        except RuntimeError:
+            # Shutting down
+            self._finish_refresh(key)
+    
+    def _arefresh(self, key: Tuple[str, str], fetch: Callable[[], Awaitable[Any]]) -> None:
+        """Async version of _refresh (runs as a task on the current event loop)."""
+        if not self._start_refresh(key):
+            return
+        task = asyncio.ensure_future(self._aflights.do(key, fetch))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(lambda done: self._finish_arefresh(key, done))
+    
+    def _start_refresh(self, key: Tuple[str, str]) -> bool:
+        # Don't retry upstream on every stale hit while it's failing
+        if self._failures.get(key) is not None:
+            return False
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.background_refreshes += 1
+        logger.info(f"Serving stale MusicBrainz {key[0]} '{key[1]}' while refreshing it")
+        return True
+    
+    def _finish_refresh(self, key: Tuple[str, str]) -> None:
+        with self._refresh_lock:
+            self._refreshing.discard(key)
+    
+    def _finish_arefresh(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        self._refresh_tasks.discard(task)
+        self._finish_refresh(key)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background refresh of MusicBrainz {key[0]} '{key[1]}' failed: {task.exception()}")
     
-    def search_recording(self, query: str, limit: int = 5) -> List[dict]:
+    def search_recording(self, query: str, limit: int = 5, raise_on_error: bool = False) -> List[dict]:
         """
         Search for recordings on MusicBrainz with caching.
         
+        Concurrent calls for the same query share one API request. "No match"
+        results are cached too, and a stale result is returned at once while
+        it is refreshed in the background.
+        
         Args:
             query: Free-text search query
             limit: Maximum number of results
+            raise_on_error: Raise MusicBrainzUnavailable instead of returning [] when the lookup fails
             
         Returns:
             List of recording dictionaries from MusicBrainz
         """
         # Check cache first
         cache_key = f"{query}::{limit}"
-        cached = self.cache.get(cache_key, cache_type="query")
-        if cached:
+        key = ("query", cache_key)
+        cached = self.cache.get_entry(cache_key, cache_type="query")
+        if cached is not None:
+            data, stale = cached
+            if stale:
+                self._refresh(key, lambda: self._fetch_recordings(query, limit, cache_key))
             logger.info(f"Cache HIT for query: {query}")
+            return data.get('recordings', [])
+        
+        if self._recent_failure(key, f"query '{query}'"):
+            return self._failed(raise_on_error, f"query '{query}' failed recently")
+        
+        try:
+            return self._flights.do(key, lambda: self._fetch_recordings(query, limit, cache_key))
+        except RateLimitTimeout as e:
+            logger.warning(f"MusicBrainz lookup skipped for query '{query}': {e}")
+            return self._failed(raise_on_error, str(e))
+        except Exception as e:
+            logger.error(f"MusicBrainz API error: {e}")
+            return self._failed(raise_on_error, str(e))
+    
+    @staticmethod
+    def _failed(raise_on_error: bool, reason: str) -> List[dict]:
+        if raise_on_error:
+            raise MusicBrainzUnavailable(reason)
+        return []
+    
+    def _fetch_recordings(self, query: str, limit: int, cache_key: str) -> List[dict]:
+        """Call the API for search_recording (run once per key by the single-flight group)."""
+        # A flight for this key may have finished between our cache miss and now
+        cached = self.cache.get(cache_key, cache_type="query")
+        if cached is not None:
             return cached.get('recordings', [])
         
-        # Cache miss - call API
         start_time = time.time()
         self._enforce_rate_limit()
-        
         try:
             result = musicbrainzngs.search_recordings(query=query, limit=limit)
-            recordings = result.get('recording-list', [])
-            elapsed = time.time() - start_time
-            logger.info(f"MusicBrainz API call took {elapsed:.2f}s for query: {query}")
-            
-            # Cache the result
-            self.cache.set(cache_key, {'recordings': recordings}, cache_type="query")
-            
-            return recordings
-        except Exception as e:
-            logger.error(f"MusicBrainz API error: {e}")
-            return []
+        except Exception:
+            self._failures.set(("query", cache_key), True)
+            raise
+        recordings = result.get('recording-list', [])
+        elapsed = time.time() - start_time
+        logger.info(f"MusicBrainz API call took {elapsed:.2f}s for query: {query}")
+        
+        # Cache the result (an empty one as a negative entry)
+        self.cache.set(cache_key, {'recordings': recordings}, cache_type="query", negative=not recordings)
+        
+        return recordings
     
     def get_recording_by_mbid(self, mbid: str) -> Optional[Dict[str, Any]]:
         """
         Get recording details by MusicBrainz ID with caching.
         
+        Concurrent calls for the same MBID share one API request. Unknown MBIDs
+        are cached as negative entries.
+        
         Args:
             mbid: MusicBrainz recording ID
             
@@ -91,29 +419,249 @@ class MusicBrainzService:
             Recording dict or None
         """
         # Check cache first
-        cached = self.cache.get(mbid, cache_type="mbid")
-        if cached:
+        key = ("mbid", mbid)
+        cached = self.cache.get_entry(mbid, cache_type="mbid")
+        if cached is not None:
+            data, stale = cached
+            if stale:
+                self._refresh(key, lambda: self._fetch_recording(mbid))
             logger.info(f"Cache HIT for MBID: {mbid}")
-            return cached
+            return None if data.get(NEGATIVE) else data
+        
+        if self._recent_failure(key, f"MBID {mbid}"):
+            return None
+        
+        try:
+            return self._flights.do(key, lambda: self._fetch_recording(mbid))
+        except RateLimitTimeout as e:
+            logger.warning(f"MusicBrainz lookup skipped for MBID {mbid}: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"MusicBrainz API error for MBID {mbid}: {e}")
+            return None
+    
+    def _fetch_recording(self, mbid: str) -> Optional[Dict[str, Any]]:
+        """Call the API for get_recording_by_mbid (run once per MBID by the single-flight group)."""
+        cached = self.cache.get(mbid, cache_type="mbid")
+        if cached is not None:
+            return None if cached.get(NEGATIVE) else cached
         
-        # Cache miss - call API
         start_time = time.time()
         self._enforce_rate_limit()
-        
         try:
             result = musicbrainzngs.get_recording_by_id(mbid, includes=['artists'])
-            recording = result.get('recording', {})
-            elapsed = time.time() - start_time
-            logger.info(f"MusicBrainz API call took {elapsed:.2f}s for MBID: {mbid}")
-            
-            # Cache the result
-            self.cache.set(mbid, recording, cache_type="mbid")
-            
-            return recording
-        except Exception as e:
+        except musicbrainzngs.ResponseError as e:
+            if getattr(e.cause, 'code', None) == 404:
+                self.cache.set(mbid, {}, cache_type="mbid", negative=True)
+                return None
+            self._failures.set(("mbid", mbid), True)
+            raise
+        except Exception:
+            self._failures.set(("mbid", mbid), True)
+            raise
+        recording = result.get('recording', {})
+        elapsed = time.time() - start_time
+        logger.info(f"MusicBrainz API call took {elapsed:.2f}s for MBID: {mbid}")
+        
+        # Cache the result
+        self.cache.set(mbid, recording, cache_type="mbid")
+        
+        return recording
+    
+    async def asearch_recording(self, query: str, limit: int = 5, raise_on_error: bool = False) -> List[dict]:
+        """Async version of search_recording (same cache, non-blocking HTTP and rate limiting)."""
+        # Check cache first
+        cache_key = f"{query}::{limit}"
+        key = ("query", cache_key)
+        cached = self.cache.get_entry(cache_key, cache_type="query")
+        if cached is not None:
+            data, stale = cached
+            if stale:
+                self._arefresh(key, lambda: self._afetch_recordings(query, limit, cache_key))
+            logger.info(f"Cache HIT for query: {query}")
+            return data.get('recordings', [])
+        
+        if self._recent_failure(key, f"query '{query}'"):
+            return self._failed(raise_on_error, f"query '{query}' failed recently")
+        
+        try:
+            return await self._aflights.do(key, lambda: self._afetch_recordings(query, limit, cache_key))
+        except RateLimitTimeout as e:
+            logger.warning(f"MusicBrainz lookup skipped for query '{query}': {e}")
+            return self._failed(raise_on_error, str(e))
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"MusicBrainz API error: {e}")
+            return self._failed(raise_on_error, str(e))
+    
+    async def _afetch_recordings(self, query: str, limit: int, cache_key: str) -> List[dict]:
+        """Async version of _fetch_recordings."""
+        cached = self.cache.get(cache_key, cache_type="query")
+        if cached is not None:
+            return cached.get('recordings', [])
+        
+        start_time = time.time()
+        await self._aenforce_rate_limit()
+        try:
+            response = await self._get_client().get(
+                '/ws/2/recording', params={'query': query, 'limit': limit, 'fmt': 'json'}
+            )
+            response.raise_for_status()
+            recordings = [normalize_recording(r) for r in response.json().get('recordings', [])]
+        except (httpx.HTTPError, ValueError):
+            self._failures.set(("query", cache_key), True)
+            raise
+        elapsed = time.time() - start_time
+        logger.info(f"MusicBrainz API call took {elapsed:.2f}s for query: {query}")
+        
+        # Cache the result (an empty one as a negative entry)
+        await self.cache.aset(cache_key, {'recordings': recordings}, cache_type="query", negative=not recordings)
+        
+        return recordings
+    
+    async def aget_recording_by_mbid(self, mbid: str) -> Optional[Dict[str, Any]]:
+        """Async version of get_recording_by_mbid."""
+        # Check cache first
+        key = ("mbid", mbid)
+        cached = self.cache.get_entry(mbid, cache_type="mbid")
+        if cached is not None:
+            data, stale = cached
+            if stale:
+                self._arefresh(key, lambda: self._afetch_recording(mbid))
+            logger.info(f"Cache HIT for MBID: {mbid}")
+            return None if data.get(NEGATIVE) else data
+        
+        if self._recent_failure(key, f"MBID {mbid}"):
+            return None
+        
+        try:
+            return await self._aflights.do(key, lambda: self._afetch_recording(mbid))
+        except RateLimitTimeout as e:
+            logger.warning(f"MusicBrainz lookup skipped for MBID {mbid}: {e}")
+            return None
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"MusicBrainz API error for MBID {mbid}: {e}")
             return None
     
+    async def _afetch_recording(self, mbid: str) -> Optional[Dict[str, Any]]:
+        """Async version of _fetch_recording."""
+        cached = self.cache.get(mbid, cache_type="mbid")
+        if cached is not None:
+            return None if cached.get(NEGATIVE) else cached
+        
+        start_time = time.time()
+        await self._aenforce_rate_limit()
+        try:
+            response = await self._get_client().get(
+                f'/ws/2/recording/{mbid}', params={'inc': 'artists', 'fmt': 'json'}
+            )
+            if response.status_code == 404:
+                await self.cache.aset(mbid, {}, cache_type="mbid", negative=True)
+                return None
+            response.raise_for_status()
+            recording = normalize_recording(response.json())
+        except (httpx.HTTPError, ValueError):
+            self._failures.set(("mbid", mbid), True)
+            raise
+        elapsed = time.time() - start_time
+        logger.info(f"MusicBrainz API call took {elapsed:.2f}s for MBID: {mbid}")
+        
+        # Cache the result
+        await self.cache.aset(mbid, recording, cache_type="mbid")
+        
+        return recording
+    
+    async def _asearch_batch(self, query: str) -> List[dict]:
+        """
+        Run one combined Lucene search (cached and coalesced like asearch_recording).
+        
+        Every recording returned is also cached as an MBID entry, so later
+        MBID lookups for them don't call the API.
+        
+        Raises:
+            RateLimitTimeout, httpx.HTTPError, ValueError: Unlike asearch_recording,
+                errors propagate so a batch job can stop and resume later
+        """
+        cache_key = f"{query}::{BATCH_SEARCH_LIMIT}"
+        cached = self.cache.get(cache_key, cache_type="query")
+        if cached is not None:
+            return cached.get('recordings', [])
+        
+        recordings = await self._aflights.do(
+            ("query", cache_key), lambda: self._afetch_recordings(query, BATCH_SEARCH_LIMIT, cache_key)
+        )
+        await self.cache.aset_many({r['id']: r for r in recordings if r.get('id')}, cache_type="mbid")
+        return recordings
+    
+    async def abatch_recordings_by_mbid(self, mbids: Sequence[str], batch_size: int = 25) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch many recordings by MBID, `batch_size` per request (rid:(a OR b ...)).
+        
+        Returns:
+            {mbid: recording} for the MBIDs found
+        """
+        found: Dict[str, Dict[str, Any]] = {}
+        pending = []
+        for mbid in dict.fromkeys(mbids):
+            cached = self.cache.get(mbid, cache_type="mbid")
+            if cached is not None:
+                if not cached.get(NEGATIVE):
+                    found[mbid] = cached
+            else:
+                pending.append(mbid)
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            wanted = set(chunk)
+            query = "rid:(" + " OR ".join(lucene_phrase(mbid) for mbid in chunk) + ")"
+            for recording in await self._asearch_batch(query):
+                if recording.get('id') in wanted:
+                    found[recording['id']] = recording
+        return found
+    
+    async def abatch_recordings_by_isrc(self, isrcs: Sequence[str], batch_size: int = 25) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Find recordings for many ISRCs, `batch_size` per request (isrc:(a OR b ...)).
+        
+        Returns:
+            {isrc: recordings with that ISRC, best score first} for the ISRCs found
+        """
+        found: Dict[str, List[Dict[str, Any]]] = {}
+        unique = list(dict.fromkeys(isrc.upper() for isrc in isrcs))
+        for start in range(0, len(unique), batch_size):
+            chunk = unique[start:start + batch_size]
+            wanted = set(chunk)
+            query = "isrc:(" + " OR ".join(lucene_phrase(isrc) for isrc in chunk) + ")"
+            for recording in await self._asearch_batch(query):
+                for isrc in recording.get('isrc-list', []):
+                    if isrc.upper() in wanted:
+                        found.setdefault(isrc.upper(), []).append(recording)
+        for recordings in found.values():
+            recordings.sort(key=lambda r: float(r.get('ext:score', 0)), reverse=True)
+        return found
+    
+    async def abatch_match(self, rows: Sequence[Tuple[str, str]], batch_size: int = 10) -> List[Optional[Dict[str, Any]]]:
+        """
+        Match many (title, artist) pairs, `batch_size` per request
+        ((recording:"t" AND artist:"a") OR ...).
+        
+        A pair matches a recording with the same title (case-insensitive)
+        whose artist credit equals or contains the artist; the best scored
+        one wins. Pairs crowded out of a combined result come back as None.
+        
+        Returns:
+            Best matching recording (or None) for each pair, in order
+        """
+        matches: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            query = " OR ".join(
+                f"(recording:{lucene_phrase(title)} AND artist:{lucene_phrase(artist)})" for title, artist in chunk
+            )
+            recordings = await self._asearch_batch(query)
+            for offset, (title, artist) in enumerate(chunk):
+                matches[start + offset] = _best_recording_for(recordings, title, artist)
+        return matches
+    
     def get_best_match(self, query: str) -> Optional[Tuple[str, str, str, float]]:
         """
         Get the best matching recording from MusicBrainz.
@@ -124,8 +672,13 @@ class MusicBrainzService:
         Returns:
             Tuple of (musicbrainz_id, title, artist, confidence) or None
         """
-        recordings = self.search_recording(query, limit=1)
-        
+        return self._best_match(self.search_recording(query, limit=1))
+    
+    async def aget_best_match(self, query: str) -> Optional[Tuple[str, str, str, float]]:
+        """Async version of get_best_match."""
+        return self._best_match(await self.asearch_recording(query, limit=1))
+    
+    def _best_match(self, recordings: List[dict]) -> Optional[Tuple[str, str, str, float]]:
         if not recordings:
             return None
         
@@ -145,60 +698,90 @@ class MusicBrainzService:
         
         return (mb_id, title, artist, confidence)
     
-    def match_to_catalog(self, query: str, catalog_tracks: List[Track]) -> Optional[Tuple[Track, float, str]]:
+    def match_to_catalog(
+        self,
+        query: str,
+        catalog_tracks: Sequence[Track],
+        index: Optional[CatalogIndex] = None,
+        raise_on_error: bool = False
+    ) -> Optional[Tuple[Track, float, str]]:
         """
         Try to match a MusicBrainz result to a track in the internal catalog.
         
         Args:
             query: Free-text search query
             catalog_tracks: List of tracks from internal catalog
+            index: Index built from `catalog_tracks`; makes the match cost independent of catalog size
+            raise_on_error: Raise MusicBrainzUnavailable when the lookup fails, so it isn't mistaken for no match
             
         Returns:
             Tuple of (matched_track, confidence, mbid) or None
         """
-        mb_match = self.get_best_match(query)
-        
+        recordings = self.search_recording(query, limit=1, raise_on_error=raise_on_error)
+        return self._match_to_catalog(self._best_match(recordings), catalog_tracks, index, _isrcs(recordings))
+    
+    async def amatch_to_catalog(
+        self,
+        query: str,
+        catalog_tracks: Sequence[Track],
+        index: Optional[CatalogIndex] = None,
+        raise_on_error: bool = False
+    ) -> Optional[Tuple[Track, float, str]]:
+        """Async version of match_to_catalog."""
+        recordings = await self.asearch_recording(query, limit=1, raise_on_error=raise_on_error)
+        return self._match_to_catalog(self._best_match(recordings), catalog_tracks, index, _isrcs(recordings))
+    
+    def _match_to_catalog(
+        self,
+        mb_match: Optional[Tuple[str, str, str, float]],
+        catalog_tracks: Sequence[Track],
+        index: Optional[CatalogIndex] = None,
+        isrcs: Sequence[str] = ()
+    ) -> Optional[Tuple[Track, float, str]]:
         if not mb_match:
             return None
         
         mb_id, mb_title, mb_artist, mb_confidence = mb_match
         
-        # Try to find a matching track in the catalog
-        best_match = None
-        best_score = 0.0
+        if index is not None:
+            # A catalog row that already carries the recording's MBID or ISRC
+            # is the same recording, whatever its title says
+            ids = index.ids_for_recording(mb_id, isrcs)
+            if ids:
+                return self._combined_match(index.tracks[min(ids)], 10.0, mb_confidence, mb_id)
         
-        for track in catalog_tracks:
-            score = 0.0
-            
-            # Exact title match
-            if track.title.lower() == mb_title.lower():
-                score += 5.0
-            # Partial title match
-            elif mb_title.lower() in track.title.lower() or track.title.lower() in mb_title.lower():
-                score += 3.0
-            
-            # Exact artist match
-            if track.artist.lower() == mb_artist.lower():
-                score += 5.0
-            # Partial artist match
-            elif mb_artist.lower() in track.artist.lower() or track.artist.lower() in mb_artist.lower():
-                score += 3.0
-            
-            if score > best_score:
-                best_score = score
-                best_match = track
+        if index is not None and mb_title and mb_artist:
+            best_id, best_score = _indexed_catalog_match(index, mb_title.lower(), mb_artist.lower())
+            best_match = index.tracks[best_id] if best_id is not None else None
+        else:
+            # An empty title or artist is a substring of every row; scan them all
+            best_match, best_score = _scan_catalog(catalog_tracks, mb_title.lower(), mb_artist.lower())
         
         if best_match and best_score > 5.0:  # Require at least one exact match
-            # Combine catalog match score with MusicBrainz confidence
-            combined_confidence = (best_score / 10.0) * 0.7 + mb_confidence * 0.3
-            return (best_match, min(combined_confidence, 1.0), mb_id)
+            return self._combined_match(best_match, best_score, mb_confidence, mb_id)
         
         return None
     
+    @staticmethod
+    def _combined_match(track: Track, score: float, mb_confidence: float, mb_id: str) -> Tuple[Track, float, str]:
+        # Combine catalog match score with MusicBrainz confidence
+        combined_confidence = (score / 10.0) * 0.7 + mb_confidence * 0.3
+        return (track, min(combined_confidence, 1.0), mb_id)
+    
     def clear_cache(self) -> int:
-        """Clear the MusicBrainz cache."""
+        """Clear the MusicBrainz cache (and remembered failures)."""
+        self._failures.clear()
         return self.cache.clear()
     
     def get_cache_status(self) -> Dict[str, Any]:
         """Get cache statistics."""
-        return self.cache.get_cache_status()
+        status = self.cache.get_cache_status()
+        status["api_calls"] = self._flights.calls + self._aflights.calls
+        status["coalesced_requests"] = self._flights.shared + self._aflights.shared
+        status["failure_entries"] = len(self._failures)
+        status["background_refreshes"] = self.background_refreshes
+        return status
+    
+    def get_rate_limit_status(self) -> Dict[str, Any]:
+        """Get rate limiter settings and queue wait metrics."""
+        return self.rate_limiter.get_status()
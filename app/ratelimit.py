@@ -0,0 +1,163 @@
+"""
+Token-bucket rate limiter shared by threads, asyncio tasks and processes.
+
+The bucket state (available tokens and the time they were counted) lives
+in a small file, and every update happens under an exclusive file lock.
+All workers on a host that use the same state file therefore share one
+budget. Without a state file, the bucket is shared by the threads and
+tasks of one process only.
+
+Callers don't poll. Each acquire reserves the next free slot under the
+lock and then sleeps until it arrives. Tokens may go negative, and
+negative tokens are the queue. Slots are handed out in the order callers
+reach the lock, which is first come, first served across processes. A
+caller whose slot is further away than its deadline takes nothing and
+gets RateLimitTimeout instead.
+"""
+
+from typing import Optional, Dict, Any
+from pathlib import Path
+import asyncio
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# tokens, updated_at (wall clock, so it means the same in every process)
+_STATE = struct.Struct("<dd")
+
+
+class RateLimitTimeout(Exception):
+    """Raised when the next free slot is further away than the caller's deadline."""
+    
+    def __init__(self, wait: float, timeout: float):
+        super().__init__(f"Rate limit slot is {wait:.2f}s away (deadline {timeout:.2f}s)")
+        self.wait = wait
+        self.timeout = timeout
+
+
+class TokenBucket:
+    """Token bucket with FIFO reservations and an optional cross-process state file."""
+    
+    def __init__(self, rate: float, burst: int = 1, state_path: Optional[str] = None):
+        """
+        Args:
+            rate: Tokens added per second (requests per second); 0 disables limiting
+            burst: Bucket capacity (requests allowed back to back after an idle period)
+            state_path: File holding the shared state; None keeps it in this process
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated_at = time.time()
+        
+        if state_path:
+            Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                logger.warning("File locking is unavailable; the rate limit is only shared within this process")
+        
+        # Metrics (this process)
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def _reserve_locked(self, state: Optional[bytes], timeout: Optional[float]):
+        """Take a slot from the given state (caller holds the locks). Returns (wait, new state or None)."""
+        now = time.time()
+        if state is not None and len(state) == _STATE.size:
+            tokens, updated_at = _STATE.unpack(state)
+        else:
+            tokens, updated_at = float(self.burst), now
+        
+        # Refill (a clock that went backwards adds nothing)
+        tokens = min(float(self.burst), tokens + max(0.0, now - updated_at) * self.rate)
+        wait = max(0.0, (1.0 - tokens) / self.rate)
+        if timeout is not None and wait > timeout:
+            return wait, None
+        return wait, _STATE.pack(tokens - 1.0, now)
+    
+    def reserve(self, timeout: Optional[float] = None) -> float:
+        """
+        Reserve the next slot without sleeping.
+        
+        Returns:
+            Seconds the caller must wait before making its request
+        
+        Raises:
+            RateLimitTimeout: If the slot is more than `timeout` seconds away
+        """
+        if self.rate <= 0:
+            return 0.0
+        
+        with self._lock:
+            if self.state_path and fcntl is not None:
+                wait, state = self._reserve_shared(timeout)
+            else:
+                wait, state = self._reserve_locked(_STATE.pack(self._tokens, self._updated_at), timeout)
+                if state is not None:
+                    self._tokens, self._updated_at = _STATE.unpack(state)
+            
+            if state is None:
+                self.timeouts += 1
+                raise RateLimitTimeout(wait, timeout)
+            
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return wait
+    
+    def _reserve_shared(self, timeout: Optional[float]):
+        fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                wait, state = self._reserve_locked(os.pread(fd, _STATE.size, 0), timeout)
+                if state is not None:
+                    os.pwrite(fd, state, 0)
+                return wait, state
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+    
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """Block until a slot is available. Returns the seconds waited."""
+        wait = self.reserve(timeout)
+        if wait > 0:
+            logger.debug(f"Rate limiting: sleeping {wait:.2f}s")
+            time.sleep(wait)
+        return wait
+    
+    async def aacquire(self, timeout: Optional[float] = None) -> float:
+        """Wait (without blocking the event loop) until a slot is available. Returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        # The reservation takes a thread lock and, when shared, a blocking file lock
+        wait = await asyncio.to_thread(self.reserve, timeout)
+        if wait > 0:
+            logger.debug(f"Rate limiting: waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+        return wait
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Rate limiter settings and queue wait metrics for this process."""
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "shared": bool(self.state_path and fcntl is not None),
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_wait_seconds": round(self.total_wait / self.acquired, 4) if self.acquired else 0.0,
+            "max_wait_seconds": round(self.max_wait, 4),
+        }
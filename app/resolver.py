@@ -3,15 +3,86 @@ Structured resolver pipeline for music queries.
 Tries internal catalog matching first, then falls back to MusicBrainz.
 """
 
-from typing import List, Tuple, Optional, Dict, Any
-from app.models import Track, ResolveResponse
+from typing import List, Tuple, Optional, Dict, Any, Sequence, AsyncIterator, Set
+from app.models import Track, ResolveResponse, BatchResolveItem, BatchResolveResponse
 from app.search import SearchRanker, SearchRequest
-from app.musicbrainz import MusicBrainzService
+from app.index import CatalogIndex, normalize_text, tokenize
+from app.catalog import MusicCatalog
+from app.musicbrainz import MusicBrainzService, MusicBrainzUnavailable
+from app.cache import LRUCache
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class ResolveResultCache:
+    """
+    LRU+TTL cache of ResolveResponses per normalized query.
+    
+    Keys include the CatalogIndex generation, so answers for a replaced
+    catalog are never served; the first lookup against a newer generation
+    also drops them. Lookups and stores for an older generation (e.g. a task
+    that captured the index before a reload) miss and are ignored, so they
+    never evict current answers. MusicBrainz-sourced answers get their own
+    TTL; answers degraded by a failed MusicBrainz lookup are never stored
+    (see ResolverService).
+    """
+    
+    def __init__(self, maxsize: int = 1024, internal_ttl: Optional[float] = 300.0, musicbrainz_ttl: Optional[float] = 3600.0):
+        """
+        Args:
+            maxsize: Maximum number of cached answers (0 disables the cache)
+            internal_ttl: Seconds an internal (or no-match) answer is kept (None = never expires)
+            musicbrainz_ttl: Seconds an answer found through MusicBrainz is kept (None = never expires)
+        """
+        self._cache = LRUCache(maxsize=maxsize, ttl=internal_ttl)
+        self.internal_ttl = internal_ttl
+        self.musicbrainz_ttl = musicbrainz_ttl
+        self._generation: Optional[int] = None
+        self.hits_by_source: Dict[str, int] = {}
+        self.invalidations = 0
+    
+    def _key(self, index: CatalogIndex, query: str) -> Optional[Tuple[int, str]]:
+        """Cache key, or None for an index older than the newest one seen."""
+        # Generations only grow (see app.index), so a lower one is a replaced catalog
+        if self._generation is None or index.generation > self._generation:
+            if self._generation is not None:
+                self.invalidations += 1
+                self._cache.clear()
+            self._generation = index.generation
+        elif index.generation < self._generation:
+            return None
+        return index.generation, normalize_text(query)
+    
+    def get(self, index: CatalogIndex, query: str) -> Optional[ResolveResponse]:
+        """Cached answer for `query`, with its `query` field set to this one."""
+        key = self._key(index, query)
+        response = self._cache.get(key) if key is not None else None
+        if response is None:
+            return None
+        self.hits_by_source[response.source] = self.hits_by_source.get(response.source, 0) + 1
+        return response.model_copy(update={"query": query})
+    
+    def set(self, index: CatalogIndex, query: str, response: ResolveResponse) -> None:
+        key = self._key(index, query)
+        if key is None:
+            return
+        ttl = self.musicbrainz_ttl if response.source == "musicbrainz" else self.internal_ttl
+        self._cache.set(key, response, ttl=ttl)
+    
+    def clear(self) -> int:
+        return self._cache.clear()
+    
+    def get_cache_status(self) -> Dict[str, Any]:
+        """Get cache statistics (hits/misses survive clears)."""
+        status = self._cache.get_cache_status()
+        status["ttl_seconds"] = {"internal": self.internal_ttl, "musicbrainz": self.musicbrainz_ttl}
+        status["hits_by_source"] = dict(self.hits_by_source)
+        status["invalidations"] = self.invalidations
+        return status
+
+
 class ResolverService:
     """
     Structured resolver that attempts internal matching before external APIs.
@@ -26,53 +97,126 @@ class ResolverService:
     HIGH_CONFIDENCE = 0.8
     MEDIUM_CONFIDENCE = 0.5
     LOW_CONFIDENCE = 0.3
+    # Minimum edit similarity for a fuzzy (misspelled) internal match
+    FUZZY_MIN_SIMILARITY = 0.75
+    # Budgeted resolves start MusicBrainz before the internal match when fewer
+    # than this share of the query's words occur in catalog titles/artists/albums
+    SPECULATIVE_KNOWN_WORDS = 0.5
+    # Distinct queries of a batch matched per worker-thread hop
+    BATCH_INTERNAL_CHUNK = 16
     
     def __init__(
         self,
-        catalog_tracks: List[Track],
-        musicbrainz_service: Optional[MusicBrainzService] = None
+        catalog_tracks: Optional[List[Track]] = None,
+        musicbrainz_service: Optional[MusicBrainzService] = None,
+        catalog_index: Optional[CatalogIndex] = None,
+        catalog: Optional[MusicCatalog] = None,
+        cache_size: int = 1024,
+        cache_internal_ttl: Optional[float] = 300.0,
+        cache_musicbrainz_ttl: Optional[float] = 3600.0
     ):
-        self.catalog_tracks = catalog_tracks
+        """
+        Args:
+            catalog_tracks: Fixed track list to resolve against (ignored when `catalog` is given)
+            musicbrainz_service: Optional MusicBrainz fallback
+            catalog_index: Prebuilt index for `catalog_tracks`
+            catalog: Live catalog; every resolve reads its current generation, so reloads need no patching
+            cache_size: Resolved answers kept in memory (0 disables the cache)
+            cache_internal_ttl: Seconds an internal answer is cached (None = until the catalog changes)
+            cache_musicbrainz_ttl: Seconds a MusicBrainz-sourced answer is cached (None = until the catalog changes)
+        """
+        self.catalog = catalog
         self.musicbrainz_service = musicbrainz_service
+        self.catalog_tracks = catalog_tracks if catalog_tracks is not None else []
+        self.catalog_index = None
+        if catalog is None:
+            # Reuse the catalog's prebuilt index when available
+            self.catalog_index = catalog_index if catalog_index is not None else CatalogIndex(self.catalog_tracks)
+        # Voice sessions re-resolve the same song several times in one conversation
+        self.cache = ResolveResultCache(cache_size, cache_internal_ttl, cache_musicbrainz_ttl)
+        
+        # MusicBrainz lookups that outlived their budgeted resolve
+        self._background: Set[asyncio.Task] = set()
+        self.speculative_lookups = 0
+        self.budget_timeouts = 0
+        self.background_upgrades = 0
     
-    def _internal_match(self, query: str, limit: int = 5) -> Tuple[Optional[Track], List[Track], float]:
+    def _catalog_view(self) -> Tuple[Sequence[Track], CatalogIndex]:
+        """Tracks and index from the same catalog generation."""
+        if self.catalog is not None:
+            generation = self.catalog.current
+            return generation.tracks, generation.index
+        return self.catalog_tracks, self.catalog_index
+    
+    def _internal_match(
+        self,
+        query: str,
+        limit: int = 5,
+        view: Optional[Tuple[Sequence[Track], CatalogIndex]] = None
+    ) -> Tuple[Optional[Track], List[Track], float]:
         """
         Attempt to match query against internal catalog.
         
+        Args:
+            query: Free-text query
+            limit: Best match plus candidates to return
+            view: Tracks and index to match against (default: the current generation)
+        
         Returns:
             Tuple of (best_match, candidates, confidence)
         """
         # Use search ranking to find matches
         search_request = SearchRequest(query=query, limit=limit)
-        results = SearchRanker.search_tracks(self.catalog_tracks, search_request)
+        tracks, index = view or self._catalog_view()
+        results = SearchRanker.search_tracks(tracks, search_request, index=index)
         
-        if not results:
-            return None, [], 0.0
+        best_match, candidates, confidence = None, [], 0.0
+        if results:
+            # Best match is highest scored
+            best_match = results[0].track
+            candidates = [r.track for r in results[1:]]
+            
+            # Normalize score to 0-1 confidence
+            # Scores can vary widely, so we use a logarithmic-ish approach
+            # A score of 10+ is very high confidence
+            confidence = min(results[0].score / 12.0, 1.0)
         
-        # Best match is highest scored
-        best_result = results[0]
-        candidates = [r.track for r in results[1:]]
+        # Exact tokens miss misspellings ("bohemian rapsody"); try the trigram index
+        if confidence < self.MEDIUM_CONFIDENCE:
+            fuzzy = index.fuzzy_match(normalize_text(query), limit)
+            if fuzzy and fuzzy[0][1] >= self.FUZZY_MIN_SIMILARITY and fuzzy[0][1] > confidence:
+                best_match = tracks[fuzzy[0][0]]
+                candidates = [tracks[track_id] for track_id, _ in fuzzy[1:]]
+                confidence = fuzzy[0][1]
+                logger.info(f"Fuzzy match for '{query}' (similarity {confidence:.2f})")
         
-        # Normalize score to 0-1 confidence
-        # Scores can vary widely, so we use a logarithmic-ish approach
-        # A score of 10+ is very high confidence
-        confidence = min(best_result.score / 12.0, 1.0)
+        if best_match is None:
+            return None, [], 0.0
         
-        logger.info(f"Internal match for '{query}': {best_result.track.title} by {best_result.track.artist} (confidence: {confidence:.2f})")
+        logger.info(f"Internal match for '{query}': {best_match.title} by {best_match.artist} (confidence: {confidence:.2f})")
         
-        return best_result.track, candidates, confidence
+        return best_match, candidates, confidence
     
-    def _external_match(self, query: str) -> Tuple[Optional[Track], List[Track], float, Optional[str]]:
+    def _external_match(
+        self,
+        query: str,
+        view: Optional[Tuple[Sequence[Track], CatalogIndex]] = None
+    ) -> Optional[Tuple[Optional[Track], List[Track], float, Optional[str]]]:
         """
         Attempt to match query using MusicBrainz.
         
         Returns:
-            Tuple of (best_match, candidates, confidence, mbid)
+            Tuple of (best_match, candidates, confidence, mbid), or None if
+            MusicBrainz could not be asked (an error or rate-limit timeout)
         """
         if not self.musicbrainz_service:
             return None, [], 0.0, None
         
-        result = self.musicbrainz_service.match_to_catalog(query, self.catalog_tracks)
+        tracks, index = view or self._catalog_view()
+        try:
+            result = self.musicbrainz_service.match_to_catalog(query, tracks, index=index, raise_on_error=True)
+        except MusicBrainzUnavailable:
+            return None
         
         if not result:
             logger.info(f"External match (MusicBrainz) found nothing for '{query}'")
@@ -85,6 +229,31 @@ class ResolverService:
         # No candidates from MusicBrainz single match
         return track, [], confidence, mbid
     
+    async def _aexternal_match(
+        self,
+        query: str,
+        view: Optional[Tuple[Sequence[Track], CatalogIndex]] = None
+    ) -> Optional[Tuple[Optional[Track], List[Track], float, Optional[str]]]:
+        """Async version of _external_match (doesn't block the event loop)."""
+        if not self.musicbrainz_service:
+            return None, [], 0.0, None
+        
+        tracks, index = view or self._catalog_view()
+        try:
+            result = await self.musicbrainz_service.amatch_to_catalog(query, tracks, index=index, raise_on_error=True)
+        except MusicBrainzUnavailable:
+            return None
+        
+        if not result:
+            logger.info(f"External match (MusicBrainz) found nothing for '{query}'")
+            return None, [], 0.0, None
+        
+        track, confidence, mbid = result
+        
+        logger.info(f"External match for '{query}': {track.title} by {track.artist} (confidence: {confidence:.2f}, MBID: {mbid})")
+        
+        return track, [], confidence, mbid
+    
     def resolve(self, query: str) -> ResolveResponse:
         """
         Resolve a query to a track using the structured pipeline.
@@ -102,8 +271,260 @@ class ResolverService:
         """
         logger.info(f"Resolving query: '{query}'")
         
+        view = self._catalog_view()
+        cached = self.cache.get(view[1], query)
+        if cached is not None:
+            return cached
+        
         # Step 1: Internal match
-        internal_track, internal_candidates, internal_confidence = self._internal_match(query)
+        internal = self._internal_match(query, view=view)
+        
+        external = None
+        if self._needs_external(internal[2]):
+            logger.info(f"Internal confidence {internal[2]:.2f} < {self.MEDIUM_CONFIDENCE}, trying MusicBrainz")
+            external = self._external_match(query, view=view)
+            if external is None:
+                # Degraded by a failed lookup; don't cache it past MusicBrainz's recovery
+                return self._build_response(query, internal, None)
+        
+        response = self._build_response(query, internal, external)
+        self.cache.set(view[1], query, response)
+        return response
+    
+    async def aresolve(self, query: str) -> ResolveResponse:
+        """
+        Async version of resolve for use in request handlers.
+        
+        The internal match is in-memory; the MusicBrainz fallback is awaited,
+        so other requests keep being served while it waits on the network.
+        """
+        logger.info(f"Resolving query: '{query}'")
+        
+        view = self._catalog_view()
+        cached = self.cache.get(view[1], query)
+        if cached is not None:
+            return cached
+        
+        internal = self._internal_match(query, view=view)
+        
+        external = None
+        if self._needs_external(internal[2]):
+            logger.info(f"Internal confidence {internal[2]:.2f} < {self.MEDIUM_CONFIDENCE}, trying MusicBrainz")
+            external = await self._aexternal_match(query, view=view)
+            if external is None:
+                # Degraded by a failed lookup; don't cache it past MusicBrainz's recovery
+                return self._build_response(query, internal, None)
+        
+        response = self._build_response(query, internal, external)
+        self.cache.set(view[1], query, response)
+        return response
+    
+    async def aiter_resolve_batch(
+        self,
+        queries: Sequence[str],
+        concurrency: int = 4,
+        stats: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[BatchResolveItem]:
+        """
+        Resolve many queries, yielding each one's result as soon as it is known.
+        
+        Queries that normalize to the same text are resolved once. Every
+        distinct query is matched internally first, all against one catalog
+        generation, and confident matches are yielded right away. Only the
+        rest go to MusicBrainz, at most `concurrency` at a time (all of them
+        still queue on the service's rate limiter), and are yielded in the
+        order they finish. Answers already in the resolve cache are reused.
+        
+        Args:
+            queries: Free-text queries
+            concurrency: MusicBrainz fallbacks in flight at once
+            stats: Optional dict that receives unique_queries and external_lookups
+        """
+        groups: Dict[str, List[int]] = {}
+        for position, query in enumerate(queries):
+            groups.setdefault(normalize_text(query), []).append(position)
+        view = self._catalog_view()
+        
+        def items(positions: List[int], response: ResolveResponse) -> List[BatchResolveItem]:
+            return [
+                BatchResolveItem(index=position, result=response.model_copy(update={"query": queries[position]}))
+                for position in positions
+            ]
+        
+        # Internal pass over every distinct query, a chunk at a time in a worker
+        # thread so a long cue sheet doesn't hold up other requests on the loop
+        pending = []
+        misses = []
+        for positions in groups.values():
+            response = self.cache.get(view[1], queries[positions[0]])
+            if response is None:
+                misses.append(positions)
+                continue
+            for item in items(positions, response):
+                yield item
+        
+        for start in range(0, len(misses), self.BATCH_INTERNAL_CHUNK):
+            chunk = misses[start:start + self.BATCH_INTERNAL_CHUNK]
+            matches = await asyncio.to_thread(
+                lambda: [self._internal_match(queries[positions[0]], view=view) for positions in chunk]
+            )
+            for positions, internal in zip(chunk, matches):
+                if self._needs_external(internal[2]):
+                    pending.append((positions, internal))
+                    continue
+                query = queries[positions[0]]
+                response = self._build_response(query, internal, None)
+                self.cache.set(view[1], query, response)
+                for item in items(positions, response):
+                    yield item
+        
+        if stats is not None:
+            stats["unique_queries"] = len(groups)
+            stats["external_lookups"] = len(pending)
+        logger.info(
+            f"Batch resolve: {len(queries)} queries, {len(groups)} unique, "
+            f"{len(pending)} sent to MusicBrainz"
+        )
+        if not pending:
+            return
+        
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def external(positions: List[int], internal):
+            async with semaphore:
+                return positions, internal, await self._aexternal_match(queries[positions[0]], view=view)
+        
+        tasks = [asyncio.ensure_future(external(positions, internal)) for positions, internal in pending]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                positions, internal, external_result = await finished
+                response = self._build_response(queries[positions[0]], internal, external_result)
+                if external_result is not None:
+                    self.cache.set(view[1], queries[positions[0]], response)
+                for item in items(positions, response):
+                    yield item
+        finally:
+            # The consumer went away (e.g. a streaming client disconnected)
+            for task in tasks:
+                task.cancel()
+    
+    async def aresolve_batch(self, queries: Sequence[str], concurrency: int = 4) -> BatchResolveResponse:
+        """Resolve many queries (see aiter_resolve_batch). Results are in input order."""
+        stats: Dict[str, int] = {}
+        results: List[Optional[ResolveResponse]] = [None] * len(queries)
+        async for item in self.aiter_resolve_batch(queries, concurrency, stats):
+            results[item.index] = item.result
+        return BatchResolveResponse(results=results, **stats)
+    
+    async def aresolve_within(self, query: str, budget: float) -> ResolveResponse:
+        """
+        Resolve with a latency budget (seconds), for the voice path.
+        
+        Queries that look like misses start their MusicBrainz lookup
+        before the internal match instead of after it. If MusicBrainz has
+        not answered when the budget runs out, the internal answer is
+        returned with `upgrade_pending` set, and the lookup carries on in
+        the background; its answer is cached for the next resolve.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget
+        
+        view = self._catalog_view()
+        cached = self.cache.get(view[1], query)
+        if cached is not None:
+            return cached
+        
+        external_task = None
+        if self.musicbrainz_service is not None and self._likely_miss(query, view[1]):
+            self.speculative_lookups += 1
+            external_task = asyncio.ensure_future(self._aexternal_match(query, view=view))
+            # Let it send its request before the (synchronous) internal match runs
+            await asyncio.sleep(0)
+        
+        internal = self._internal_match(query, view=view)
+        if not self._needs_external(internal[2]):
+            if external_task is not None:
+                # Not needed after all; let it finish to warm the MusicBrainz cache
+                self._run_in_background(external_task)
+            response = self._build_response(query, internal, None)
+            self.cache.set(view[1], query, response)
+            return response
+        
+        if external_task is None:
+            external_task = asyncio.ensure_future(self._aexternal_match(query, view=view))
+        try:
+            external = await asyncio.wait_for(asyncio.shield(external_task), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.budget_timeouts += 1
+            logger.info(f"Resolve budget of {budget:.3f}s ran out for '{query}'; MusicBrainz continues in the background")
+            self._run_in_background(external_task, query, internal, view)
+            # Not cached, so the next resolve picks up the upgrade
+            return self._build_response(query, internal, None).model_copy(update={"upgrade_pending": True})
+        
+        response = self._build_response(query, internal, external)
+        if external is not None:
+            self.cache.set(view[1], query, response)
+        return response
+    
+    def _likely_miss(self, query: str, index: CatalogIndex) -> bool:
+        """Whether too few of the query's words occur in catalog titles, artists or albums."""
+        words = tokenize(query)
+        if not words:
+            return False
+        known = sum(
+            1 for word in words
+            if any(word in index.postings[field] for field in ('title', 'artist', 'album'))
+        )
+        return known < len(words) * self.SPECULATIVE_KNOWN_WORDS
+    
+    def _run_in_background(
+        self,
+        task: asyncio.Task,
+        query: Optional[str] = None,
+        internal: Optional[Tuple[Optional[Track], List[Track], float]] = None,
+        view: Optional[Tuple[Sequence[Track], CatalogIndex]] = None
+    ) -> None:
+        """Keep a MusicBrainz lookup running; with a query, cache the answer it completes."""
+        self._background.add(task)
+        
+        def finished(task: asyncio.Task) -> None:
+            self._background.discard(task)
+            if task.cancelled() or task.exception() is not None:
+                return
+            if query is not None and task.result() is not None:
+                self.background_upgrades += 1
+                self.cache.set(view[1], query, self._build_response(query, internal, task.result()))
+        
+        task.add_done_callback(finished)
+    
+    async def aclose(self) -> None:
+        """Cancel MusicBrainz lookups still running in the background."""
+        tasks = list(self._background)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def get_budget_status(self) -> Dict[str, int]:
+        """Counters of budgeted resolves (aresolve_within)."""
+        return {
+            "speculative_lookups": self.speculative_lookups,
+            "budget_timeouts": self.budget_timeouts,
+            "background_upgrades": self.background_upgrades,
+            "background_lookups": len(self._background),
+        }
+    
+    def _needs_external(self, internal_confidence: float) -> bool:
+        """Whether the MusicBrainz fallback should be tried."""
+        return internal_confidence < self.MEDIUM_CONFIDENCE and self.musicbrainz_service is not None
+    
+    def _build_response(
+        self,
+        query: str,
+        internal: Tuple[Optional[Track], List[Track], float],
+        external: Optional[Tuple[Optional[Track], List[Track], float, Optional[str]]]
+    ) -> ResolveResponse:
+        """Pick between the internal and (optional) external match."""
+        internal_track, internal_candidates, internal_confidence = internal
         
         # Step 2: If internal confidence is medium-high, use it
         if internal_confidence >= self.MEDIUM_CONFIDENCE:
@@ -120,9 +541,8 @@ class ResolverService:
             )
         
         # Step 3: Try MusicBrainz if enabled and internal confidence is low
-        if self.musicbrainz_service:
-            logger.info(f"Internal confidence {internal_confidence:.2f} < {self.MEDIUM_CONFIDENCE}, trying MusicBrainz")
-            external_track, _, external_confidence, mbid = self._external_match(query)
+        if external is not None:
+            external_track, _, external_confidence, mbid = external
             
             # Use external match if it has higher confidence
             if external_track and external_confidence > internal_confidence:
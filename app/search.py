@@ -1,30 +1,98 @@
-from typing import List, Tuple, Optional, Set
+from typing import List, Tuple, Optional, FrozenSet, Set, Iterable, Hashable, Dict, Any
 from app.models import Track, TrackSearchResult, SearchRequest, ClearanceStatus
-import re
+from app.index import CatalogIndex, TrackFeatures, normalize_text, tokenize, ids_to_bitset, bitset_to_ids
+from app.cache import LRUCache
+import heapq
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class QueryFeatures:
+    """Normalized representation of a SearchRequest, computed once per search."""
+
+    __slots__ = ('raw', 'text', 'tokens', 'moods', 'genres', 'tags')
+
+    def __init__(self, request: SearchRequest):
+        self.raw = request.query
+        self.text = normalize_text(request.query)
+        self.tokens = frozenset(self.text.split())
+        self.moods: Optional[FrozenSet[str]] = (
+            frozenset(normalize_text(m) for m in request.moods) if request.moods else None
+        )
+        self.genres: Optional[FrozenSet[str]] = (
+            frozenset(normalize_text(g) for g in request.genres) if request.genres else None
+        )
+        self.tags: Optional[FrozenSet[str]] = (
+            frozenset(normalize_text(t) for t in request.tags) if request.tags else None
+        )
+
+
+class SearchResultCache:
+    """
+    LRU+TTL cache of ranked (track id, score) lists per canonical SearchRequest.
+    
+    Keys include the CatalogIndex generation, so entries for a replaced
+    catalog can never be served; clear() additionally frees them on reload.
+    """
+    
+    # The year match is the only place the raw query is used; it can only
+    # succeed for queries made of digits and '-' (or the empty query)
+    _YEAR_CHARS = '0123456789-'
+    
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300.0):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+    
+    @classmethod
+    def canonical_key(cls, request: SearchRequest) -> Hashable:
+        """Key that is equal for requests that always produce the same results."""
+        query = QueryFeatures(request)
+        year_probe = request.query if not request.query.strip(cls._YEAR_CHARS) else None
+        
+        def facet(values: Optional[FrozenSet[str]]) -> Optional[Tuple[str, ...]]:
+            return tuple(sorted(values)) if values is not None else None
+        
+        return (
+            query.text,
+            year_probe,
+            facet(query.moods),
+            facet(query.genres),
+            facet(query.tags),
+            request.min_energy,
+            request.max_energy,
+            request.min_valence,
+            request.max_valence,
+            bool(request.stems_required),
+            bool(request.clearance_required),
+            request.limit,
+        )
+    
+    def get(self, index: CatalogIndex, request: SearchRequest) -> Optional[List[Tuple[int, float]]]:
+        return self._cache.get((index.generation, self.canonical_key(request)))
+    
+    def set(self, index: CatalogIndex, request: SearchRequest, ranked: List[Tuple[int, float]]) -> None:
+        self._cache.set((index.generation, self.canonical_key(request)), tuple(ranked))
+    
+    def clear(self) -> int:
+        return self._cache.clear()
+    
+    def get_cache_status(self) -> Dict[str, Any]:
+        """Get cache statistics (hits/misses survive clears)."""
+        return self._cache.get_cache_status()
+
+
 class SearchRanker:
     """Advanced ranking system for track search with filters and boosts."""
     
     @staticmethod
     def normalize_text(text: str) -> str:
         """Normalize text for matching: lowercase, strip punctuation, trim."""
-        # Convert to lowercase
-        text = text.lower()
-        # Remove punctuation but keep spaces
-        text = re.sub(r'[^\w\s]', '', text)
-        # Normalize whitespace
-        text = ' '.join(text.split())
-        return text
+        return normalize_text(text)
     
     @staticmethod
-    def tokenize(text: str) -> Set[str]:
+    def tokenize(text: str) -> FrozenSet[str]:
         """Tokenize normalized text into words."""
-        normalized = SearchRanker.normalize_text(text)
-        return set(normalized.split())
+        return tokenize(text)
     
     @staticmethod
     def passes_filters(track: Track, request: SearchRequest) -> bool:
@@ -32,27 +100,36 @@ class SearchRanker:
         Check if track passes all filter criteria.
         Returns True if track should be included in results.
         """
+        return SearchRanker.features_pass_filters(track, TrackFeatures(track), QueryFeatures(request), request)
+    
+    @staticmethod
+    def features_pass_filters(
+        track: Track,
+        features: TrackFeatures,
+        query: QueryFeatures,
+        request: SearchRequest
+    ) -> bool:
+        """Filter check against a track's precomputed features."""
         # Mood filter
-        if request.moods:
-            normalized_moods = [SearchRanker.normalize_text(m) for m in request.moods]
-            track_mood = SearchRanker.normalize_text(track.mood)
-            if track_mood not in normalized_moods:
-                return False
+        if query.moods is not None and features.mood not in query.moods:
+            return False
         
         # Genre filter
-        if request.genres:
-            normalized_genres = [SearchRanker.normalize_text(g) for g in request.genres]
-            track_genre = SearchRanker.normalize_text(track.genre)
-            if track_genre not in normalized_genres:
-                return False
+        if query.genres is not None and features.genre not in query.genres:
+            return False
         
         # Tags filter (any tag match)
-        if request.tags:
-            normalized_req_tags = [SearchRanker.normalize_text(t) for t in request.tags]
-            track_tags = [SearchRanker.normalize_text(t) for t in track.get_tags_list()]
-            if not any(tag in track_tags for tag in normalized_req_tags):
-                return False
+        if query.tags is not None and query.tags.isdisjoint(features.tags):
+            return False
         
+        return (
+            SearchRanker.passes_range_filters(track, request)
+            and SearchRanker.passes_production_filters(track, request)
+        )
+    
+    @staticmethod
+    def passes_range_filters(track: Track, request: SearchRequest) -> bool:
+        """Filter check for the energy/valence ranges."""
         # Energy range filter
         if track.energy is not None:
             if request.min_energy is not None and track.energy < request.min_energy:
@@ -75,6 +152,11 @@ class SearchRanker:
             if request.min_valence is not None or request.max_valence is not None:
                 return False
         
+        return True
+    
+    @staticmethod
+    def passes_production_filters(track: Track, request: SearchRequest) -> bool:
+        """Filter check for stems and clearance requirements."""
         # Stems requirement
         if request.stems_required and not track.stems_available:
             return False
@@ -100,74 +182,63 @@ class SearchRanker:
         - Filter overlap boosts
         - Missing required fields penalties
         """
-        query_normalized = SearchRanker.normalize_text(request.query)
-        query_tokens = SearchRanker.tokenize(request.query)
+        return SearchRanker.score_features(track, TrackFeatures(track), QueryFeatures(request), request)
+    
+    @staticmethod
+    def score_features(
+        track: Track,
+        features: TrackFeatures,
+        query: QueryFeatures,
+        request: SearchRequest
+    ) -> float:
+        """Relevance score against a track's precomputed features."""
+        query_normalized = query.text
+        query_tokens = query.tokens
         score = 0.0
         
         # Exact phrase match bonuses (highest priority)
-        if query_normalized == SearchRanker.normalize_text(track.title):
+        if query_normalized == features.title:
             score += 10.0
-        if query_normalized == SearchRanker.normalize_text(track.artist):
+        if query_normalized == features.artist:
             score += 8.0
         
         # Partial phrase matches
-        if query_normalized in SearchRanker.normalize_text(track.title):
+        if query_normalized in features.title:
             score += 3.0
-        if query_normalized in SearchRanker.normalize_text(track.artist):
+        if query_normalized in features.artist:
             score += 2.5
         
         # Token-based matches (for multi-word queries)
-        title_tokens = SearchRanker.tokenize(track.title)
-        artist_tokens = SearchRanker.tokenize(track.artist)
-        album_tokens = SearchRanker.tokenize(track.album)
-        
-        title_overlap = len(query_tokens & title_tokens)
-        artist_overlap = len(query_tokens & artist_tokens)
-        album_overlap = len(query_tokens & album_tokens)
-        
-        score += title_overlap * 1.5
-        score += artist_overlap * 1.2
-        score += album_overlap * 0.5
+        score += len(query_tokens & features.title_tokens) * 1.5
+        score += len(query_tokens & features.artist_tokens) * 1.2
+        score += len(query_tokens & features.album_tokens) * 0.5
         
         # Tag matches
-        tags_list = track.get_tags_list()
-        tag_tokens = set()
-        for tag in tags_list:
-            tag_tokens.update(SearchRanker.tokenize(tag))
-        
-        tag_overlap = len(query_tokens & tag_tokens)
-        score += tag_overlap * 2.0
+        score += len(query_tokens & features.tag_tokens) * 2.0
         
         # Mood match
-        if query_normalized in SearchRanker.normalize_text(track.mood):
+        if query_normalized in features.mood:
             score += 1.5
-        mood_tokens = SearchRanker.tokenize(track.mood)
-        mood_overlap = len(query_tokens & mood_tokens)
-        score += mood_overlap * 1.0
+        score += len(query_tokens & features.mood_tokens) * 1.0
         
         # Genre match
-        if query_normalized in SearchRanker.normalize_text(track.genre):
+        if query_normalized in features.genre:
             score += 1.5
-        genre_tokens = SearchRanker.tokenize(track.genre)
-        genre_overlap = len(query_tokens & genre_tokens)
-        score += genre_overlap * 1.0
+        score += len(query_tokens & features.genre_tokens) * 1.0
         
         # Year match
-        if request.query in str(track.year):
+        if query.raw in features.year:
             score += 1.0
         
         # Filter overlap boosts (reward tracks that match filter criteria even if not required)
-        if request.moods and SearchRanker.normalize_text(track.mood) in [SearchRanker.normalize_text(m) for m in request.moods]:
+        if query.moods is not None and features.mood in query.moods:
             score += 2.0
         
-        if request.genres and SearchRanker.normalize_text(track.genre) in [SearchRanker.normalize_text(g) for g in request.genres]:
+        if query.genres is not None and features.genre in query.genres:
             score += 2.0
         
-        if request.tags:
-            normalized_req_tags = [SearchRanker.normalize_text(t) for t in request.tags]
-            track_tags_normalized = [SearchRanker.normalize_text(t) for t in track.get_tags_list()]
-            tag_filter_overlap = len(set(normalized_req_tags) & set(track_tags_normalized))
-            score += tag_filter_overlap * 1.5
+        if query.tags is not None:
+            score += len(query.tags & features.tags) * 1.5
         
         # Penalty for missing stems if stems_required
         if request.stems_required and not track.stems_available:
@@ -179,11 +250,127 @@ class SearchRanker:
         
         return score
     
+    @staticmethod
+    def candidate_ids(index: CatalogIndex, query: QueryFeatures) -> Optional[Set[int]]:
+        """
+        Ids of tracks that can score above zero for the query.
+        
+        Returns None when no pruning is possible: an empty normalized query
+        matches every field, and mood/genre/tag filters boost every track
+        that passes them.
+        """
+        if query.moods is not None or query.genres is not None or query.tags is not None:
+            return None
+        return index.match_candidates(query.text, query.tokens, query.raw)
+    
+    @classmethod
+    def filtered_ids(cls, index: CatalogIndex, query: QueryFeatures, request: SearchRequest) -> Iterable[int]:
+        """
+        Ids of tracks that pass every filter and can score above zero.
+        
+        Facet filters are bitset operations, energy/valence ranges are binary
+        searches and the query prunes through the inverted index; the results
+        are ANDed together. Ids are returned in catalog order.
+        """
+        # Facet filters (mood/genre/tags/stems/clearance) as bitset AND/ORs
+        facet_bits = index.facets.filter(
+            moods=query.moods,
+            genres=query.genres,
+            tags=query.tags,
+            stems_required=bool(request.stems_required),
+            clearance_required=bool(request.clearance_required)
+        )
+        
+        # Prune to tracks that can score above zero
+        candidate_ids = cls.candidate_ids(index, query)
+        
+        # Energy/valence ranges via binary search over the sorted columns
+        constraints = [] if facet_bits is None else [facet_bits]
+        if request.min_energy is not None or request.max_energy is not None:
+            energy_ids = index.energy.ids_in_range(request.min_energy, request.max_energy)
+            constraints.append(ids_to_bitset(energy_ids, len(index)))
+        if request.min_valence is not None or request.max_valence is not None:
+            valence_ids = index.valence.ids_in_range(request.min_valence, request.max_valence)
+            constraints.append(ids_to_bitset(valence_ids, len(index)))
+        
+        # Candidate ids in catalog order, so ties rank exactly as in a full scan
+        if constraints:
+            if candidate_ids is not None:
+                constraints.append(ids_to_bitset(candidate_ids, len(index)))
+            allowed = constraints[0]
+            for bits in constraints[1:]:
+                allowed &= bits
+            return bitset_to_ids(allowed)
+        if candidate_ids is not None:
+            return sorted(candidate_ids)
+        return range(len(index))
+    
+    @classmethod
+    def _rank(
+        cls,
+        index: CatalogIndex,
+        track_ids: Iterable[int],
+        query: QueryFeatures,
+        request: SearchRequest
+    ) -> List[Tuple[int, float]]:
+        """Score `track_ids` one at a time and return the top (track id, score) pairs."""
+        return cls.top_k(
+            (
+                (track_id, cls.score_features(index.tracks[track_id], index.features[track_id], query, request))
+                for track_id in track_ids
+            ),
+            request.limit
+        )
+    
+    @staticmethod
+    def top_k(scored: Iterable[Tuple[int, float]], limit: int) -> List[Tuple[int, float]]:
+        """
+        Top `limit` (track id, score) pairs with a positive score.
+        
+        Keeps a bounded min-heap of `limit` entries instead of sorting every
+        positive score. Ties on score rank in catalog order.
+        """
+        # Min-heap of (score, -track_id): the root is the weakest kept entry
+        heap: List[Tuple[float, int]] = []
+        
+        for track_id, score in scored:
+            if score <= 0:  # Only include tracks with some relevance
+                continue
+            entry = (score, -track_id)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        
+        # Highest score first; on ties the lower track id (earlier in catalog) first
+        heap.sort(reverse=True)
+        return [(-negative_id, score) for score, negative_id in heap]
+    
+    @classmethod
+    def _search_ids(cls, index: CatalogIndex, request: SearchRequest) -> List[Tuple[int, float]]:
+        """Filter and rank the index, returning (track id, score) pairs."""
+        # Normalize the query once; track fields are already normalized in the index
+        query = QueryFeatures(request)
+        
+        track_ids = cls.filtered_ids(index, query, request)
+        
+        logger.info(f"Filtered {len(index.tracks)} tracks to {len(track_ids)} based on criteria")
+        
+        if index.columns is not None:
+            # Vectorized backend: batched scoring and top-k over the columnar index
+            return index.columns.rank(track_ids, query, request, request.limit)
+        if index.ranker is not None:
+            # Index-specific scoring (e.g. a mapped index scores from its posting lists)
+            return index.ranker.rank(track_ids, query, request, request.limit)
+        return cls._rank(index, track_ids, query, request)
+    
     @classmethod
     def search_tracks(
         cls,
         tracks: List[Track],
-        request: SearchRequest
+        request: SearchRequest,
+        index: Optional[CatalogIndex] = None,
+        cache: Optional[SearchResultCache] = None
     ) -> List[TrackSearchResult]:
         """
         Search tracks with filters and return ranked results.
@@ -191,31 +378,25 @@ class SearchRanker:
         Args:
             tracks: List of all tracks to search
             request: SearchRequest with query and optional filters
+            index: Prebuilt CatalogIndex for `tracks` (built on the fly if omitted)
+            cache: Optional result cache consulted before ranking
             
         Returns:
             List of TrackSearchResult ordered by relevance score
         """
-        # First, filter tracks
-        filtered_tracks = [track for track in tracks if cls.passes_filters(track, request)]
-        
-        logger.info(f"Filtered {len(tracks)} tracks to {len(filtered_tracks)} based on criteria")
-        
-        # Calculate scores for filtered tracks
-        scored_tracks: List[Tuple[Track, float]] = []
-        
-        for track in filtered_tracks:
-            score = cls.calculate_score(track, request)
-            if score > 0:  # Only include tracks with some relevance
-                scored_tracks.append((track, score))
+        if index is None:
+            index = CatalogIndex(tracks)
         
-        # Sort by score (descending) and limit results
-        scored_tracks.sort(key=lambda x: x[1], reverse=True)
-        scored_tracks = scored_tracks[:request.limit]
+        ranked = cache.get(index, request) if cache is not None else None
+        if ranked is None:
+            ranked = cls._search_ids(index, request)
+            if cache is not None:
+                cache.set(index, request, ranked)
         
-        # Convert to TrackSearchResult objects
+        # Convert to TrackSearchResult objects (only for the returned tracks)
         results = [
-            TrackSearchResult(track=track, score=score)
-            for track, score in scored_tracks
+            TrackSearchResult(track=index.tracks[track_id], score=score)
+            for track_id, score in ranked
         ]
         
         logger.info(f"Returning {len(results)} search results")
@@ -0,0 +1,183 @@
+"""
+Binary catalog snapshots for fast startup.
+
+A snapshot holds the validated tracks and the prebuilt CatalogIndex, so a
+worker can skip CSV parsing, pydantic validation and index building. The
+header records the snapshot format version and the size, mtime and SHA-256
+of the source CSV; a snapshot that doesn't match the current CSV is stale
+and ignored.
+
+Compile a snapshot with:
+
+    python -m app.snapshot [--catalog data/music_catalog.csv] [--output data/music_catalog.snapshot]
+
+Snapshots are pickles: only load files produced by this tool.
+"""
+
+from typing import Optional, Tuple, List
+from pathlib import Path
+import argparse
+import gc
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import sys
+import tempfile
+
+from app.index import CatalogIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MSCATSNP"
+# Bump whenever Track, CatalogIndex or the payload layout changes shape
+SNAPSHOT_VERSION = 6
+
+# magic, version, backend, source size, source mtime_ns, source sha256, payload length
+_HEADER = struct.Struct("<8sH16sQq32sQ")
+
+
+def file_checksum(path: str) -> bytes:
+    """SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def write_snapshot(
+    snapshot_path: str,
+    index: CatalogIndex,
+    source_size: int,
+    source_mtime_ns: int,
+    source_checksum: bytes,
+    backend: str = "python"
+) -> None:
+    """
+    Write a snapshot of `index` atomically.
+    
+    The source identity must be the one recorded when the index was loaded;
+    statting the CSV again here could pair a newer file with the old index.
+    
+    Args:
+        snapshot_path: Destination file
+        index: CatalogIndex to store (its tracks are stored with it)
+        source_size: Size of the CSV the index was built from
+        source_mtime_ns: Its mtime
+        source_checksum: SHA-256 digest of its contents
+        backend: Search backend the index was built for
+    """
+    payload = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        backend.encode('ascii')[:16],
+        source_size,
+        source_mtime_ns,
+        source_checksum,
+        len(payload),
+    )
+    
+    # Write to a temp file in the same directory and rename, so readers never see a torn file
+    target = Path(snapshot_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=str(target.parent), prefix=target.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    logger.info(f"Wrote catalog snapshot with {len(index)} tracks to {snapshot_path} ({len(header) + len(payload)} bytes)")
+
+
+def read_snapshot(snapshot_path: str, csv_path: str) -> Optional[Tuple[CatalogIndex, str, bytes]]:
+    """
+    Load a snapshot if it is current for `csv_path`.
+    
+    Returns:
+        Tuple of (index, backend, source checksum), or None if the snapshot is
+        missing, stale, from another format version, or unreadable
+    """
+    path = Path(snapshot_path)
+    if not path.exists():
+        logger.info(f"No catalog snapshot at {snapshot_path}")
+        return None
+    
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                logger.warning(f"Catalog snapshot {snapshot_path} is truncated")
+                return None
+            
+            magic, version, backend, size, mtime_ns, checksum, payload_length = _HEADER.unpack(header)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                logger.warning(f"Catalog snapshot {snapshot_path} has an unsupported format (version {version})")
+                return None
+            
+            # Size + mtime match is enough; otherwise compare contents (e.g. the CSV was only touched)
+            source = os.stat(csv_path)
+            if source.st_size != size:
+                logger.info(f"Catalog snapshot {snapshot_path} is stale (source size changed)")
+                return None
+            if source.st_mtime_ns != mtime_ns and file_checksum(csv_path) != checksum:
+                logger.info(f"Catalog snapshot {snapshot_path} is stale (source checksum changed)")
+                return None
+            
+            payload = f.read(payload_length)
+            if len(payload) != payload_length:
+                logger.warning(f"Catalog snapshot {snapshot_path} is truncated")
+                return None
+            
+            # The payload is millions of small objects; cyclic GC passes during
+            # unpickling more than double the load time and find nothing to free
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                index = pickle.loads(payload)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+    except Exception as e:
+        logger.warning(f"Failed to read catalog snapshot {snapshot_path}: {e}")
+        return None
+    
+    if not isinstance(index, CatalogIndex):
+        logger.warning(f"Catalog snapshot {snapshot_path} does not contain a catalog index")
+        return None
+    
+    return index, backend.rstrip(b'\0').decode('ascii'), checksum
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Compile a catalog snapshot from the CSV."""
+    from app.config import get_settings
+    from app.catalog import MusicCatalog
+    
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Compile a binary catalog snapshot for fast startup.")
+    parser.add_argument("--catalog", default=settings.catalog_path, help="Source catalog CSV")
+    parser.add_argument("--output", default=settings.catalog_snapshot_path, help="Snapshot file to write")
+    parser.add_argument("--backend", default=settings.search_backend, help="Search backend to prebuild indexes for")
+    args = parser.parse_args(argv)
+    
+    if not args.output:
+        parser.error("no snapshot path given (set --output or CATALOG_SNAPSHOT_PATH)")
+    
+    logging.basicConfig(level=logging.INFO, format=settings.log_format)
+    generation = MusicCatalog(args.catalog, search_backend=args.backend).current
+    write_snapshot(
+        args.output, generation.index, generation.source_size, generation.source_mtime_ns,
+        bytes.fromhex(generation.source_checksum), backend=args.backend
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
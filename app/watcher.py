@@ -0,0 +1,114 @@
+"""
+Background watcher that hot-reloads the catalog when its CSV changes.
+
+The watcher polls the file's size and mtime. When they change, it waits
+until they have been stable for the debounce period (an export is usually
+written in several bursts), then compares the SHA-256 of the contents
+with the current generation. Touching the file doesn't trigger a reload.
+The reload itself runs in a worker thread, so the event loop keeps
+serving requests from the current generation until the new one is
+swapped in.
+
+Every worker runs its own watcher on the same file, so they all converge
+on the generation with the same source checksum.
+"""
+
+from typing import Optional, Tuple
+import asyncio
+import logging
+import os
+
+from app.catalog import MusicCatalog
+from app.snapshot import file_checksum
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogWatcher:
+    """Polls the catalog CSV and reloads the catalog when its contents change."""
+    
+    def __init__(self, catalog: MusicCatalog, interval: float = 2.0, debounce: float = 1.0):
+        """
+        Args:
+            catalog: Catalog to keep up to date
+            interval: Seconds between checks of the file's size and mtime
+            debounce: Seconds the file must stay unchanged before reloading
+        """
+        self.catalog = catalog
+        self.interval = interval
+        self.debounce = debounce
+        # Stats already handled without a reload: same contents as the current
+        # generation, or a version that failed to load (retried once the file changes again)
+        self._same: Optional[Tuple[int, int]] = None
+        self._failed: Optional[Tuple[int, int]] = None
+        self.reloads = 0
+        self.failures = 0
+    
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            source = os.stat(self.catalog.csv_path)
+        except FileNotFoundError:
+            # Mid-replace or removed; keep serving the current generation
+            return None
+        return source.st_size, source.st_mtime_ns
+    
+    def _loaded_stat(self) -> Tuple[int, int]:
+        generation = self.catalog.current
+        return generation.source_size, generation.source_mtime_ns
+    
+    async def check(self) -> bool:
+        """Reload if the CSV changed since the current generation. Returns True if reloaded."""
+        seen = self._stat()
+        if seen is None or seen in (self._loaded_stat(), self._same, self._failed):
+            return False
+        
+        # Debounce: wait until the file stops changing
+        while True:
+            await asyncio.sleep(self.debounce)
+            latest = self._stat()
+            if latest is None:
+                return False
+            if latest == seen:
+                break
+            seen = latest
+        
+        checksum = await asyncio.to_thread(file_checksum, self.catalog.csv_path)
+        if checksum.hex() == self.catalog.current.source_checksum:
+            # Touched or rewritten with the same contents
+            self._same = seen
+            return False
+        
+        try:
+            generation = await asyncio.to_thread(self.catalog.load_catalog)
+        except Exception as e:
+            self._failed = seen
+            self.failures += 1
+            logger.error(f"Catalog hot reload failed; still serving generation {self.catalog.current.number}: {e}")
+            return False
+        
+        self._failed = None
+        self.reloads += 1
+        logger.info(
+            f"Catalog hot reload: generation {generation.number} "
+            f"({len(generation.tracks)} tracks, checksum {generation.source_checksum[:12]})"
+        )
+        return True
+    
+    async def run(self) -> None:
+        """Check the catalog every `interval` seconds until cancelled."""
+        logger.info(f"Watching {self.catalog.csv_path} for catalog changes (every {self.interval}s)")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Catalog watcher check failed: {e}")
+    
+    def get_status(self) -> dict:
+        """Watcher counters for /health."""
+        return {
+            "interval_seconds": self.interval,
+            "debounce_seconds": self.debounce,
+            "reloads": self.reloads,
+            "failures": self.failures,
+        }
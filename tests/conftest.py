@@ -10,3 +10,84 @@ def pytest_configure(config):
     config.addinivalue_line(
         "markers", "asyncio: mark test as an async test"
     )
+
+
+def make_recording(mbid, title, artist, isrcs=(), score=100):
+    """A recording in the JSON web service shape, for FakeMusicBrainz.recordings."""
+    return {
+        "id": mbid, "score": score, "title": title, "isrcs": list(isrcs),
+        "artist-credit": [{"name": artist, "artist": {"id": f"artist-{artist}", "name": artist}}]
+    }
+
+
+class FakeMusicBrainz:
+    """Local stand-in for the MusicBrainz JSON web service (/ws/2/recording)."""
+    
+    def __init__(self):
+        import threading
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        
+        fake = self
+        # Recordings returned by searches and MBID lookups (JSON web service shape)
+        self.recordings = [{
+            "id": "mbid-bohemian",
+            "score": 100,
+            "title": "Bohemian Rhapsody",
+            "length": 354000,
+            "artist-credit": [{"name": "Queen", "artist": {"id": "artist-queen", "name": "Queen", "sort-name": "Queen"}}],
+            "releases": [{"id": "release-1", "title": "A Night at the Opera"}],
+            "isrcs": ["GBUM71029604"]
+        }]
+        self.requests = []
+        self.delay = 0.0
+        self.status = 200
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                import json
+                import time
+                from urllib.parse import urlparse, parse_qs
+                
+                url = urlparse(self.path)
+                fake.requests.append((url.path, parse_qs(url.query)))
+                if fake.delay:
+                    time.sleep(fake.delay)
+                
+                if fake.status != 200:
+                    status, body = fake.status, {"error": "fake error"}
+                elif url.path == "/ws/2/recording":
+                    status, body = 200, {"count": len(fake.recordings), "recordings": fake.recordings}
+                else:
+                    mbid = url.path.rsplit("/", 1)[-1]
+                    matches = [r for r in fake.recordings if r["id"] == mbid]
+                    if matches:
+                        status, body = 200, {k: v for k, v in matches[0].items() if k != "score"}
+                    else:
+                        status, body = 404, {"error": "Not Found"}
+                
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_musicbrainz():
+    """A running FakeMusicBrainz server."""
+    fake = FakeMusicBrainz()
+    yield fake
+    fake.close()
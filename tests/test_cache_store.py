@@ -0,0 +1,221 @@
+"""
+Tests for the MusicBrainz cache storage backends.
+"""
+
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.cache import MusicBrainzCache
+from app.cache_store import migrate_files, open_cache_store
+
+
+@pytest.fixture(params=["files", "sqlite"])
+def backend(request):
+    return request.param
+
+
+def make_cache(tmp_path, backend, **kwargs):
+    kwargs.setdefault("memory_max_entries", 0)
+    return MusicBrainzCache(cache_dir=str(tmp_path / "cache"), backend=backend, **kwargs)
+
+
+def test_get_many_and_set_many(tmp_path, backend):
+    """Test that batched reads and writes round-trip on every backend."""
+    cache = make_cache(tmp_path, backend)
+    cache.set_many({f"song {i}::5": {"recordings": [{"id": f"mbid-{i}"}]} for i in range(10)})
+    cache.set("mbid-3", {"id": "mbid-3"}, cache_type="mbid")
+    
+    found = cache.get_many(["song 1::5", "song 7::5", "missing::5"])
+    assert found == {
+        "song 1::5": {"recordings": [{"id": "mbid-1"}]},
+        "song 7::5": {"recordings": [{"id": "mbid-7"}]},
+    }
+    assert cache.get("mbid-3", cache_type="mbid") == {"id": "mbid-3"}
+    # Types don't collide
+    assert cache.get("mbid-3") is None
+    
+    status = cache.get_cache_status()
+    assert status["backend"] == backend
+    assert status["file_count"] == 11
+    assert status["disk"]["hits"] == 3 and status["disk"]["misses"] == 2
+    
+    assert cache.clear() == 11
+    assert cache.get_cache_status()["file_count"] == 0
+    cache.close()
+
+
+def test_ttl_and_size_cap(tmp_path, backend):
+    """Test that expiry and least-recently-used eviction behave the same on every backend."""
+    cache = make_cache(tmp_path, backend, ttl_by_type={"query": 60}, disk_max_bytes=160)
+    if backend == "sqlite":
+        # Record every use, not just those a minute apart
+        cache.store.USE_RESOLUTION = 0.0
+    for key in ("a", "b", "c"):
+        cache.set(key, {"title": key * 40})
+        time.sleep(0.01)
+    assert cache.get("a") is not None
+    cache.set("d", {"title": "d" * 40})
+    
+    assert cache.get("b") is None
+    assert cache.get_cache_status()["size_bytes"] <= 160
+    assert cache.get_cache_status()["disk"]["evictions"] == 1
+    
+    # Age everything past the TTL
+    if backend == "sqlite":
+        cache.store._conn().execute("UPDATE entries SET written_at = written_at - 120")
+    else:
+        for path in (tmp_path / "cache").glob("*.json"):
+            os.utime(path, (time.time() - 120, time.time() - 120))
+    assert cache.compact()["expired"] == 3
+    assert cache.get_cache_status()["file_count"] == 0
+    cache.close()
+
+
+def test_sqlite_totals_are_shared_between_workers(tmp_path):
+    """Test that two stores on one database (two workers) see each other's writes and counts."""
+    path = str(tmp_path / "cache.sqlite3")
+    first = MusicBrainzCache(cache_dir=str(tmp_path), memory_max_entries=0, backend="sqlite", sqlite_path=path)
+    second = MusicBrainzCache(cache_dir=str(tmp_path), memory_max_entries=0, backend="sqlite", sqlite_path=path)
+    
+    first.set("queen::5", {"recordings": []})
+    second.set("queen::5", {"recordings": [{"id": "mbid-1"}]})
+    assert first.get("queen::5") == {"recordings": [{"id": "mbid-1"}]}
+    assert first.get_cache_status()["file_count"] == second.get_cache_status()["file_count"] == 1
+    
+    # The trigger-maintained totals match a full count
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*), SUM(size) FROM entries").fetchone() == (
+        1, first.get_cache_status()["size_bytes"]
+    )
+    conn.close()
+    first.close()
+    second.close()
+
+
+def test_concurrent_writes_to_same_key(tmp_path, backend):
+    """Test that concurrent writers of one key never leave a torn entry."""
+    cache = make_cache(tmp_path, backend)
+    values = [{"recordings": [{"id": f"mbid-{i}", "title": "x" * (100 * i)}]} for i in range(8)]
+    
+    def write_and_read(value):
+        for _ in range(20):
+            cache.set("popular::5", value)
+            assert cache.get("popular::5") in values
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(write_and_read, values))
+    assert cache.get_cache_status()["disk"]["errors"] == 0
+    cache.close()
+
+
+def test_migrate_files_into_sqlite(tmp_path):
+    """Test that the migration imports existing JSON files, keeping keys and write times."""
+    files = make_cache(tmp_path, "files")
+    files.set("queen::5", {"recordings": [{"id": "mbid-1"}]})
+    files.set("mbid-1", {"id": "mbid-1"}, cache_type="mbid")
+    old = time.time() - 3600
+    for path in (tmp_path / "cache").glob("*.json"):
+        os.utime(path, (old, old))
+    (tmp_path / "cache" / "query_broken.json").write_text("{not json")
+    
+    store = open_cache_store("sqlite", str(tmp_path / "cache"))
+    summary = migrate_files(str(tmp_path / "cache"), store)
+    store.close()
+    assert summary == {"imported": 2, "skipped": 1}
+    
+    cache = make_cache(tmp_path, "sqlite")
+    assert cache.get("queen::5") == {"recordings": [{"id": "mbid-1"}]}
+    assert cache.get("mbid-1", cache_type="mbid") == {"id": "mbid-1"}
+    written_at = cache.store.read(cache._get_cache_key("queen::5"))[1]
+    assert abs(written_at - old) < 1
+    cache.close()
+
+
+def test_unknown_backend_is_rejected(tmp_path):
+    """Test that a misconfigured backend fails at startup."""
+    with pytest.raises(ValueError, match="Unknown cache backend"):
+        MusicBrainzCache(cache_dir=str(tmp_path), backend="redis")
+
+
+def test_incomplete_store_fails_at_construction():
+    """Test that a store missing part of the interface can't be instantiated."""
+    from app.cache_store import CacheStore
+    
+    class ReadOnlyStore(CacheStore):
+        def read_many(self, keys):
+            return {}
+    
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
+
+
+def test_sqlite_read_does_not_wait_for_writer_lock(tmp_path):
+    """Test that a read skips the use-time update instead of waiting while another worker writes."""
+    cache = make_cache(tmp_path, "sqlite")
+    cache.store.USE_RESOLUTION = 0.0
+    cache.set("queen::5", {"recordings": []})
+    
+    writer = sqlite3.connect(str(cache.store.path), isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.perf_counter()
+        assert cache.get("queen::5") == {"recordings": []}
+        assert time.perf_counter() - started < 1.0
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_async_write_keeps_loop_running_while_another_worker_writes(tmp_path):
+    """Test that aset waits for another worker's write lock off the event loop."""
+    import asyncio
+    import threading
+    
+    cache = make_cache(tmp_path, "sqlite")
+    
+    # Another worker holds the write lock for 0.3s
+    writer = sqlite3.connect(str(cache.store.path), isolation_level=None, check_same_thread=False)
+    writer.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.3, lambda: writer.execute("ROLLBACK"))
+    release.start()
+    
+    ticks = 0
+    
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+    
+    task = asyncio.create_task(ticker())
+    await cache.aset("queen::5", {"recordings": []})
+    task.cancel()
+    release.join()
+    writer.close()
+    
+    assert ticks >= 15
+    assert cache.store.read(cache._get_cache_key("queen::5")) is not None
+    cache.close()
+
+
+def test_writes_under_the_cap_do_not_evict(tmp_path, backend):
+    """Test that a write only runs an eviction pass once the disk tier may be over its cap."""
+    cache = make_cache(tmp_path, backend, disk_max_bytes=200)
+    passes = []
+    evict = cache.store.evict
+    cache.store.evict = lambda max_bytes: passes.append(max_bytes) or evict(max_bytes)
+    
+    for key in ("a", "b", "c"):
+        cache.set(key, {"title": key * 40})
+    assert passes == []
+    
+    for key in ("d", "e", "f", "g"):
+        cache.set(key, {"title": key * 40})
+    assert passes and cache.get_cache_status()["size_bytes"] <= 200
+    cache.close()
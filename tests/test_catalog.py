@@ -84,3 +84,338 @@ def test_get_tags_list(catalog):
     
     assert isinstance(tags, list)
     assert all(isinstance(tag, str) for tag in tags)
+
+
+def test_catalog_builds_search_index(catalog):
+    """Test that the search index is built once at load time."""
+    assert len(catalog.index) == len(catalog.tracks)
+    
+    features = catalog.index.features[0]
+    assert features.title == "bohemian rhapsody"
+    assert "rock" in features.tag_tokens
+
+
+def test_catalog_snapshot_roundtrip(tmp_path):
+    """Test that a compiled snapshot loads the same catalog and goes stale with the CSV."""
+    import shutil
+    from app.snapshot import main as compile_snapshot
+    from app.search import SearchRanker
+    from app.models import SearchRequest
+    
+    csv_path = tmp_path / "catalog.csv"
+    snapshot_path = tmp_path / "catalog.snapshot"
+    shutil.copy(Path(__file__).parent.parent / "data" / "music_catalog.csv", csv_path)
+    
+    assert compile_snapshot(["--catalog", str(csv_path), "--output", str(snapshot_path), "--backend", "python"]) == 0
+    
+    from_csv = MusicCatalog(str(csv_path))
+    from_snapshot = MusicCatalog(str(csv_path), snapshot_path=str(snapshot_path))
+    
+    assert [t.model_dump() for t in from_snapshot.tracks] == [t.model_dump() for t in from_csv.tracks]
+    assert from_snapshot.get_track_by_id("track_0001").title == "Bohemian Rhapsody"
+    assert from_snapshot.index.generation != from_csv.index.generation
+    
+    request = SearchRequest(query="rock", limit=5)
+    assert [r.score for r in SearchRanker.search_tracks(from_snapshot.tracks, request, index=from_snapshot.index)] == \
+        [r.score for r in SearchRanker.search_tracks(from_csv.tracks, request, index=from_csv.index)]
+    
+    # Editing the CSV makes the snapshot stale; the CSV is loaded instead
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write('999,New Song,New Artist,New Album,200,Pop,Happy,"pop",2024\n')
+    reloaded = MusicCatalog(str(csv_path), snapshot_path=str(snapshot_path))
+    assert reloaded.get_track_by_id("track_0999") is not None
+
+
+def test_snapshot_records_the_csv_it_was_loaded_from(tmp_path, monkeypatch):
+    """Test that a CSV rewritten after the load but before the write leaves the snapshot stale."""
+    import shutil
+    import app.catalog
+    from app.snapshot import main as compile_snapshot, read_snapshot
+    
+    csv_path = tmp_path / "catalog.csv"
+    snapshot_path = tmp_path / "catalog.snapshot"
+    shutil.copy(Path(__file__).parent.parent / "data" / "music_catalog.csv", csv_path)
+    
+    class RewrittenAfterLoad(MusicCatalog):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Same size, different contents and mtime (a new export landing mid-compile)
+            csv_path.write_text(csv_path.read_text(encoding="utf-8").replace("Queen", "Qween"), encoding="utf-8")
+    
+    monkeypatch.setattr(app.catalog, "MusicCatalog", RewrittenAfterLoad)
+    assert compile_snapshot(["--catalog", str(csv_path), "--output", str(snapshot_path)]) == 0
+    
+    assert read_snapshot(str(snapshot_path), str(csv_path)) is None
+
+
+def test_catalog_mmap_store(tmp_path):
+    """Test that the memory-mapped store serves the same catalog and is rebuilt when the CSV changes."""
+    import shutil
+    from app.search import SearchRanker
+    from app.models import SearchRequest
+    
+    csv_path = tmp_path / "catalog.csv"
+    store_path = tmp_path / "catalog.store"
+    shutil.copy(Path(__file__).parent.parent / "data" / "music_catalog.csv", csv_path)
+    
+    from_csv = MusicCatalog(str(csv_path))
+    mapped = MusicCatalog(str(csv_path), mmap_path=str(store_path))
+    assert store_path.exists()
+    
+    assert [t.model_dump() for t in mapped.tracks] == [t.model_dump() for t in from_csv.tracks]
+    assert mapped.get_track_by_id("track_0001") == from_csv.get_track_by_id("track_0001")
+    assert mapped.get_track_by_id("missing") is None
+    assert mapped.get_track_by_legacy_id(1).title == "Bohemian Rhapsody"
+    
+    request = SearchRequest(query="rock", limit=5)
+    assert [(r.track.buffet_track_id, r.score) for r in SearchRanker.search_tracks(mapped.tracks, request, index=mapped.index)] == \
+        [(r.track.buffet_track_id, r.score) for r in SearchRanker.search_tracks(from_csv.tracks, request, index=from_csv.index)]
+    
+    # A second worker maps the existing store instead of rebuilding it
+    mtime = store_path.stat().st_mtime_ns
+    MusicCatalog(str(csv_path), mmap_path=str(store_path))
+    assert store_path.stat().st_mtime_ns == mtime
+    
+    # Editing the CSV makes the store stale; it is rebuilt on load
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write('999,New Song,New Artist,New Album,200,Pop,Happy,"pop",2024\n')
+    reloaded = MusicCatalog(str(csv_path), mmap_path=str(store_path))
+    assert reloaded.get_track_by_id("track_0999").title == "New Song"
+
+
+def _write_catalog_with_optional_columns(tmp_path):
+    """The sample catalog plus the optional columns, so every index structure has entries."""
+    import csv
+    
+    with open(Path(__file__).parent.parent / "data" / "music_catalog.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    for i, row in enumerate(rows):
+        row.update(
+            energy=f"{(i * 37 % 100) / 100:.2f}",
+            valence=f"{(i * 53 % 100) / 100:.2f}",
+            stems_available="true" if i % 2 else "false",
+            clearance_status="cleared" if i % 3 else "pending",
+            mbid=f"00000000-0000-0000-0000-{i:012d}",
+            isrc=f"USABC24{i:05d}",
+        )
+    csv_path = tmp_path / "catalog.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return csv_path, rows
+
+
+def test_catalog_mmap_store_maps_search_index(tmp_path):
+    """Test that workers map the prebuilt search index instead of building per-track structures."""
+    from app.models import SearchRequest
+    from app.columnar import numpy_available
+    from app.mmap_store import MappedTable
+    
+    csv_path, rows = _write_catalog_with_optional_columns(tmp_path)
+    store_path = str(tmp_path / "catalog.store")
+    
+    from_csv = MusicCatalog(str(csv_path))
+    MusicCatalog(str(csv_path), mmap_path=store_path)
+    backends = ["python", "numpy"] if numpy_available() else ["python"]
+    requests = [
+        SearchRequest(query="rock", limit=5),
+        SearchRequest(query="the", limit=10, stems_required=True, clearance_required=True),
+        SearchRequest(query="the", limit=10, min_energy=0.3, max_valence=0.8),
+        SearchRequest(query="", limit=10, moods=["Happy", "Epic"]),
+        SearchRequest(query="rhap", limit=10, genres=["Rock"], tags=["classic"]),
+    ]
+    
+    for backend in backends:
+        # Like another worker starting up: the store exists, so it is only mapped
+        mapped = MusicCatalog(str(csv_path), mmap_path=store_path, search_backend=backend)
+        index = mapped.index
+        assert not isinstance(index.features, list)
+        assert isinstance(index.postings["title"], MappedTable)
+        assert isinstance(index.substrings["artist"].ids_by_value, MappedTable)
+        
+        for request in requests:
+            assert [(r.track.buffet_track_id, r.score) for r in mapped.search(request)] == \
+                [(r.track.buffet_track_id, r.score) for r in from_csv.search(request)]
+        assert index.match_candidates("rock", ["rock"], "rock") == from_csv.index.match_candidates("rock", ["rock"], "rock")
+        assert index.fuzzy_match("bohemian rapsody") == from_csv.index.fuzzy_match("bohemian rapsody")
+        assert index.lowercase["title"].find("bohemian") == from_csv.index.lowercase["title"].find("bohemian")
+        assert index.ids_for_recording(rows[3]["mbid"], [rows[5]["isrc"]]) == [3, 5]
+
+
+def test_catalog_mmap_store_broad_search_builds_only_results(tmp_path, monkeypatch):
+    """Test that broad searches on a mapped store score from the index and build only the returned tracks."""
+    import app.mmap_store
+    from app.models import SearchRequest
+    from app.mmap_store import MappedCatalogStore
+    
+    csv_path, _ = _write_catalog_with_optional_columns(tmp_path)
+    store_path = str(tmp_path / "catalog.store")
+    from_csv = MusicCatalog(str(csv_path))
+    MusicCatalog(str(csv_path), mmap_path=store_path)
+    mapped = MusicCatalog(str(csv_path), mmap_path=store_path, search_cache_size=0)
+    
+    built = {"tracks": 0, "features": 0}
+    track_at = MappedCatalogStore.track_at
+    features = app.mmap_store.TrackFeatures
+    
+    def counting_track_at(self, row):
+        built["tracks"] += 1
+        return track_at(self, row)
+    
+    def counting_features(*args, **kwargs):
+        built["features"] += 1
+        return features(*args, **kwargs)
+    
+    monkeypatch.setattr(MappedCatalogStore, "track_at", counting_track_at)
+    monkeypatch.setattr(app.mmap_store, "TrackFeatures", counting_features)
+    
+    # Each of these scores (nearly) every track in the catalog
+    requests = [
+        SearchRequest(query="e", limit=3),
+        SearchRequest(query="", limit=3, tags=["rock", "pop", "classic"]),
+        SearchRequest(query="e", limit=3, stems_required=True, clearance_required=True, moods=["Melancholic", "Hopeful"]),
+    ]
+    for request in requests:
+        built["tracks"] = 0
+        results = mapped.search(request)
+        assert 0 < len(results) <= 3
+        assert built["tracks"] <= len(results)
+        assert [(r.track.buffet_track_id, r.score) for r in results] == \
+            [(r.track.buffet_track_id, r.score) for r in from_csv.search(request)]
+    assert built["features"] == 0
+
+
+def test_catalog_checksum_is_computed_while_loading(tmp_path, monkeypatch):
+    """Test that every load path reports the CSV checksum without hashing the file in a separate pass."""
+    import shutil
+    import app.mmap_store
+    import app.snapshot
+    from app.snapshot import file_checksum, main as compile_snapshot
+    
+    csv_path = tmp_path / "catalog.csv"
+    shutil.copy(Path(__file__).parent.parent / "data" / "music_catalog.csv", csv_path)
+    expected = file_checksum(str(csv_path)).hex()
+    snapshot_path = tmp_path / "catalog.snapshot"
+    assert compile_snapshot(["--catalog", str(csv_path), "--output", str(snapshot_path)]) == 0
+    
+    def no_extra_pass(path):
+        raise AssertionError("the CSV was hashed in a separate pass")
+    
+    monkeypatch.setattr(app.snapshot, "file_checksum", no_extra_pass)
+    monkeypatch.setattr(app.mmap_store, "file_checksum", no_extra_pass)
+    
+    assert MusicCatalog(str(csv_path)).current.source_checksum == expected
+    assert MusicCatalog(str(csv_path), snapshot_path=str(snapshot_path)).current.source_checksum == expected
+    assert MusicCatalog(str(csv_path), mmap_path=str(tmp_path / "catalog.store")).current.source_checksum == expected
+
+
+def test_catalog_ingest_rejects_bad_rows(tmp_path):
+    """Test that invalid rows are reported instead of aborting the load."""
+    csv_path = tmp_path / "catalog.csv"
+    csv_path.write_text(
+        "buffet_track_id,id,title,artist,album,duration,genre,mood,tags,year,energy\n"
+        "track_a,1,Good Song,Artist,Album,200,Pop,Happy,pop,2020,0.5\n"
+        "track_b,2,Too Loud,Artist,Album,200,Pop,Happy,pop,2020,1.5\n"
+        "track_c,3,No Duration,Artist,Album,abc,Pop,Happy,pop,2020,\n"
+        ",,No Id,Artist,Album,200,Pop,Happy,pop,2020,\n"
+        "track_e,5,Also Good,Artist,Album,180,Rock,Sad,rock,2021,\n",
+        encoding="utf-8"
+    )
+    
+    catalog = MusicCatalog(str(csv_path), ingest_batch_size=2)
+    report = catalog.ingest_report
+    
+    assert [t.buffet_track_id for t in catalog.tracks] == ["track_a", "track_e"]
+    assert report.rows_read == 5
+    assert report.rows_loaded == 2
+    assert report.rows_rejected == 3
+    assert [(r.line, r.track_id) for r in sorted(report.rejections, key=lambda r: r.line)] == \
+        [(3, "track_b"), (4, "track_c"), (5, None)]
+    assert "energy" in next(r.reason for r in report.rejections if r.track_id == "track_b")
+    assert report.rows_per_second > 0
+
+
+def test_catalog_ingest_batch_size_does_not_change_index(catalog):
+    """Test that indexing in small batches builds the same search results."""
+    from app.search import SearchRanker
+    from app.models import SearchRequest
+    
+    batched = MusicCatalog(catalog.csv_path, ingest_batch_size=7)
+    assert [t.model_dump() for t in batched.tracks] == [t.model_dump() for t in catalog.tracks]
+    
+    for request in (SearchRequest(query="rock", limit=10), SearchRequest(query="", min_energy=0.5, moods=["happy"])):
+        assert [(r.track.buffet_track_id, r.score) for r in SearchRanker.search_tracks(batched.tracks, request, index=batched.index)] == \
+            [(r.track.buffet_track_id, r.score) for r in SearchRanker.search_tracks(catalog.tracks, request, index=catalog.index)]
+
+
+def test_catalog_reload_swaps_generation(tmp_path):
+    """Test that a reload builds a new generation, diffs it and reuses unchanged tracks."""
+    import shutil
+    from app.models import SearchRequest
+    from app.resolver import ResolverService
+    
+    csv_path = tmp_path / "catalog.csv"
+    shutil.copy(Path(__file__).parent.parent / "data" / "music_catalog.csv", csv_path)
+    catalog = MusicCatalog(str(csv_path))
+    resolver = ResolverService(catalog=catalog)
+    
+    old = catalog.current
+    assert old.number == 1 and old.diff is None
+    
+    # Change one title, drop one row, add one row
+    lines = csv_path.read_text(encoding="utf-8").splitlines()
+    lines[1] = lines[1].replace("Bohemian Rhapsody", "Bohemian Rhapsody (Remastered)")
+    del lines[2]
+    lines.append('999,New Song,New Artist,New Album,200,Pop,Happy,"pop",2024')
+    csv_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    
+    new = catalog.load_catalog()
+    
+    assert catalog.current is new
+    assert new.number == 2
+    assert new.diff.model_dump() == {"added": 1, "removed": 1, "changed": 1, "unchanged": len(old.tracks) - 2}
+    assert new.index.reused == len(old.tracks) - 2
+    
+    # The old generation is untouched, so in-flight readers stay consistent
+    assert old.tracks_by_id["track_0001"].title == "Bohemian Rhapsody"
+    assert len(old.tracks) == len(old.index)
+    
+    assert catalog.get_track_by_id("track_0001").title == "Bohemian Rhapsody (Remastered)"
+    assert catalog.search(SearchRequest(query="New Song", limit=1))[0].track.buffet_track_id == "track_0999"
+    assert resolver.resolve("New Song New Artist").canonical_id == "track_0999"
+
+
+@pytest.mark.asyncio
+async def test_catalog_watcher_hot_reload(tmp_path):
+    """Test that the watcher reloads on content changes only and survives a bad file."""
+    import os
+    import shutil
+    from app.watcher import CatalogWatcher
+    
+    csv_path = tmp_path / "catalog.csv"
+    shutil.copy(Path(__file__).parent.parent / "data" / "music_catalog.csv", csv_path)
+    catalog = MusicCatalog(str(csv_path))
+    watcher = CatalogWatcher(catalog, interval=0.01, debounce=0.01)
+    first = catalog.current
+    
+    assert await watcher.check() is False
+    
+    # Touching the file changes the mtime but not the contents
+    os.utime(csv_path, ns=(first.source_mtime_ns + 10**9, first.source_mtime_ns + 10**9))
+    assert await watcher.check() is False
+    assert catalog.current is first
+    
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write('999,New Song,New Artist,New Album,200,Pop,Happy,"pop",2024\n')
+    assert await watcher.check() is True
+    assert catalog.current.number == 2
+    assert catalog.current.source_checksum != first.source_checksum
+    assert catalog.get_track_by_id("track_0999") is not None
+    
+    # A broken export keeps the current generation and is not retried until it changes
+    csv_path.write_text("title,artist\nOnly,Two\n", encoding="utf-8")
+    assert await watcher.check() is False
+    assert await watcher.check() is False
+    assert catalog.current.number == 2
+    assert watcher.failures == 1
@@ -0,0 +1,94 @@
+"""
+Tests for the batch MusicBrainz catalog enrichment job.
+"""
+
+import csv
+
+import pytest
+
+from app.enrich import CatalogEnrichment
+from app.musicbrainz import MusicBrainzService
+from tests.conftest import make_recording
+
+
+FIELDS = ["buffet_track_id", "title", "artist", "album", "duration", "genre", "mood", "tags", "year", "mbid", "isrc"]
+
+
+def write_catalog(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: row.get(field, "x") for field in FIELDS})
+
+
+def read_catalog(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return {row["buffet_track_id"]: row for row in csv.DictReader(f)}
+
+
+@pytest.fixture
+def catalog_csv(tmp_path):
+    path = tmp_path / "catalog.csv"
+    write_catalog(path, [
+        {"buffet_track_id": "track_0001", "title": "Under Pressure", "artist": "Queen", "mbid": "", "isrc": ""},
+        {"buffet_track_id": "track_0002", "title": "Hotel California", "artist": "Eagles", "mbid": "", "isrc": "USAAA0000002"},
+        {"buffet_track_id": "track_0003", "title": "Hotel California", "artist": "Gipsy Kings", "mbid": "mbid-3", "isrc": ""},
+        {"buffet_track_id": "track_0004", "title": "Unknown", "artist": "Nobody", "mbid": "", "isrc": ""},
+        {"buffet_track_id": "track_0005", "title": "Done", "artist": "Already", "mbid": "mbid-5", "isrc": "GB0000000005"},
+    ])
+    return path
+
+
+@pytest.mark.asyncio
+async def test_enrichment_writes_resolved_ids(fake_musicbrainz, tmp_path, catalog_csv):
+    """Test that missing MBIDs/ISRCs are filled into a new catalog file with batched requests."""
+    fake_musicbrainz.recordings = [
+        make_recording("mbid-1", "Under Pressure", "Queen & David Bowie", ["GBAAA0000001"]),
+        make_recording("mbid-2", "Hotel California", "Eagles", ["USAAA0000002"]),
+        make_recording("mbid-3", "Hotel California", "Gipsy Kings", ["FRAAA0000003"]),
+    ]
+    service = MusicBrainzService(rate_limit=0.0, cache_dir=str(tmp_path / "cache"), base_url=fake_musicbrainz.url)
+    output = tmp_path / "enriched.csv"
+    try:
+        stats = await CatalogEnrichment(service, str(catalog_csv), str(output)).run()
+    finally:
+        await service.aclose()
+    
+    # ISRC batch + title/artist batch; the MBID row is served from recordings the ISRC batch cached
+    assert len(fake_musicbrainz.requests) == 2
+    assert stats["resolved"] == 3 and stats["unresolved"] == 1 and stats["complete"] == 1
+    rows = read_catalog(output)
+    assert (rows["track_0001"]["mbid"], rows["track_0001"]["isrc"]) == ("mbid-1", "GBAAA0000001")
+    assert (rows["track_0002"]["mbid"], rows["track_0002"]["isrc"]) == ("mbid-2", "USAAA0000002")
+    assert (rows["track_0003"]["mbid"], rows["track_0003"]["isrc"]) == ("mbid-3", "FRAAA0000003")
+    assert (rows["track_0004"]["mbid"], rows["track_0004"]["isrc"]) == ("", "")
+    # The source catalog is untouched
+    assert read_catalog(catalog_csv)["track_0001"]["mbid"] == ""
+
+
+@pytest.mark.asyncio
+async def test_enrichment_resumes_after_interruption(fake_musicbrainz, tmp_path, catalog_csv):
+    """Test that a run stopped by an upstream error resumes without redoing finished batches."""
+    fake_musicbrainz.recordings = [make_recording("mbid-1", "Under Pressure", "Queen", ["GBAAA0000001"])]
+    output = tmp_path / "enriched.csv"
+    
+    service = MusicBrainzService(rate_limit=0.0, cache_dir=str(tmp_path / "cache"), base_url=fake_musicbrainz.url)
+    try:
+        stats = await CatalogEnrichment(service, str(catalog_csv), str(output), match_batch_size=1).run(max_rows=1)
+        assert stats["resolved"] == 1
+        
+        fake_musicbrainz.status = 503
+        with pytest.raises(Exception):
+            await CatalogEnrichment(service, str(catalog_csv), str(output), match_batch_size=1).run()
+        requests = len(fake_musicbrainz.requests)
+        
+        fake_musicbrainz.status = 200
+        stats = await CatalogEnrichment(service, str(catalog_csv), str(output), match_batch_size=1).run()
+    finally:
+        await service.aclose()
+    
+    assert stats["resumed_from"] == 1 and stats["resumed"] == 1
+    # Track 1 wasn't looked up again
+    assert all("Under Pressure" not in params["query"][0] for _, params in fake_musicbrainz.requests[requests:])
+    assert read_catalog(output)["track_0001"]["mbid"] == "mbid-1"
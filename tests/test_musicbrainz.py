@@ -0,0 +1,432 @@
+"""
+Tests for the async MusicBrainz client against a local fake server.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from pathlib import Path
+from app.musicbrainz import MusicBrainzService, MusicBrainzUnavailable, normalize_recording
+from app.cache import MusicBrainzCache
+from app.catalog import MusicCatalog
+from app.resolver import ResolverService
+from tests.conftest import make_recording
+
+
+@pytest.fixture
+def catalog():
+    """Load test catalog."""
+    return MusicCatalog(str(Path(__file__).parent.parent / "data" / "music_catalog.csv"))
+
+
+def make_service(fake, tmp_path, rate_limit=0.0, **kwargs):
+    return MusicBrainzService(rate_limit=rate_limit, cache_dir=str(tmp_path / "cache"), base_url=fake.url, **kwargs)
+
+
+def test_normalize_recording_matches_musicbrainzngs_shape():
+    """Test that JSON web service recordings are converted to the musicbrainzngs shape."""
+    recording = normalize_recording({
+        "id": "mbid-1",
+        "score": 97,
+        "title": "Under Pressure",
+        "length": 248000,
+        "artist-credit": [
+            {"name": "Queen", "joinphrase": " & ", "artist": {"id": "a1", "name": "Queen"}},
+            {"name": "David Bowie", "artist": {"id": "a2", "name": "David Bowie"}}
+        ],
+        "isrcs": ["GBUM71029605"]
+    })
+    
+    assert recording["ext:score"] == "97"
+    assert recording["length"] == "248000"
+    assert recording["artist-credit"][0]["artist"]["name"] == "Queen"
+    assert recording["artist-credit"][1] == " & "
+    assert recording["artist-credit-phrase"] == "Queen & David Bowie"
+    assert recording["isrc-list"] == ["GBUM71029605"]
+
+
+def test_cache_memory_tier_avoids_disk(tmp_path, monkeypatch):
+    """Test that memory hits skip the disk and disk hits are promoted into memory."""
+    cache = MusicBrainzCache(cache_dir=str(tmp_path / "cache"))
+    cache.set("queen::5", {"recordings": [{"id": "mbid-1"}]})
+    assert cache.get("queen::5") == {"recordings": [{"id": "mbid-1"}]}
+    
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: opened.append(args[0]) or real_open(*args, **kwargs))
+    for _ in range(3):
+        cache.get("queen::5")
+    assert opened == []
+    
+    # A fresh cache (e.g. after a restart) reads the file once, then serves from memory
+    restarted = MusicBrainzCache(cache_dir=str(tmp_path / "cache"))
+    restarted.get("queen::5")
+    restarted.get("queen::5")
+    assert len(opened) == 1
+    status = restarted.get_cache_status()
+    assert status["disk"]["hits"] == 1
+    assert status["memory"]["hits"] == 1 and status["memory"]["misses"] == 1
+
+
+def test_cache_memory_tier_limits(tmp_path):
+    """Test that the memory tier evicts by entry count and by serialized bytes."""
+    cache = MusicBrainzCache(cache_dir=str(tmp_path / "cache"), memory_max_entries=2, memory_max_bytes=None)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"recordings": []})
+    assert len(cache.memory) == 2
+    assert cache.get_cache_status()["memory"]["evictions"] == 1
+    
+    cache = MusicBrainzCache(cache_dir=str(tmp_path / "small"), memory_max_entries=100, memory_max_bytes=120)
+    cache.set("a", {"title": "x" * 40})
+    cache.set("b", {"title": "y" * 40})
+    cache.set("c", {"title": "z" * 40})
+    status = cache.get_cache_status()["memory"]
+    assert status["bytes"] <= 120 and status["entries"] == 2
+    # Evicted from memory but still on disk
+    assert cache.get("a") == {"title": "x" * 40}
+
+
+def test_cache_expires_per_type(tmp_path):
+    """Test that query entries expire on their own TTL while MBID entries are kept."""
+    cache = MusicBrainzCache(cache_dir=str(tmp_path / "cache"), ttl_by_type={"query": 60, "mbid": None})
+    cache.set("queen::5", {"recordings": []})
+    cache.set("mbid-1", {"id": "mbid-1"}, cache_type="mbid")
+    
+    # Age both files past the query TTL and read them from disk
+    for path in (tmp_path / "cache").glob("*.json"):
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    cache.memory.clear()
+    
+    assert cache.get("queen::5") is None
+    assert cache.get("mbid-1", cache_type="mbid") == {"id": "mbid-1"}
+    status = cache.get_cache_status()
+    assert status["file_count"] == 1
+    assert status["disk"]["expirations"] == 1
+
+
+def test_cache_evicts_least_recently_used_files(tmp_path):
+    """Test that the disk tier stays under its byte cap by evicting the least recently used files."""
+    cache = MusicBrainzCache(cache_dir=str(tmp_path / "cache"), memory_max_entries=0, disk_max_bytes=160)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"title": key * 40})
+    # Use "a" so "b" is the least recently used
+    assert cache.get("a") is not None
+    cache.set("d", {"title": "d" * 40})
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("d") is not None
+    status = cache.get_cache_status()
+    assert status["size_bytes"] <= 160
+    assert status["size_bytes"] == sum(path.stat().st_size for path in (tmp_path / "cache").glob("*.json"))
+    assert status["disk"]["evictions"] >= 1
+
+
+def test_cache_compaction_reconciles_other_writers(tmp_path):
+    """Test that compaction indexes files written by other workers and drops expired ones."""
+    cache_dir = str(tmp_path / "cache")
+    cache = MusicBrainzCache(cache_dir=cache_dir, ttl_by_type={"query": 60})
+    other = MusicBrainzCache(cache_dir=cache_dir, ttl_by_type={"query": 60})
+    other.set("fresh", {"recordings": []})
+    other.set("stale", {"recordings": []})
+    stale = tmp_path / "cache" / f"{other._get_cache_key('stale')}.json"
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+    assert cache.get_cache_status()["file_count"] == 0
+    
+    summary = cache.compact()
+    assert summary["scanned"] == 2 and summary["expired"] == 1
+    assert cache.get_cache_status()["file_count"] == 1
+    assert not stale.exists()
+
+
+@pytest.mark.asyncio
+async def test_async_search_uses_cache(fake_musicbrainz, tmp_path):
+    """Test that async searches hit the fake server once and then the cache."""
+    service = make_service(fake_musicbrainz, tmp_path)
+    try:
+        recordings = await service.asearch_recording("bohemian rhapsody", limit=1)
+        assert recordings[0]["id"] == "mbid-bohemian"
+        assert recordings[0]["artist-credit"][0]["artist"]["name"] == "Queen"
+        
+        await service.asearch_recording("bohemian rhapsody", limit=1)
+        assert len(fake_musicbrainz.requests) == 1
+        path, params = fake_musicbrainz.requests[0]
+        assert path == "/ws/2/recording"
+        assert params["query"] == ["bohemian rhapsody"] and params["fmt"] == ["json"]
+        
+        recording = await service.aget_recording_by_mbid("mbid-bohemian")
+        assert recording["title"] == "Bohemian Rhapsody"
+        assert await service.aget_recording_by_mbid("missing") is None
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_async_errors_return_empty(fake_musicbrainz, tmp_path):
+    """Test that upstream errors are logged and return no results."""
+    fake_musicbrainz.status = 503
+    service = make_service(fake_musicbrainz, tmp_path)
+    try:
+        assert await service.asearch_recording("anything") == []
+        assert await service.aget_best_match("anything") is None
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_lookups_share_one_request(fake_musicbrainz, tmp_path):
+    """Test that concurrent identical lookups make a single upstream call."""
+    fake_musicbrainz.delay = 0.2
+    service = make_service(fake_musicbrainz, tmp_path)
+    try:
+        results = await asyncio.gather(*(service.asearch_recording("bohemian rhapsody") for _ in range(5)))
+    finally:
+        await service.aclose()
+    
+    assert len(fake_musicbrainz.requests) == 1
+    assert all(recordings[0]["id"] == "mbid-bohemian" for recordings in results)
+    assert service.get_cache_status()["coalesced_requests"] == 4
+
+
+@pytest.mark.asyncio
+async def test_failed_lookup_is_shared_and_remembered(fake_musicbrainz, tmp_path):
+    """Test that waiters share a failure and a retry within the TTL doesn't call upstream again."""
+    fake_musicbrainz.delay = 0.2
+    fake_musicbrainz.status = 503
+    service = make_service(fake_musicbrainz, tmp_path)
+    try:
+        results = await asyncio.gather(*(service.asearch_recording("unknown song") for _ in range(3)))
+        assert results == [[], [], []]
+        assert len(fake_musicbrainz.requests) == 1
+        
+        fake_musicbrainz.status = 200
+        assert await service.asearch_recording("unknown song") == []
+        assert len(fake_musicbrainz.requests) == 1
+        
+        # Clearing the cache forgets the failure
+        service.clear_cache()
+        assert await service.asearch_recording("unknown song") != []
+        assert len(fake_musicbrainz.requests) == 2
+    finally:
+        await service.aclose()
+
+
+def test_threaded_identical_lookups_share_one_call(tmp_path, monkeypatch):
+    """Test that the sync client coalesces identical lookups from several threads."""
+    calls = []
+    
+    def search_recordings(query, limit):
+        calls.append(query)
+        time.sleep(0.2)
+        return {"recording-list": [{"id": "mbid-1", "title": query}]}
+    
+    monkeypatch.setattr("app.musicbrainz.musicbrainzngs.search_recordings", search_recordings)
+    service = MusicBrainzService(rate_limit=0.0, cache_dir=str(tmp_path / "cache"))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: service.search_recording("popular"), range(4)))
+    
+    assert calls == ["popular"]
+    assert all(recordings[0]["id"] == "mbid-1" for recordings in results)
+
+
+@pytest.mark.asyncio
+async def test_no_match_results_are_negatively_cached(fake_musicbrainz, tmp_path):
+    """Test that empty searches and unknown MBIDs are cached instead of refetched."""
+    fake_musicbrainz.recordings = []
+    service = make_service(fake_musicbrainz, tmp_path, negative_cache_ttl=60)
+    try:
+        assert await service.asearch_recording("no such song") == []
+        assert await service.asearch_recording("no such song") == []
+        assert await service.aget_recording_by_mbid("unknown") is None
+        assert await service.aget_recording_by_mbid("unknown") is None
+        assert len(fake_musicbrainz.requests) == 2
+        assert service.get_cache_status()["negative_hits"] == 2
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stale_result_is_served_while_refreshing(fake_musicbrainz, tmp_path):
+    """Test that an expired result is returned at once and refreshed in the background."""
+    service = make_service(fake_musicbrainz, tmp_path, query_cache_ttl=0.2, stale_grace=60)
+    try:
+        first = await service.asearch_recording("bohemian rhapsody")
+        await asyncio.sleep(0.3)
+        
+        # Upstream is now slow and has a new title
+        fake_musicbrainz.delay = 0.5
+        fake_musicbrainz.recordings = [dict(fake_musicbrainz.recordings[0], title="Bohemian Rhapsody (Remastered)")]
+        start = time.monotonic()
+        stale = await service.asearch_recording("bohemian rhapsody")
+        again = await service.asearch_recording("bohemian rhapsody")
+        assert time.monotonic() - start < 0.2
+        assert stale == again == first
+        
+        await asyncio.sleep(0.8)
+        assert len(fake_musicbrainz.requests) == 2
+        assert service.get_cache_status()["background_refreshes"] == 1
+        refreshed = await service.asearch_recording("bohemian rhapsody")
+        assert refreshed[0]["title"] == "Bohemian Rhapsody (Remastered)"
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stale_result_survives_upstream_outage(fake_musicbrainz, tmp_path):
+    """Test that a failed refresh keeps serving the stale result without retrying on every hit."""
+    service = make_service(fake_musicbrainz, tmp_path, query_cache_ttl=0.1, stale_grace=60)
+    try:
+        first = await service.asearch_recording("bohemian rhapsody")
+        await asyncio.sleep(0.2)
+        fake_musicbrainz.status = 503
+        
+        assert await service.asearch_recording("bohemian rhapsody") == first
+        await asyncio.sleep(0.2)
+        for _ in range(3):
+            assert await service.asearch_recording("bohemian rhapsody") == first
+        await asyncio.sleep(0.1)
+        assert len(fake_musicbrainz.requests) == 2
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_batch_lookups_pack_many_rows_per_request(fake_musicbrainz, tmp_path):
+    """Test that batch lookups send combined Lucene queries and pick each row's recording."""
+    fake_musicbrainz.recordings = [
+        make_recording("mbid-1", "Under Pressure", "Queen & David Bowie", ["GBAAA0000001"]),
+        make_recording("mbid-2", "Hotel California", "Eagles", ["USAAA0000002"]),
+        make_recording("mbid-3", "Hotel California", "Gipsy Kings", score=80),
+    ]
+    service = make_service(fake_musicbrainz, tmp_path)
+    try:
+        matches = await service.abatch_match([
+            ("Hotel California", "Eagles"), ("under pressure", "Queen"), ("Unknown", "Nobody")
+        ])
+        assert [m["id"] if m else None for m in matches] == ["mbid-2", "mbid-1", None]
+        assert len(fake_musicbrainz.requests) == 1
+        query = fake_musicbrainz.requests[0][1]["query"][0]
+        assert '(recording:"Hotel California" AND artist:"Eagles") OR' in query
+        
+        by_isrc = await service.abatch_recordings_by_isrc(["usaaa0000002", "GBAAA0000001", "XX0000000000"])
+        assert {isrc: [r["id"] for r in found] for isrc, found in by_isrc.items()} == {
+            "USAAA0000002": ["mbid-2"], "GBAAA0000001": ["mbid-1"]
+        }
+        assert fake_musicbrainz.requests[-1][1]["query"][0].startswith("isrc:(")
+        
+        # Recordings returned by earlier batches are already cached by MBID
+        requests = len(fake_musicbrainz.requests)
+        by_mbid = await service.abatch_recordings_by_mbid(["mbid-1", "mbid-3"])
+        assert set(by_mbid) == {"mbid-1", "mbid-3"}
+        assert await service.aget_recording_by_mbid("mbid-2") is not None
+        assert len(fake_musicbrainz.requests) == requests
+    finally:
+        await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_async_rate_limit_does_not_block_event_loop(fake_musicbrainz, tmp_path):
+    """Test that rate-limited lookups are spaced out while other tasks keep running."""
+    service = make_service(fake_musicbrainz, tmp_path, rate_limit=0.2)
+    ticks = 0
+    
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+    
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        start = time.monotonic()
+        await asyncio.gather(*(service.asearch_recording(f"query {i}") for i in range(3)))
+        elapsed = time.monotonic() - start
+    finally:
+        ticker_task.cancel()
+        await service.aclose()
+    
+    assert len(fake_musicbrainz.requests) == 3
+    assert elapsed >= 0.35
+    # The loop kept running while lookups waited
+    assert ticks >= 20
+
+
+@pytest.mark.asyncio
+async def test_aresolve_falls_back_to_musicbrainz(fake_musicbrainz, tmp_path, catalog):
+    """Test that aresolve awaits the MusicBrainz fallback and matches it to the catalog."""
+    service = make_service(fake_musicbrainz, tmp_path)
+    resolver = ResolverService(musicbrainz_service=service, catalog=catalog)
+    try:
+        result = await resolver.aresolve("zzz unknown phrase")
+    finally:
+        await service.aclose()
+    
+    assert result.source == "musicbrainz"
+    assert result.canonical_id == "track_0001"
+    assert result.musicbrainz_id == "mbid-bohemian"
+
+
+def test_indexed_catalog_match_agrees_with_scan(tmp_path, catalog):
+    """Test that the indexed catalog match picks the same track and confidence as the full scan."""
+    service = MusicBrainzService(rate_limit=0.0, cache_dir=str(tmp_path / "cache"))
+    generation = catalog.load_catalog()
+    tracks, index = generation.tracks, generation.index
+    
+    answers = [(track.title, track.artist) for track in tracks]
+    answers += [
+        ("BOHEMIAN RHAPSODY", "queen"),  # case differs
+        ("Bohemian Rhapsody (Remastered 2011)", "Queen"),  # catalog title inside the answer
+        ("Rhapsody", "Queen + Adam Lambert"),  # answer inside the catalog title, artist partial both ways
+        ("Imagine", "The Beatles"),  # title only
+        ("Unknown Song", "Nobody"),
+        ("a", "e"),  # short lookups
+    ]
+    for title, artist in answers:
+        mb_match = ("mbid-x", title, artist, 0.9)
+        assert service._match_to_catalog(mb_match, tracks, index) == service._match_to_catalog(mb_match, tracks)
+
+
+def test_catalog_match_by_mbid_or_isrc(tmp_path):
+    """Test that catalog rows carrying the recording's MBID or ISRC match whatever MusicBrainz calls them."""
+    from app.index import CatalogIndex
+    from app.models import Track
+    
+    tracks = [
+        Track(buffet_track_id="track_0001", id=1, title="Bohemian Rhapsody", artist="Queen", album="A Night at the Opera",
+              duration=354, genre="Rock", mood="Epic", tags="rock", year=1975, mbid="MBID-BOHEMIAN"),
+        Track(buffet_track_id="track_0002", id=2, title="Imagine (Demo)", artist="Lennon", album="Imagine",
+              duration=183, genre="Pop", mood="Peaceful", tags="pop", year=1971, isrc="gbaym0000001"),
+    ]
+    index = CatalogIndex(tracks)
+    service = MusicBrainzService(rate_limit=0.0, cache_dir=str(tmp_path / "cache"))
+    
+    track, confidence, mbid = service._match_to_catalog(("mbid-bohemian", "Bohemian Rhapsody (Live)", "Queen", 0.5), tracks, index)
+    assert track.buffet_track_id == "track_0001" and mbid == "mbid-bohemian"
+    assert confidence == pytest.approx(0.85)
+    
+    track, _, _ = service._match_to_catalog(("mbid-other", "Something Else", "Someone", 0.9), tracks, index, ["GBAYM0000001"])
+    assert track.buffet_track_id == "track_0002"
+    assert service._match_to_catalog(("mbid-other", "Something Else", "Someone", 0.9), tracks, index) is None
+
+
+@pytest.mark.asyncio
+async def test_failed_fallback_is_not_cached_by_resolver(fake_musicbrainz, tmp_path, catalog):
+    """Test that an answer degraded by a MusicBrainz outage isn't cached past the outage."""
+    fake_musicbrainz.status = 503
+    service = make_service(fake_musicbrainz, tmp_path, failure_ttl=0.05)
+    resolver = ResolverService(musicbrainz_service=service, catalog=catalog)
+    try:
+        with pytest.raises(MusicBrainzUnavailable):
+            await service.asearch_recording("zzz unknown phrase", raise_on_error=True)
+        degraded = await resolver.aresolve("zzz unknown phrase")
+        assert degraded.source != "musicbrainz"
+        
+        fake_musicbrainz.status = 200
+        await asyncio.sleep(0.1)
+        recovered = await resolver.aresolve("zzz unknown phrase")
+    finally:
+        await service.aclose()
+    
+    assert recovered.source == "musicbrainz"
+    assert recovered.canonical_id == "track_0001"
@@ -0,0 +1,100 @@
+"""
+Tests for the shared token-bucket rate limiter.
+"""
+
+import threading
+import pytest
+from app.ratelimit import TokenBucket, RateLimitTimeout
+
+
+def test_burst_then_spaced_slots():
+    """Test that a full bucket allows a burst and then hands out evenly spaced slots."""
+    bucket = TokenBucket(rate=10.0, burst=3)
+    
+    waits = [bucket.reserve() for _ in range(6)]
+    
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    # Queued callers get consecutive slots 0.1s apart
+    for expected, wait in zip((0.1, 0.2, 0.3), waits[3:]):
+        assert wait == pytest.approx(expected, abs=0.02)
+
+
+def test_deadline_does_not_take_a_slot():
+    """Test that a caller past its deadline gets RateLimitTimeout without consuming a slot."""
+    bucket = TokenBucket(rate=5.0, burst=1)
+    bucket.reserve()
+    
+    with pytest.raises(RateLimitTimeout) as exc_info:
+        bucket.reserve(timeout=0.05)
+    assert exc_info.value.wait == pytest.approx(0.2, abs=0.02)
+    
+    # The next caller still gets the first queued slot
+    assert bucket.reserve(timeout=1.0) == pytest.approx(0.2, abs=0.02)
+    
+    status = bucket.get_status()
+    assert status["acquired"] == 2
+    assert status["timeouts"] == 1
+    assert status["max_wait_seconds"] == pytest.approx(0.2, abs=0.02)
+
+
+def test_state_file_shares_budget_across_instances(tmp_path):
+    """Test that limiters using the same state file (e.g. two workers) share one budget."""
+    state_path = str(tmp_path / "mb.ratelimit")
+    worker_a = TokenBucket(rate=10.0, burst=1, state_path=state_path)
+    worker_b = TokenBucket(rate=10.0, burst=1, state_path=state_path)
+    assert worker_a.get_status()["shared"] is True
+    
+    waits = []
+    lock = threading.Lock()
+    
+    def reserve(bucket):
+        wait = bucket.reserve()
+        with lock:
+            waits.append(wait)
+    
+    threads = [threading.Thread(target=reserve, args=(bucket,)) for bucket in (worker_a, worker_b) * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    # Eight callers across both instances got eight distinct slots, 0.1s apart
+    for slot, wait in enumerate(sorted(waits)):
+        assert wait == pytest.approx(slot * 0.1, abs=0.03)
+
+
+def test_zero_rate_disables_limiting():
+    """Test that a rate of 0 never waits."""
+    bucket = TokenBucket(rate=0.0)
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+
+
+@pytest.mark.asyncio
+async def test_async_acquire_keeps_loop_running_while_state_file_is_locked(tmp_path):
+    """Test that aacquire waits for another process's file lock off the event loop."""
+    import asyncio
+    import fcntl
+    import os
+    
+    state_path = str(tmp_path / "mb.ratelimit")
+    bucket = TokenBucket(rate=10.0, burst=1, state_path=state_path)
+    
+    # Another worker holds the state file lock for 0.2s
+    fd = os.open(state_path, os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    release = threading.Timer(0.2, lambda: (fcntl.flock(fd, fcntl.LOCK_UN), os.close(fd)))
+    release.start()
+    
+    ticks = 0
+    
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+    
+    task = asyncio.create_task(ticker())
+    assert await bucket.aacquire() == 0.0
+    task.cancel()
+    release.join()
+    assert ticks >= 10
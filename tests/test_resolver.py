@@ -2,8 +2,10 @@
 Tests for resolver pipeline.
 """
 
+import asyncio
+import time
 import pytest
-from unittest.mock import Mock, MagicMock
+from unittest.mock import Mock, MagicMock, AsyncMock
 from app.resolver import ResolverService
 from app.models import Track, ClearanceStatus
 
@@ -124,3 +126,188 @@ def test_backwards_compatibility_fields(sample_tracks):
     if result.best_match:
         assert result.canonical_id == result.best_match.buffet_track_id
         assert result.matched_track == result.best_match
+
+
+@pytest.mark.parametrize("query", ["bohemian rapsody", "Bohemain Rhapsody", "bohemian rhapsody quen"])
+def test_misspelled_query_matches_internally(sample_tracks, query):
+    """Test that typos (e.g. from speech recognition) resolve through the trigram index."""
+    mock_mb = Mock()
+    resolver = ResolverService(catalog_tracks=sample_tracks, musicbrainz_service=mock_mb)
+    
+    result = resolver.resolve(query)
+    
+    assert result.best_match.buffet_track_id == "track_0001"
+    assert result.source == "internal"
+    assert result.confidence >= ResolverService.MEDIUM_CONFIDENCE
+    mock_mb.match_to_catalog.assert_not_called()
+
+
+def test_fuzzy_index_ranks_by_edit_similarity(sample_tracks):
+    """Test that fuzzy candidates are ranked by similarity and unrelated strings are left out."""
+    from app.index import CatalogIndex
+    
+    index = CatalogIndex(sample_tracks)
+    
+    assert index.fuzzy_match("imagin john lenon")[0][0] == 1
+    assert index.fuzzy_match("jon lennon")[0][0] == 1
+    assert index.fuzzy_match("xyz123") == []
+
+
+@pytest.mark.asyncio
+async def test_batch_resolve_dedupes_and_keeps_order(sample_tracks):
+    """Test that a batch resolves duplicates once and only sends low-confidence queries to MusicBrainz."""
+    async def amatch_to_catalog(query, tracks, **kwargs):
+        return (tracks[1], 0.9, "mbid-imagine")
+    
+    mock_mb = Mock()
+    mock_mb.amatch_to_catalog = AsyncMock(side_effect=amatch_to_catalog)
+    resolver = ResolverService(catalog_tracks=sample_tracks, musicbrainz_service=mock_mb)
+    
+    queries = ["Bohemian Rhapsody", "obscure cue xyz", "bohemian rhapsody!", "Obscure  cue XYZ"]
+    response = await resolver.aresolve_batch(queries)
+    
+    assert [r.query for r in response.results] == queries
+    assert [r.source for r in response.results] == ["internal", "musicbrainz", "internal", "musicbrainz"]
+    assert response.results[1].musicbrainz_id == "mbid-imagine"
+    assert response.unique_queries == 2
+    assert response.external_lookups == 1
+    mock_mb.amatch_to_catalog.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_batch_resolve_streams_internal_matches_first(sample_tracks):
+    """Test that streamed items come out as they finish, confident internal matches before fallbacks."""
+    async def amatch_to_catalog(query, tracks, **kwargs):
+        await asyncio.sleep(0.05)
+        return None
+    
+    mock_mb = Mock()
+    mock_mb.amatch_to_catalog = AsyncMock(side_effect=amatch_to_catalog)
+    resolver = ResolverService(catalog_tracks=sample_tracks, musicbrainz_service=mock_mb)
+    
+    items = [item async for item in resolver.aiter_resolve_batch(["obscure cue xyz", "Imagine"])]
+    
+    assert [item.index for item in items] == [1, 0]
+    assert items[0].result.best_match.title == "Imagine"
+    assert items[1].result.source == "none"
+
+
+
+@pytest.mark.asyncio
+async def test_batch_resolve_keeps_event_loop_responsive(sample_tracks, monkeypatch):
+    """Test that the internal pass of a large batch runs off the event loop."""
+    resolver = ResolverService(catalog_tracks=sample_tracks)
+    internal_match = resolver._internal_match
+    
+    def slow_internal_match(*args, **kwargs):
+        time.sleep(0.005)
+        return internal_match(*args, **kwargs)
+    
+    monkeypatch.setattr(resolver, "_internal_match", slow_internal_match)
+    ticks = 0
+    
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+    
+    task = asyncio.create_task(ticker())
+    response = await resolver.aresolve_batch([f"imagine {i}" for i in range(64)])
+    task.cancel()
+    
+    assert len(response.results) == 64
+    # The batch took ~0.3s of matching; the loop kept running meanwhile
+    assert ticks >= 20
+
+def test_resolve_cache_reuses_answers_until_catalog_changes(sample_tracks):
+    """Test that repeated queries are served from the cache, and a new catalog generation invalidates it."""
+    from app.index import CatalogIndex
+    
+    mock_mb = Mock()
+    mock_mb.match_to_catalog = Mock(return_value=(sample_tracks[1], 0.9, "mbid-imagine"))
+    resolver = ResolverService(catalog_tracks=sample_tracks, musicbrainz_service=mock_mb)
+    
+    first = resolver.resolve("obscure cue xyz")
+    again = resolver.resolve("Obscure cue, XYZ!")
+    
+    assert again.source == "musicbrainz" and again.musicbrainz_id == "mbid-imagine"
+    assert again.query == "Obscure cue, XYZ!" and first.query == "obscure cue xyz"
+    assert mock_mb.match_to_catalog.call_count == 1
+    status = resolver.cache.get_cache_status()
+    assert status["hits"] == 1 and status["hits_by_source"] == {"musicbrainz": 1}
+    
+    # A reload builds a new index generation
+    resolver.catalog_index = CatalogIndex(sample_tracks)
+    resolver.resolve("obscure cue xyz")
+    assert mock_mb.match_to_catalog.call_count == 2
+    assert resolver.cache.get_cache_status()["invalidations"] == 1
+
+
+def test_resolve_cache_ignores_older_generation_after_reload(sample_tracks):
+    """Test that a late store for a replaced index neither evicts nor pollutes current answers."""
+    from app.index import CatalogIndex
+    
+    resolver = ResolverService(catalog_tracks=sample_tracks)
+    old_index = resolver.catalog_index
+    answer = resolver.resolve("Imagine")
+    
+    # A reload, then a background task that captured the old index finishes
+    resolver.catalog_index = CatalogIndex(sample_tracks)
+    current = resolver.resolve("Imagine")
+    resolver.cache.set(old_index, "Bohemian Rhapsody", answer)
+    assert resolver.cache.get(old_index, "Imagine") is None
+    
+    assert resolver.cache.get(resolver.catalog_index, "Imagine") == current
+    assert resolver.cache.get(resolver.catalog_index, "Bohemian Rhapsody") is None
+    status = resolver.cache.get_cache_status()
+    assert status["invalidations"] == 1 and status["entries"] == 1
+
+
+def test_resolve_cache_uses_ttl_per_source(sample_tracks):
+    """Test that internal and MusicBrainz answers expire on their own TTLs."""
+    resolver = ResolverService(catalog_tracks=sample_tracks, cache_internal_ttl=0.01, cache_musicbrainz_ttl=60)
+    
+    resolver.resolve("Imagine")
+    assert resolver.cache.get(resolver.catalog_index, "imagine") is not None
+    time.sleep(0.02)
+    assert resolver.cache.get(resolver.catalog_index, "imagine") is None
+
+
+@pytest.mark.asyncio
+async def test_budgeted_resolve_returns_early_and_upgrades_in_background(sample_tracks):
+    """Test that a slow MusicBrainz lookup doesn't hold up a budgeted resolve, and its answer serves the next one."""
+    async def amatch_to_catalog(query, tracks, **kwargs):
+        await asyncio.sleep(0.2)
+        return (tracks[1], 0.9, "mbid-imagine")
+    
+    mock_mb = Mock()
+    mock_mb.amatch_to_catalog = AsyncMock(side_effect=amatch_to_catalog)
+    resolver = ResolverService(catalog_tracks=sample_tracks, musicbrainz_service=mock_mb)
+    
+    started = time.perf_counter()
+    first = await resolver.aresolve_within("obscure cue xyz", budget=0.05)
+    assert time.perf_counter() - started < 0.15
+    assert first.upgrade_pending
+    assert first.source == "none"
+    assert resolver.get_budget_status()["speculative_lookups"] == 1
+    
+    await asyncio.sleep(0.25)
+    second = await resolver.aresolve_within("obscure cue xyz", budget=0.05)
+    assert second.source == "musicbrainz" and not second.upgrade_pending
+    assert mock_mb.amatch_to_catalog.await_count == 1
+    assert resolver.get_budget_status()["background_upgrades"] == 1
+
+
+@pytest.mark.asyncio
+async def test_budgeted_resolve_skips_musicbrainz_for_catalog_words(sample_tracks):
+    """Test that queries made of catalog words are not sent to MusicBrainz speculatively."""
+    mock_mb = Mock()
+    mock_mb.amatch_to_catalog = AsyncMock(return_value=None)
+    resolver = ResolverService(catalog_tracks=sample_tracks, musicbrainz_service=mock_mb)
+    
+    result = await resolver.aresolve_within("Imagine John Lennon", budget=0.3)
+    
+    assert result.best_match.title == "Imagine" and not result.upgrade_pending
+    mock_mb.amatch_to_catalog.assert_not_called()
+    await resolver.aclose()
@@ -175,3 +175,169 @@ def test_tokenize():
     
     tokens = SearchRanker.tokenize("Rock and Roll")
     assert tokens == {"rock", "and", "roll"}
+
+
+def test_search_with_prebuilt_index(sample_tracks):
+    """Test that searching a prebuilt index matches searching the raw track list."""
+    from app.index import CatalogIndex
+    
+    index = CatalogIndex(sample_tracks)
+    request = SearchRequest(query="classic rock", tags=["classic"], limit=10)
+    
+    indexed = SearchRanker.search_tracks(sample_tracks, request, index=index)
+    unindexed = SearchRanker.search_tracks(sample_tracks, request)
+    
+    assert [(r.track.buffet_track_id, r.score) for r in indexed] == \
+        [(r.track.buffet_track_id, r.score) for r in unindexed]
+    
+    # Per-track scoring API still agrees with the indexed path
+    for result in indexed:
+        assert SearchRanker.calculate_score(result.track, request) == result.score
+
+
+@pytest.mark.parametrize("query", [
+    "rock", "Bohemian Rhapsody", "queen", "rhap", "ia", "197", "1971", "classic rock",
+    "epic", "pe", "!!", "", "zzz", "led zeppelin iv", "Imagine"
+])
+def test_candidate_pruning_matches_linear_scan(sample_tracks, query):
+    """Test that inverted-index pruning returns the same results as scoring every track."""
+    request = SearchRequest(query=query, limit=10)
+    
+    expected = [
+        (track.buffet_track_id, SearchRanker.calculate_score(track, request))
+        for track in sample_tracks
+        if SearchRanker.passes_filters(track, request)
+    ]
+    expected = [item for item in expected if item[1] > 0]
+    expected.sort(key=lambda item: item[1], reverse=True)
+    
+    results = SearchRanker.search_tracks(sample_tracks, request)
+    
+    assert [(r.track.buffet_track_id, r.score) for r in results] == expected[:10]
+
+
+def test_facet_bitsets(sample_tracks):
+    """Test that facet filters resolve to the expected bitsets."""
+    from app.index import CatalogIndex, bitset_to_ids
+    
+    index = CatalogIndex(sample_tracks)
+    
+    assert bitset_to_ids(index.facets.filter(moods=frozenset({"epic"}))) == [0, 2]
+    assert bitset_to_ids(index.facets.filter(tags=frozenset({"peaceful", "progressive"}))) == [1, 2]
+    assert bitset_to_ids(index.facets.filter(genres=frozenset({"rock"}), stems_required=True)) == [2]
+    assert bitset_to_ids(index.facets.filter(clearance_required=True)) == [2]
+    assert index.facets.filter() is None
+    
+    # Repeated filter combinations are served from the memo
+    assert index.facets.filter(moods=frozenset({"epic"})) == index.facets.filter(moods=frozenset({"epic"}))
+
+
+def test_facet_and_text_filters_combined(sample_tracks):
+    """Test a cleared + stems + mood search through the facet engine."""
+    request = SearchRequest(
+        query="stairway",
+        moods=["Epic"],
+        stems_required=True,
+        clearance_required=True,
+        limit=10
+    )
+    results = SearchRanker.search_tracks(sample_tracks, request)
+    
+    assert [r.track.buffet_track_id for r in results] == ["track_0003"]
+
+
+def test_range_index(sample_tracks):
+    """Test energy/valence range lookups over the sorted columns."""
+    from app.index import CatalogIndex
+    
+    no_energy = Track(
+        buffet_track_id="track_0004",
+        title="Untitled",
+        artist="Unknown",
+        album="Unknown",
+        duration=100,
+        genre="Ambient",
+        mood="Calm",
+        tags="ambient",
+        year=2020
+    )
+    index = CatalogIndex(sample_tracks + [no_energy])
+    
+    assert sorted(index.energy.ids_in_range(0.3, 0.7)) == [1, 2]
+    assert sorted(index.energy.ids_in_range(low=0.75)) == [0]
+    assert sorted(index.valence.ids_in_range(high=0.6)) == [0, 2]
+    assert index.energy.ids_in_range(0.9, 0.1) == []
+    
+    # Tracks without energy data are excluded whenever a range is requested
+    assert 3 not in index.energy.ids_in_range()
+    request = SearchRequest(query="ambient", min_energy=0.0, limit=10)
+    assert SearchRanker.search_tracks(index.tracks, request, index=index) == []
+
+
+def test_numpy_backend_parity():
+    """Test that the numpy backend returns exactly the python backend's scores."""
+    pytest.importorskip("numpy")
+    from pathlib import Path
+    from app.catalog import MusicCatalog
+    from app.index import CatalogIndex
+    
+    catalog_path = Path(__file__).parent.parent / "data" / "music_catalog.csv"
+    tracks = MusicCatalog(str(catalog_path)).get_all_tracks()
+    python_index = CatalogIndex(tracks, backend="python")
+    numpy_index = CatalogIndex(tracks, backend="numpy")
+    assert numpy_index.columns is not None
+    
+    requests = [
+        SearchRequest(query="rock", limit=100),
+        SearchRequest(query="classic rock guitar", limit=5),
+        SearchRequest(query="queen", limit=3),
+        SearchRequest(query="197", limit=100),
+        SearchRequest(query="ia", limit=100),
+        SearchRequest(query="", limit=100),
+        SearchRequest(query="love", moods=["Peaceful", "Epic"], tags=["classic"], limit=100),
+        SearchRequest(query="pop", genres=["Pop"], stems_required=True, limit=100),
+        SearchRequest(query="dance", clearance_required=True, limit=100),
+        SearchRequest(query="nothing matches this", limit=10),
+    ]
+    
+    for request in requests:
+        expected = SearchRanker.search_tracks(tracks, request, index=python_index)
+        actual = SearchRanker.search_tracks(tracks, request, index=numpy_index)
+        assert [(r.track.buffet_track_id, r.score) for r in actual] == \
+            [(r.track.buffet_track_id, r.score) for r in expected], request.query
+
+
+def test_top_k_ties_keep_catalog_order(sample_tracks):
+    """Test that bounded top-k selection breaks score ties deterministically."""
+    request = SearchRequest(query="classic", limit=2)
+    
+    results = SearchRanker.search_tracks(sample_tracks, request)
+    reversed_results = SearchRanker.search_tracks(list(reversed(sample_tracks)), request)
+    
+    # All three tracks tie on the "classic" tag; the earliest catalog entries win
+    assert [r.track.buffet_track_id for r in results] == ["track_0001", "track_0002"]
+    assert [r.track.buffet_track_id for r in reversed_results] == ["track_0003", "track_0002"]
+
+
+def test_search_result_cache(sample_tracks):
+    """Test that equivalent requests share cached results and reindexing invalidates them."""
+    from app.index import CatalogIndex
+    from app.search import SearchResultCache
+    
+    index = CatalogIndex(sample_tracks)
+    cache = SearchResultCache(maxsize=16, ttl=60)
+    
+    first = SearchRanker.search_tracks(sample_tracks, SearchRequest(query="Rock!", moods=["epic", "Epic "]), index=index, cache=cache)
+    second = SearchRanker.search_tracks(sample_tracks, SearchRequest(query="rock", moods=["EPIC"]), index=index, cache=cache)
+    
+    assert [(r.track.buffet_track_id, r.score) for r in first] == [(r.track.buffet_track_id, r.score) for r in second]
+    assert cache.get_cache_status()["hits"] == 1
+    assert cache.get_cache_status()["misses"] == 1
+    
+    # Year matching uses the raw query, so these must not share an entry
+    assert SearchResultCache.canonical_key(SearchRequest(query="1975")) != \
+        SearchResultCache.canonical_key(SearchRequest(query="1975 "))
+    
+    # A rebuilt index is a new generation and never sees stale entries
+    SearchRanker.search_tracks(sample_tracks, SearchRequest(query="rock"), index=CatalogIndex(sample_tracks), cache=cache)
+    assert cache.get_cache_status()["misses"] == 2